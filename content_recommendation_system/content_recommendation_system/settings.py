@@ -84,6 +84,29 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# 'shared' is a file-based stand-in for a cache shared by all worker processes (e.g. Redis or
+# Memcached in production); view responses use it when config.RESPONSE_CACHE_SHARED = 'shared'.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR.parent / 'data' / 'response_cache',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+
+# Load the recommendation resources at startup instead of on the first request (see
+# RecommendationsConfig.ready). wsgi.py and asgi.py turn it on; management commands leave it off.
+RECOMMENDATIONS_WARM_UP = os.environ.get('RECOMMENDATIONS_WARM_UP') == '1'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -12,5 +12,6 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'content_recommendation_system.settings')
+os.environ.setdefault('RECOMMENDATIONS_WARM_UP', '1')
 
 application = get_wsgi_application()
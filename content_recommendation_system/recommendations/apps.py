@@ -1,6 +1,25 @@
+import os
+import sys
+import threading
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class RecommendationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recommendations'
+
+    def ready(self) -> None:
+        """
+        Start loading the engine resources in the background when the process is going to serve
+        requests (RECOMMENDATIONS_WARM_UP), so the first requests don't pay for the load.
+        Requests arriving earlier wait for this load instead of starting another one.
+        """
+        if not settings.RECOMMENDATIONS_WARM_UP:
+            return
+        # runserver's autoreloader runs a watcher process too; only the serving child warms up
+        if 'runserver' in sys.argv and '--noreload' not in sys.argv and os.environ.get('RUN_MAIN') != 'true':
+            return
+
+        from engine import warm_up
+        threading.Thread(target=warm_up, name='recommendations-warm-up', daemon=True).start()
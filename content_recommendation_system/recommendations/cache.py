@@ -0,0 +1,84 @@
+import hashlib
+import json
+from typing import Any, Callable
+from django.core.cache import caches
+from lru import LRUCache
+from engine import catalog_version
+from config import RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_SHARED
+
+_MISSING = object()
+
+# Per-process first level; the optional shared Django cache is the second level
+_local = LRUCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+_local_version = None
+
+
+def cache_key(view: str, parts: Any, version: str) -> str:
+    """
+    Build the cache key of a view result.
+
+    Args:
+        view (str): View name.
+        parts (Any): JSON-serializable normalized request arguments.
+        version (str): Catalog version the result was computed from.
+
+    Returns:
+        str: Short key, safe for every Django cache backend.
+    """
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:32]
+    return f"recommendations:{version}:{view}:{digest}"
+
+
+def cached(view: str, parts: Any, compute: Callable[[], Any]) -> Any:
+    """
+    Return the cached result of a view computation, computing and storing it on a miss.
+
+    Keys include the catalog version, so results computed from older artifacts are never served
+    after a rebuild or catalog update; the local entries are dropped as soon as the version changes.
+    Cached values are shared between requests and must not be modified.
+
+    Args:
+        view (str): View name.
+        parts (Any): JSON-serializable normalized request arguments.
+        compute (Callable): Produces the (picklable) result on a miss.
+
+    Returns:
+        Any: The cached or freshly computed result.
+    """
+    global _local_version
+    version = catalog_version()
+    if version != _local_version:
+        _local.clear()
+        _local_version = version
+
+    key = cache_key(view, parts, version)
+    value = _local.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    shared = caches[RESPONSE_CACHE_SHARED] if RESPONSE_CACHE_SHARED else None
+    if shared is not None:
+        value = shared.get(key, _MISSING)
+        if value is not _MISSING:
+            _local.set(key, value)
+            return value
+
+    value = compute()
+    _local.set(key, value)
+    if shared is not None:
+        shared.set(key, value, RESPONSE_CACHE_TTL)
+    return value
+
+
+def stats() -> dict:
+    """
+    Return the hit, miss and eviction counters of the per-process cache.
+    """
+    return _local.stats()
+
+
+def clear() -> None:
+    """
+    Drop every entry of the per-process cache (the shared cache is left alone).
+    """
+    _local.clear()
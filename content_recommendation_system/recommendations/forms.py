@@ -1,4 +1,21 @@
 from django import forms
 
 class MovieSearchForm(forms.Form):
-    title = forms.CharField(label='Movie Title', max_length=100)
\ No newline at end of file
+    title = forms.CharField(label='Movie Title', max_length=100)
+
+
+class FacetFilterForm(forms.Form):
+    genre = forms.CharField(label='Genre', max_length=50, required=False)
+    director = forms.CharField(label='Director', max_length=100, required=False)
+    year_from = forms.IntegerField(label='From year', min_value=1800, max_value=2100, required=False)
+    year_to = forms.IntegerField(label='To year', min_value=1800, max_value=2100, required=False)
+
+    def filters(self):
+        """
+        Returns the valid filters as engine filter arguments (empty when none is set). Invalid fields are
+        left out; their messages stay in self.errors.
+        """
+        self.is_valid()
+        filters = {'genres': self.cleaned_data.get('genre'), 'director': self.cleaned_data.get('director'),
+                   'year_from': self.cleaned_data.get('year_from'), 'year_to': self.cleaned_data.get('year_to')}
+        return {key: value for key, value in filters.items() if value not in (None, '')}
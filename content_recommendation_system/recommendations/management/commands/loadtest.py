@@ -0,0 +1,116 @@
+import asyncio
+import random
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from engine import clear_caches, load_resources
+from recommendations import cache
+from recommendations.offload import offloader
+
+VIEWS = {'recommend': 'recommend/', 'matches': 'matches/', 'top': 'top/'}
+
+
+class Command(BaseCommand):
+    help = ("Compare the sync views with their async (offloaded) versions under concurrent load: "
+            "in process through the Django test clients, or over HTTP against running servers.")
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--view', choices=sorted(VIEWS), default='recommend')
+        parser.add_argument('--requests', type=int, default=500, help="Requests per run.")
+        parser.add_argument('--concurrency', type=int, default=32, help="Requests in flight at once.")
+        parser.add_argument('--distinct', type=int, default=50,
+                            help="Distinct titles requested; fewer means more identical concurrent requests.")
+        parser.add_argument('--warm', action='store_true', help="Keep the result caches between runs.")
+        parser.add_argument('--sync-url', help="Base URL of a WSGI server, e.g. http://127.0.0.1:8000/")
+        parser.add_argument('--async-url', help="Base URL of an ASGI server, e.g. http://127.0.0.1:8001/")
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self, *args, **options) -> None:
+        metadata = load_resources()['metadata']
+        random.seed(0)
+        titles = random.sample(list(metadata['title'].dropna().unique()), options['distinct'])
+        paths = [self._path(options['view'], random.choice(titles)) for _ in range(options['requests'])]
+
+        runs = {
+            'sync': (options['sync_url'], ''),
+            'async': (options['async_url'], 'async/'),
+        }
+        for name, (base_url, prefix) in runs.items():
+            if not options['warm']:
+                clear_caches()
+                cache.clear()
+            urls = [prefix + path for path in paths]
+            if base_url:
+                latencies, statuses, elapsed = self._run_http(base_url.rstrip('/') + '/', urls,
+                                                              options['concurrency'])
+            elif name == 'sync':
+                latencies, statuses, elapsed = self._run_sync(urls, options['concurrency'])
+            else:
+                latencies, statuses, elapsed = asyncio.run(self._run_async(urls, options['concurrency']))
+            self._report(name, latencies, statuses, elapsed)
+
+        self.stdout.write(f"Offloader: {offloader.stats()}")
+
+    @staticmethod
+    def _path(view: str, title: str) -> str:
+        query = {'format': 'json'} if view == 'top' else {'title': title, 'format': 'json'}
+        return f"{VIEWS[view]}?{urlencode(query)}"
+
+    @staticmethod
+    def _run_sync(urls, concurrency):
+        client = Client()
+
+        def fetch(url):
+            start = time.perf_counter()
+            response = client.get('/' + url)
+            return time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(fetch, urls))
+        return [r[0] for r in results], [r[1] for r in results], time.perf_counter() - start
+
+    @staticmethod
+    async def _run_async(urls, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(url):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get('/' + url)
+                return time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(fetch(url) for url in urls))
+        return [r[0] for r in results], [r[1] for r in results], time.perf_counter() - start
+
+    @staticmethod
+    def _run_http(base_url, urls, concurrency):
+        def fetch(url):
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base_url + url, timeout=30) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as error:
+                status = error.code
+            return time.perf_counter() - start, status
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(fetch, urls))
+        return [r[0] for r in results], [r[1] for r in results], time.perf_counter() - start
+
+    def _report(self, name, latencies, statuses, elapsed) -> None:
+        latencies_ms = np.array(latencies) * 1000
+        ok = sum(status == 200 for status in statuses)
+        self.stdout.write(
+            f"{name:>5}: {len(statuses) / elapsed:7.1f} req/s, p50 {np.percentile(latencies_ms, 50):7.1f} ms, "
+            f"p95 {np.percentile(latencies_ms, 95):7.1f} ms, {ok} ok, "
+            f"{statuses.count(503)} shed (503), {len(statuses) - ok - statuses.count(503)} errors")
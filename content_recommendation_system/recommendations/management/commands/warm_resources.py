@@ -0,0 +1,18 @@
+import time
+from django.core.management.base import BaseCommand
+from build_graph import stale_stages
+from engine import load_resources
+
+
+class Command(BaseCommand):
+    help = "Rebuild stale artifacts and load the recommendation resources once, e.g. before starting the servers."
+
+    def handle(self, *args, **options) -> None:
+        stale = stale_stages()
+        self.stdout.write(f"Stale stages: {', '.join(stale) if stale else 'none'}")
+
+        start = time.perf_counter()
+        resources = load_resources()
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {len(resources['metadata'])} movies (catalog version {resources['version']}) "
+            f"in {time.perf_counter() - start:.2f}s."))
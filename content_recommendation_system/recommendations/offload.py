@@ -0,0 +1,81 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Hashable
+from config import ASYNC_WORKERS, ASYNC_MAX_PENDING
+
+
+class Overloaded(Exception):
+    """
+    Raised when the offload queue is full; views answer 503 so clients back off.
+    """
+
+
+class Offloader:
+    """
+    Run blocking engine calls from async views on a bounded thread pool.
+
+    At most max_pending distinct calls are queued or running; further calls are rejected with
+    Overloaded instead of piling up. Calls with the same key while one is in flight are coalesced:
+    they await the running call instead of submitting their own. Threads (rather than processes)
+    share the loaded resources; pandas, NumPy and RapidFuzz release the GIL for much of their work.
+
+    Args:
+        max_workers (int): Threads running engine calls.
+        max_pending (int): Queued plus running calls accepted before rejecting.
+    """
+
+    def __init__(self, max_workers: int = ASYNC_WORKERS, max_pending: int = ASYNC_MAX_PENDING):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='recommendations')
+        self._inflight: dict = {}
+        self._lock = threading.Lock()
+        self.submitted = self.coalesced = self.rejected = 0
+
+    def _submit(self, key: Hashable, func: Callable[[], Any]) -> Future:
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            if len(self._inflight) >= self.max_pending:
+                self.rejected += 1
+                raise Overloaded()
+            future = self._executor.submit(func)
+            self._inflight[key] = future
+            self.submitted += 1
+        future.add_done_callback(lambda _: self._finish(key, future))
+        return future
+
+    def _finish(self, key: Hashable, future: Future) -> None:
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def run(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        Run func on the pool, or join the in-flight call with the same key.
+
+        Args:
+            key (Hashable): Identifies equivalent calls (e.g. view name and normalized arguments).
+            func (Callable): Blocking call without arguments.
+
+        Returns:
+            Any: func's result (shared by every coalesced caller, so it must not be modified). Cancelling
+                 one caller (e.g. on client disconnect) leaves the shared call running for the others.
+
+        Raises:
+            Overloaded: When max_pending calls are already queued or running.
+        """
+        return await asyncio.shield(asyncio.wrap_future(self._submit(key, func)))
+
+    def stats(self) -> dict:
+        """
+        Return the in-flight, submitted, coalesced and rejected call counts.
+        """
+        with self._lock:
+            return {'in_flight': len(self._inflight), 'submitted': self.submitted,
+                    'coalesced': self.coalesced, 'rejected': self.rejected}
+
+
+offloader = Offloader()
@@ -1,3 +1,1120 @@
-from django.test import TestCase
+import asyncio
+import copy
+import functools
+import http.client
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+from unittest import mock
+from django.test import SimpleTestCase
+from fuzzywuzzy import process
+import rapidfuzz
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+from data_cleaning import clean_features, clean_features_literal_eval
+from title_index import PrefixIndex, TitleSearchIndex, normalize_title, query_key
+from indexes import DotProductIndex, LSHIndex
+from facets import FacetIndex
+from lru import LRUCache, memoize
+from resource_manager import ResourceManager
+from vectorization import FeatureWeighting, HashedVocabulary, build_feature_matrix
+from data_preprocessing import clean_feature_columns, load_and_merge_metadata
+from ingestion import stream_ingest
+from embeddings import build_embeddings
+from recommender import (build_display_frame, build_id_positions, fuzzy_search, get_top_movies,
+                         get_unique_neighbors)
+from neighbor_table import build_neighbor_table, get_or_build_neighbor_table
+from catalog import append_delta_log, apply_catalog_update, prepare_movies, read_delta_log, replay_delta_log
+from utils import file_lock, load_array, load_csr_matrix, load_vocabulary, read_version, save_csr_matrix
+from metadata_cache import load_metadata_cache, save_metadata_cache, source_fingerprint
+import build_graph
+import engine
+import server
+from config import LSH_PARAMS, NEIGHBOR_TABLE_K
+from .forms import FacetFilterForm
+from .offload import Offloader, Overloaded
+from . import views
 
-# Create your tests here.
+
+class CleanFeaturesParityTests(SimpleTestCase):
+    """
+    The regex-based clean_features must produce exactly what the literal_eval reference does.
+    """
+
+    def setUp(self):
+        self.metadata = pd.DataFrame({
+            'id': [1, 2, 3, 4, 5, 6, 7, 8],
+            'cast': [
+                "[{'cast_id': 1, 'character': 'Woody (voice)', 'name': 'Tom Hanks', 'order': 0}, "
+                "{'cast_id': 2, 'character': 'Buzz', 'name': 'Tim Allen', 'order': 1}, "
+                "{'cast_id': 3, 'character': 'Mr. Potato Head', 'name': 'Don Rickles', 'order': 2}, "
+                "{'cast_id': 4, 'character': 'Slinky', 'name': 'Jim Varney', 'order': 3}]",
+                "[{'cast_id': 1, 'character': 'Host', 'name': \"Conan O'Brien\", 'order': 0}, "
+                "{'cast_id': 2, 'character': 'X', 'name': None, 'order': 1}]",
+                "[{'cast_id': 1, 'character': 'Y', 'name': 'Zoë \\'Z\\' \"Q\"', 'order': 0}]",
+                np.nan,
+                "[{'cast_id': 1, 'name': 'Truncated'",
+                "[{'id': 1, 'name': 'Tom Hanks'}, {'id': 2, 'name': ]",
+                "[]",
+                "[]",
+            ],
+            'crew': [
+                "[{'credit_id': 'a', 'department': 'Writing', 'id': 1, 'job': 'Screenplay', 'name': 'Joss Whedon'}, "
+                "{'credit_id': 'b', 'department': 'Directing', 'id': 2, 'job': 'Director', 'name': 'John Lasseter'}, "
+                "{'credit_id': 'c', 'department': 'Directing', 'id': 3, 'job': 'Director', 'name': 'Second Director'}]",
+                "[{'credit_id': 'a', 'department': 'Camera', 'id': 1, 'job': 'Director of Photography', 'name': 'DoP'}]",
+                "[{'name': 'Unusual Order', 'job': 'Director'}]",
+                np.nan,
+                "[]",
+                "[{'credit_id': 'a', 'job': 'Director', 'name': 'Kept Director', 'extra': -1.5}]",
+                "[{'name': 'First Director', 'job': 'Director'}, "
+                "{'credit_id': 'b', 'job': 'Director', 'name': 'Second Director'}]",
+                "[{'credit_id': 'a', 'job': \"Director\", 'name': 'Quoted Director'}, "
+                "{'credit_id': 'b', 'job': 'Director', 'name': 'Second Director'}]",
+            ],
+            'keywords': [
+                "[{'id': 931, 'name': 'jealousy'}, {'id': 4290, 'name': 'toy'}, {'id': 5202, 'name': 'boy'}, "
+                "{'id': 6054, 'name': 'friendship'}]",
+                "[{'id': 1, 'name': 'los angeles, california'}]",
+                "[]",
+                "garbage[",
+                np.nan,
+                "[{'id': 1 'name': 'missing comma'}, {'id': 2, 'name': 'valid'}]",
+                "[]",
+                "[]",
+            ],
+            'genres': [
+                "[{'id': 16, 'name': 'Animation'}, {'id': 35, 'name': 'Comedy'}, {'id': 10751, 'name': 'Family'}]",
+                "[{'id': 878, 'name': 'Science Fiction'}]",
+                "[]",
+                "[{'id': 18, 'name': 'Drama'}]",
+                np.nan,
+                "[{'id': 18, 'name': 'Drama', 'extra': None}, {'id': 80, 'name': 'Crime', 'flag': True}]",
+                "[]",
+                "[]",
+            ],
+        })
+
+    def test_matches_literal_eval_reference(self):
+        expected = clean_features_literal_eval(self.metadata.copy())
+        actual = clean_features(self.metadata.copy())
+
+        for feature in ['cast', 'keywords', 'genres', 'director']:
+            self.assertEqual(actual[feature].tolist(), expected[feature].tolist(), feature)
+
+    def test_extracts_top_three_and_director(self):
+        cleaned = clean_features(self.metadata.copy())
+
+        self.assertEqual(cleaned.loc[0, 'cast'], ['tomhanks', 'timallen', 'donrickles'])
+        self.assertEqual(cleaned.loc[0, 'director'], 'johnlasseter')
+        self.assertEqual(cleaned.loc[1, 'cast'], ["conano'brien"])
+        self.assertEqual(cleaned.loc[1, 'director'], '')
+        self.assertEqual(cleaned.loc[3, 'keywords'], [])
+        self.assertEqual(cleaned.loc[5, 'cast'], [])
+        self.assertEqual(cleaned.loc[5, 'genres'], ['drama', 'crime'])
+        self.assertEqual(cleaned.loc[6, 'director'], 'firstdirector')
+        self.assertEqual(cleaned.loc[7, 'director'], 'quoteddirector')
+
+
+class TitleSearchIndexTests(SimpleTestCase):
+    """
+    The indexed title search must rank titles like a full RapidFuzz scan over all titles, including
+    weak incidental matches sharing no n-gram with the query (e.g. 'toy' -> 'Dark City', 72), and
+    score strong matches like fuzzywuzzy's process.extract (RapidFuzz computes the exact partial
+    ratio, fuzzywuzzy an approximation, so weak scores can differ).
+    """
+
+    titles = pd.Series([
+        'The Dark Knight', 'The Dark Knight Rises', 'Dark City', 'Up', 'Toy Story', 'Toy Story 2',
+        'Knight and Day', 'Léon: The Professional', 'Night of the Living Dead', 'Star Wars',
+        'Star Trek', 'Stardust', 'Dark Shadows', 'The Darkest Hour', 'Amélie', 'Se7en', 'Heat',
+    ])
+
+    def test_matches_full_scan_ranking(self):
+        index = TitleSearchIndex(self.titles)
+        for query in ['dark knight', 'the dark nite', 'toy', 'up', 'Star', 'leon professional', 'amelie', ' heat ',
+                      'a', 'zzz']:
+            candidates = self.titles if len(query.strip()) <= 3 else self.titles[self.titles.str.len() > 3]
+            scores = rapidfuzz.process.extract(normalize_title(query), candidates.map(normalize_title),
+                                               scorer=rapidfuzz.fuzz.WRatio, processor=None, limit=None)
+            ranked = sorted((-round(score), position) for _, score, position in scores)[:10]
+            self.assertEqual(index.search(query, limit=10),
+                             [(self.titles[position], -score) for score, position in ranked], query)
+
+            expected = [(title, score) for title, score, _ in process.extract(query.strip(), candidates, limit=10)]
+            self.assertEqual([match for match in index.search(query, limit=10) if match[1] >= 80],
+                             [match for match in expected if match[1] >= 80], query)
+
+    def test_empty_query(self):
+        self.assertEqual(TitleSearchIndex(self.titles).search('?!'), [])
+
+
+class PrefixIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        titles = ['The Dark Knight', 'Dark City', 'Knight and Day', 'Darkman', 'Up']
+        votes = [12000, 1500, 900, np.nan, 7000]
+        self.titles = titles
+        self.index = PrefixIndex(titles, votes)
+
+    def complete(self, prefix, limit=10):
+        return [self.titles[position] for position in self.index.complete(prefix, limit)]
+
+    def test_matches_any_word_start_by_popularity(self):
+        self.assertEqual(self.complete('dark'), ['The Dark Knight', 'Dark City', 'Darkman'])
+        self.assertEqual(self.complete('KNIGHT'), ['The Dark Knight', 'Knight and Day'])
+        self.assertEqual(self.complete('dark  k'), ['The Dark Knight'])
+
+    def test_limit_and_no_match(self):
+        self.assertEqual(self.complete('d', limit=1), ['The Dark Knight'])
+        self.assertEqual(self.complete('zz'), [])
+        self.assertEqual(self.complete('  '), [])
+
+
+class UniqueNeighborsTests(SimpleTestCase):
+    """
+    Recommendations must hold exactly top_n distinct movie ids, never the query movie itself,
+    even when duplicate rows of one id crowd the nearest neighbors.
+    """
+
+    def setUp(self):
+        rows = [[3, 1, 0, 0], [3, 1, 0, 0], [3, 1, 0, 0], [2, 1, 1, 0], [2, 1, 1, 0],
+                [1, 1, 1, 0], [0, 1, 1, 1], [0, 0, 1, 1], [0, 0, 0, 1]]
+        self.matrix = csr_matrix(normalize(np.array(rows, dtype=np.float32)))
+        self.ids = np.array([10, 10, 10, 20, 20, 30, 40, 50, 60])
+        self.model = DotProductIndex().fit(self.matrix)
+
+    def test_dedups_by_id_with_adaptive_overfetch(self):
+        distances, positions = get_unique_neighbors([0, 3], self.ids, self.model, self.matrix, top_n=4, overfetch=0)
+
+        self.assertEqual(self.ids[positions[0]].tolist(), [20, 30, 40, 50])
+        self.assertEqual(self.ids[positions[1]].tolist(), [30, 10, 40, 50])
+        self.assertTrue((np.diff(distances, axis=1) >= 0).all())
+
+    def test_small_catalog_is_padded(self):
+        _, positions = get_unique_neighbors([0], self.ids, self.model, self.matrix, top_n=7)
+
+        self.assertEqual(self.ids[positions[0][positions[0] >= 0]].tolist(), [20, 30, 40, 50, 60])
+        self.assertEqual(positions[0][5:].tolist(), [-1, -1])
+
+        for allowed in (None, self.ids != 20):
+            distances, positions = get_unique_neighbors([0], self.ids, self.model, self.matrix, top_n=12,
+                                                        allowed=allowed)
+            kept = self.ids[positions[0][positions[0] >= 0]].tolist()
+            self.assertEqual(kept, [20, 30, 40, 50, 60] if allowed is None else [30, 40, 50, 60])
+            self.assertEqual(positions[0][len(kept):].tolist(), [-1] * (12 - len(kept)))
+            self.assertTrue((distances[0][len(kept):] == 1.0).all())
+
+    def test_large_filter_walk_is_capped(self):
+        allowed = self.ids >= 50
+        expected = get_unique_neighbors([0, 3], self.ids, self.model, self.matrix, top_n=2, allowed=allowed)
+        with mock.patch.object(self.model, 'kneighbors', wraps=self.model.kneighbors) as kneighbors:
+            capped = get_unique_neighbors([0, 3], self.ids, self.model, self.matrix, top_n=2, overfetch=0,
+                                          allowed=allowed, prefilter_max=0, walk_max=4)
+
+        self.assertLessEqual(max(call.kwargs['n_neighbors'] for call in kneighbors.call_args_list), 4 + 1)
+        np.testing.assert_array_equal(capped[1], expected[1])
+        np.testing.assert_allclose(capped[0], expected[0], atol=1e-6)
+
+
+class NeighborTableTests(SimpleTestCase):
+    """
+    The precomputed neighbor table must hold the exact brute-force top K of every movie.
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.matrix = csr_matrix(rng.random((80, 12)) * (rng.random((80, 12)) < 0.5))
+
+    def brute_force(self, matrix, top_k):
+        normalized = normalize(matrix).toarray()
+        similarities = normalized @ normalized.T
+        np.fill_diagonal(similarities, -np.inf)
+        indices = np.argsort(-similarities, axis=1, kind='stable')[:, :top_k]
+        return indices, 1.0 - np.take_along_axis(similarities, indices, axis=1)
+
+    def test_matches_brute_force_top_k(self):
+        with tempfile.TemporaryDirectory() as directory:
+            indices, distances = get_or_build_neighbor_table(
+                self.matrix, os.path.join(directory, 'indices.npy'), os.path.join(directory, 'distances.npy'))
+        expected_indices, expected_distances = self.brute_force(self.matrix, NEIGHBOR_TABLE_K)
+
+        self.assertEqual(indices.shape, (80, NEIGHBOR_TABLE_K))
+        np.testing.assert_array_equal(indices, expected_indices)
+        np.testing.assert_allclose(distances, expected_distances, atol=1e-6)
+
+        blocked = build_neighbor_table(self.matrix, top_k=5, block_size=16)
+        np.testing.assert_array_equal(blocked[0], expected_indices[:, :5])
+
+    def test_rebuilds_when_the_matrix_changes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = os.path.join(directory, 'indices.npy'), os.path.join(directory, 'distances.npy')
+            get_or_build_neighbor_table(self.matrix, *paths)
+            with mock.patch('neighbor_table.build_neighbor_table', wraps=build_neighbor_table) as build:
+                get_or_build_neighbor_table(self.matrix, *paths)
+                self.assertFalse(build.called)
+
+                grown = vstack([self.matrix, csr_matrix(np.random.default_rng(1).random((10, 12)))]).tocsr()
+                indices, distances = get_or_build_neighbor_table(grown, *paths, mmap_mode='r')
+                self.assertTrue(build.called)
+            expected_indices, expected_distances = self.brute_force(grown, NEIGHBOR_TABLE_K)
+
+            self.assertIsInstance(indices, np.memmap)
+            self.assertEqual(indices.shape, (90, NEIGHBOR_TABLE_K))
+            np.testing.assert_allclose(distances, expected_distances, atol=1e-6)
+            np.testing.assert_array_equal(indices, expected_indices)
+            del indices, distances
+
+
+class LSHIndexTests(SimpleTestCase):
+    """
+    The LSH backend with the configured tables and probes must find most exact neighbors, and an
+    updated index must find the appended movies.
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centers = (rng.random((40, 300)) < 0.05) * rng.random((40, 300))
+        rows = np.repeat(centers, 50, axis=0) + (rng.random((2000, 300)) < 0.02) * rng.random((2000, 300))
+        self.matrix = csr_matrix(normalize(rows).astype(np.float32))
+        self.index = LSHIndex(**LSH_PARAMS).fit(self.matrix)
+        self.queries = rng.choice(2000, 200, replace=False)
+
+    def test_recall_against_exact_cosine(self):
+        exact = np.argsort(-(self.matrix[self.queries] @ self.matrix.T).toarray(), axis=1, kind='stable')[:, :10]
+        distances, indices = self.index.kneighbors(self.matrix[self.queries], n_neighbors=10)
+
+        recall = np.mean([len(set(found) & set(expected)) / 10 for found, expected in zip(indices, exact)])
+        self.assertGreaterEqual(recall, 0.8)
+        np.testing.assert_allclose(distances[:, 0], 0.0, atol=1e-5)  # Every movie finds itself
+        # Candidates come from the probed buckets, not an exact scan of the catalog
+        candidates = [self.index._candidates(codes, projected) for codes, projected in
+                      zip(self.index._codes(self.index._project(self.matrix[self.queries])),
+                          self.index._project(self.matrix[self.queries]))]
+        self.assertLess(np.mean([len(found) for found in candidates]), 200)
+
+    def test_update_finds_appended_rows(self):
+        remap = np.arange(2000)
+        remap[[3, 10]] = -1
+        remap[remap >= 0] = np.arange(1998)
+        new_rows = self.matrix[[5, 500, 1500]].toarray()
+        new_rows[:, -1] = 0.3  # Near their source movies, not equal to them
+        keep = np.flatnonzero(remap >= 0)
+        updated_matrix = csr_matrix(np.vstack([self.matrix[keep].toarray(), normalize(new_rows)]).astype(np.float32))
+
+        updated = self.index.update(updated_matrix, remap)
+        _, indices = updated.kneighbors(updated_matrix[1998:], n_neighbors=2)
+
+        self.assertEqual(indices[:, 0].tolist(), [1998, 1999, 2000])
+        self.assertEqual(indices[:, 1].tolist(), remap[[5, 500, 1500]].tolist())
+        self.assertEqual(len(self.index.bucket_codes_), 2000)
+
+
+class TopMoviesTests(SimpleTestCase):
+    """
+    The vectorized leaderboard must rank like a stable sort of the row-wise weighted rating.
+    """
+
+    def test_matches_rowwise_rating_with_stable_ties(self):
+        rng = np.random.default_rng(0)
+        metadata = pd.DataFrame({
+            'title': [f'Movie {i}' for i in range(200)],
+            'vote_count': rng.integers(0, 50, 200),
+            'vote_average': rng.integers(0, 3, 200).astype(float),
+            'release_date': '2000-01-01',
+        })
+        C = metadata['vote_average'].mean()
+        m = metadata['vote_count'].quantile(0.5)
+        qualified = metadata[metadata['vote_count'] >= m].copy()
+        qualified['weighted_rating'] = qualified.apply(
+            lambda x: (x['vote_count'] / (x['vote_count'] + m) * x['vote_average']) + (m / (x['vote_count'] + m) * C),
+            axis=1)
+        expected = qualified.sort_values('weighted_rating', ascending=False, kind='stable')
+
+        for top_n in (1, 7, 40, 500):
+            top = get_top_movies(metadata, top_n=top_n, percentile=0.5)
+            self.assertEqual(top.index.tolist(), expected.index[:top_n].tolist())
+            np.testing.assert_allclose(top['weighted_rating'], expected['weighted_rating'][:top_n])
+
+
+class FacetIndexTests(SimpleTestCase):
+    """
+    Facet bitmaps must OR values within a facet and AND the facets together.
+    """
+
+    def setUp(self):
+        self.facets = FacetIndex(pd.DataFrame({
+            'genres': [['drama'], ['comedy', 'drama'], ['horror'], [], ['sciencefiction']],
+            'director': ['annalee', 'bobsmith', 'annalee', '', 'bobsmith'],
+            'release_date': ['1999-05-01', '2001-01-01', '2005-10-10', None, 'bad'],
+        }))
+
+    def test_filters(self):
+        self.assertIsNone(self.facets.mask())
+        self.assertEqual(self.facets.mask(genres='Drama').tolist(), [True, True, False, False, False])
+        self.assertEqual(self.facets.mask(genres=['horror', 'Science Fiction']).nonzero()[0].tolist(), [2, 4])
+        self.assertEqual(self.facets.mask(director='Anna Lee', year_from=2000).nonzero()[0].tolist(), [2])
+        self.assertEqual(self.facets.mask(year_to=2001).nonzero()[0].tolist(), [0, 1])
+        self.assertFalse(self.facets.mask(genres='western').any())
+
+
+class FacetFilterFormTests(SimpleTestCase):
+    """
+    An invalid filter field is dropped on its own; JSON clients get its error with a 400.
+    """
+
+    def test_keeps_valid_fields(self):
+        form = FacetFilterForm({'genre': 'Drama', 'year_from': 'abc', 'year_to': '1990'})
+
+        self.assertEqual(form.filters(), {'genres': 'Drama', 'year_to': 1990})
+        self.assertEqual(list(form.errors), ['year_from'])
+
+    def test_html_pages_show_the_errors(self):
+        with mock.patch('engine.load_resources', return_value=catalog_resources()):
+            for url in ('/recommend/', '/async/recommend/'):
+                response = self.client.get(url, {'title': 'Movie 3', 'year_from': 'abc', 'genre': 'Genre 1'})
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'is-invalid')
+                self.assertContains(response, 'Enter a whole number.')
+                self.assertContains(response, 'value="Genre 1"')
+
+    def test_json_clients_get_400(self):
+        for url in ('/top/', '/recommend/', '/async/top/', '/async/recommend/'):
+            response = self.client.get(url, {'title': 'Heat', 'year_to': '1500', 'format': 'json'})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(list(response.json()['errors']), ['year_to'])
+
+
+class FeatureMatrixTests(SimpleTestCase):
+    """
+    The feature matrix counts field-prefixed cleaned names, without re-tokenizing them.
+    """
+
+    def setUp(self):
+        self.movies = pd.DataFrame({
+            'keywords': [['jealousy', 'toy'], ['boardgame'], [], ['toy', 'boy']],
+            'cast': [['tomhanks', 'timallen'], ['robinwilliams'], ['tomhanks', 'toy'], []],
+            'director': ['johnlasseter', 'the', '', "conano'brien"],
+            'genres': [['animation', 'comedy'], ['adventure'], ['comedy'], ['comedy', 'family']],
+        })
+        self.tokens = [[f'{field}:{name}' for field in ('keywords', 'cast', 'genres')
+                        for name in getattr(row, field)] + ([f'director:{row.director}'] if row.director else [])
+                       for row in self.movies.itertuples()]
+
+    def test_count_and_tfidf_match_token_vectorizers(self):
+        matrix, vocabulary, _ = build_feature_matrix(self.movies, scheme='count')
+        counts = CountVectorizer(analyzer=list).fit(self.tokens)
+        self.assertEqual(vocabulary, counts.vocabulary_)
+        self.assertEqual(matrix.dtype, np.float32)
+        np.testing.assert_allclose(matrix.toarray(), normalize(counts.transform(self.tokens)).toarray(), atol=1e-6)
+
+        matrix, _, _ = build_feature_matrix(self.movies, scheme='tfidf')
+        tfidf = TfidfVectorizer(analyzer=list).fit_transform(self.tokens)
+        np.testing.assert_allclose(matrix.toarray(), tfidf.toarray(), atol=1e-6)
+
+    def test_bm25_matches_hand_computed_weights(self):
+        counts = csr_matrix(np.array([[2, 0, 1], [0, 1, 0], [1, 1, 0]], dtype=np.float32))
+        weighting = FeatureWeighting('bm25', k1=1.0, b=0.5).fit(counts)
+
+        # n = 3, df = (2, 2, 1): idf = ln(1.6), ln(1.6), ln(8 / 3); lengths (3, 1, 2), average 2
+        # Row 0: tf 2 -> 2 * 2 / (2 + 1.25), tf 1 -> 2 / (1 + 1.25), then idf and L2 norm
+        expected = [[0.552869, 0.0, 0.833268], [0.0, 1.0, 0.0], [np.sqrt(0.5), np.sqrt(0.5), 0.0]]
+        np.testing.assert_allclose(weighting.transform(counts).toarray(), expected, atol=1e-6)
+
+        wider = csr_matrix(np.array([[0, 0, 0, 1]], dtype=np.float32))
+        with self.assertRaises(ValueError):
+            weighting.transform(wider)
+        self.assertEqual(len(weighting.idf_), 3)
+        weighting.extend(4)
+        self.assertAlmostEqual(float(weighting.idf_[3]), np.log(8 / 3), places=6)
+        self.assertEqual(weighting.transform(wider).toarray().tolist(), [[0.0, 0.0, 0.0, 1.0]])
+
+    def test_names_are_kept_whole_and_fields_apart(self):
+        _, vocabulary, _ = build_feature_matrix(self.movies, scheme='count')
+        self.assertIn('director:the', vocabulary)
+        self.assertIn("director:conano'brien", vocabulary)
+        self.assertNotEqual(vocabulary['keywords:toy'], vocabulary['cast:toy'])
+
+    def test_hashed_chunks_match_one_pass_and_namespace_fields(self):
+        vectorizer = HashedVocabulary(2 ** 12)
+        vectorizer.add_chunk(self.movies.iloc[:2])
+        vectorizer.add_chunk(self.movies.iloc[2:])
+        matrix, vocabulary = vectorizer.finalize()
+        self.assertEqual((matrix.shape, vocabulary), ((4, 2 ** 12), {}))
+        self.assertEqual((matrix != HashedVocabulary(2 ** 12).transform_fields(self.movies)).nnz, 0)
+
+        same_name = pd.DataFrame({'keywords': [['toy']], 'cast': [['toy']], 'director': [''], 'genres': [[]]})
+        self.assertEqual(HashedVocabulary(2 ** 12).transform_fields(same_name).nnz, 2)
+
+
+class EmbeddingTests(SimpleTestCase):
+    """
+    Dense embeddings that keep every dimension must rank neighbors like the sparse matrix.
+    """
+
+    def test_full_rank_embeddings_match_sparse_neighbors(self):
+        rng = np.random.default_rng(0)
+        counts = rng.random((30, 12)) * (rng.random((30, 12)) < 0.4)
+        counts[:, -1] = 0  # rank 11 at most, so 11 dimensions lose nothing
+        matrix = csr_matrix(normalize(counts).astype(np.float32))
+        embeddings, _ = build_embeddings(matrix, dim=11)
+        self.assertEqual(embeddings.dtype, np.float32)
+
+        sparse_distances, _ = DotProductIndex().fit(matrix).kneighbors(matrix[0], n_neighbors=5)
+        dense_distances, _ = DotProductIndex().fit(embeddings).kneighbors(embeddings[0], n_neighbors=5)
+        np.testing.assert_allclose(dense_distances, sparse_distances, atol=1e-4)
+
+
+def raw_movies(ids, seed):
+    """
+    Random movies in the raw dataset format (see catalog.prepare_movies).
+    """
+    rng = np.random.default_rng(seed)
+
+    def names(prefix, pool, k):
+        return repr([{'id': int(i), 'name': f'{prefix} {i}'} for i in rng.choice(pool, k, replace=False)])
+
+    return pd.DataFrame({
+        'id': list(ids),
+        'title': [f'Movie {i}' for i in ids],
+        'cast': [names('Actor', 12 + seed, 4) for _ in ids],
+        'crew': [repr([{'job': 'Director', 'name': f'Director {rng.integers(4)}'}]) for _ in ids],
+        'keywords': [names('Keyword', 10 + seed, 3) for _ in ids],
+        'genres': [names('Genre', 5, 2) for _ in ids],
+    })
+
+
+class CatalogUpdateTests(SimpleTestCase):
+    """
+    Incremental catalog updates must give what a full rebuild of the updated catalog gives.
+    """
+
+    def setUp(self):
+        metadata = prepare_movies(raw_movies(range(1, 13), seed=0))
+        matrix, self.vocabulary, self.weighting = build_feature_matrix(metadata, scheme='count')
+        neighbor_indices, neighbor_distances = build_neighbor_table(matrix, top_k=3)
+        self.resources = {
+            'metadata': metadata, 'count_matrix': matrix, 'vectors': matrix,
+            'nn_model': LSHIndex(n_tables=4, n_bits=4).fit(matrix),
+            'neighbor_indices': neighbor_indices, 'neighbor_distances': neighbor_distances,
+        }
+
+    def update(self, resources, movies=None, delete_ids=None):
+        updated, self.vocabulary = apply_catalog_update(resources, self.vocabulary, self.weighting, movies, delete_ids)
+        return updated
+
+    def assert_matches_rebuild(self, updated):
+        rebuilt, _, _ = build_feature_matrix(updated['metadata'], scheme='count')
+        similarities = (rebuilt @ rebuilt.T).toarray()
+        np.testing.assert_allclose((updated['count_matrix'] @ updated['count_matrix'].T).toarray(), similarities,
+                                   atol=1e-6)
+
+        indices, distances = updated['neighbor_indices'], updated['neighbor_distances']
+        _, rebuilt_distances = build_neighbor_table(rebuilt, top_k=3)
+        np.testing.assert_allclose(distances, rebuilt_distances, atol=1e-6)
+        np.testing.assert_allclose(distances, 1.0 - np.take_along_axis(similarities, indices.astype(np.int64), axis=1),
+                                   atol=1e-6)
+        self.assertFalse((indices == np.arange(len(indices))[:, None]).any())
+
+        fitted = LSHIndex(n_tables=4, n_bits=4).fit(updated['count_matrix'])
+        np.testing.assert_array_equal(updated['nn_model'].hyperplanes_, fitted.hyperplanes_)
+        np.testing.assert_array_equal(updated['nn_model'].bucket_order_, fitted.bucket_order_)
+        np.testing.assert_array_equal(updated['nn_model'].bucket_codes_, fitted.bucket_codes_)
+
+    def test_add_update_and_delete_match_full_rebuild(self):
+        original_model = self.resources['nn_model']
+        updated = self.update(self.resources, raw_movies([5, 20, 21], seed=3), delete_ids=[3])
+
+        self.assertEqual(updated['metadata']['id'].tolist(), [1, 2, 4, 6, 7, 8, 9, 10, 11, 12, 5, 20, 21])
+        self.assertGreater(updated['count_matrix'].shape[1], self.resources['count_matrix'].shape[1])
+        self.assert_matches_rebuild(updated)
+        self.assertIs(self.resources['nn_model'], original_model)
+        self.assertEqual(len(original_model.bucket_codes_), 12)
+
+        deleted = self.update(updated, delete_ids=[1, 20])
+        self.assertEqual(deleted['metadata']['id'].tolist(), [2, 4, 6, 7, 8, 9, 10, 11, 12, 5, 21])
+        self.assert_matches_rebuild(deleted)
+
+    def test_delta_log_replay_matches_direct_updates(self):
+        batches = [(raw_movies([5, 20], seed=3), [3]), (raw_movies([30], seed=4), [20])]
+        vocabulary, weighting = dict(self.vocabulary), copy.deepcopy(self.weighting)
+        direct = self.resources
+        for movies, delete_ids in batches:
+            direct = self.update(direct, movies, delete_ids)
+
+        with tempfile.TemporaryDirectory() as directory:
+            log_path = os.path.join(directory, 'deltas.jsonl')
+            for movies, delete_ids in batches:
+                append_delta_log(movies, delete_ids, log_path=log_path, delta_dir=os.path.join(directory, 'rows'))
+            replayed, _ = replay_delta_log(self.resources, vocabulary, weighting, log_path=log_path)
+
+            first, first_vocabulary = apply_catalog_update(self.resources, dict(self.vocabulary),
+                                                           copy.deepcopy(self.weighting), *batches[0])
+            resumed, _ = replay_delta_log(first, first_vocabulary, copy.deepcopy(self.weighting), log_path=log_path,
+                                          start=1)
+
+        for result in (replayed, resumed):
+            self.assertEqual(result['metadata']['id'].tolist(), direct['metadata']['id'].tolist())
+            np.testing.assert_allclose(result['count_matrix'].toarray(), direct['count_matrix'].toarray())
+            np.testing.assert_array_equal(result['neighbor_indices'], direct['neighbor_indices'])
+
+    def test_update_catalog_applies_batches_logged_by_other_processes(self):
+        ratings = {'vote_count': 10, 'vote_average': 7.0, 'release_date': '2000-01-01'}
+        batches = [(raw_movies([5, 20], seed=3).assign(**ratings), [3]),
+                   (raw_movies([30], seed=4).assign(**ratings), [20])]
+        self.resources['metadata'] = self.resources['metadata'].assign(**ratings)
+        direct = self.resources
+        for movies, delete_ids in batches:
+            direct = self.update(direct, movies, delete_ids)
+
+        with tempfile.TemporaryDirectory() as directory:
+            log_path, delta_dir = os.path.join(directory, 'deltas.jsonl'), os.path.join(directory, 'rows')
+            # Logged by another process after these resources were loaded
+            append_delta_log(*batches[0], log_path=log_path, delta_dir=delta_dir)
+            loaded = dict(self.resources, vocabulary_path=None, weighting_path=None, base='build', deltas=0)
+            manager = ResourceManager(lambda: loaded)
+            with mock.patch.multiple(
+                    engine, _manager=manager, ARTIFACT_LOCK_PATH=os.path.join(directory, 'artifacts.lock'),
+                    load_manifest=mock.Mock(), build_id=mock.Mock(return_value='build'),
+                    load_vocabulary=mock.Mock(return_value=dict(self.vocabulary)),
+                    load_model=mock.Mock(return_value=copy.deepcopy(self.weighting)),
+                    read_delta_log=functools.partial(read_delta_log, log_path),
+                    replay_delta_log=functools.partial(replay_delta_log, log_path=log_path),
+                    append_delta_log=functools.partial(append_delta_log, log_path=log_path, delta_dir=delta_dir),
+                    persist_catalog=mock.Mock(side_effect=lambda updated, *args: dict(updated)),
+                    _artifact_version=mock.Mock(return_value='test')):
+                version = engine.update_catalog(*batches[1])
+            logged = read_delta_log(log_path)
+
+        self.assertEqual(version, 2)
+        self.assertEqual([entry['version'] for entry in logged], [1, 2])
+        updated = manager.get()
+        self.assertEqual(updated['deltas'], 2)
+        self.assertEqual(updated['metadata']['id'].tolist(), direct['metadata']['id'].tolist())
+        np.testing.assert_allclose(updated['count_matrix'].toarray(), direct['count_matrix'].toarray())
+
+
+def catalog_resources():
+    """
+    A small loaded resource set (see engine.load_resources) of twelve random movies.
+    """
+    metadata = prepare_movies(raw_movies(range(1, 13), seed=0))
+    metadata['release_date'] = '2000-01-01'
+    matrix, _, _ = build_feature_matrix(metadata, scheme='count')
+    neighbor_indices, neighbor_distances = build_neighbor_table(matrix, top_k=5)
+    return {
+        'metadata': metadata, 'count_matrix': matrix, 'vectors': matrix, 'nn_model': DotProductIndex().fit(matrix),
+        'neighbor_indices': neighbor_indices, 'neighbor_distances': neighbor_distances,
+        'indices': pd.Series(metadata.index, index=metadata['title']), 'id_positions': build_id_positions(metadata),
+        'display': build_display_frame(metadata), 'facets': FacetIndex(metadata),
+        'title_index': TitleSearchIndex(metadata['title']), 'version': 'test',
+    }
+
+
+class RecommendBatchTests(SimpleTestCase):
+    """
+    Batch recommendations answer every distinct title or id once, in request order.
+    """
+
+    def setUp(self):
+        self.resources = catalog_resources()
+        patcher = mock.patch('engine.load_resources', return_value=self.resources)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def expected_scores(self, movie_id, top_n=3):
+        row = self.resources['id_positions'][movie_id]
+        return 1.0 - self.resources['neighbor_distances'][row, :top_n]
+
+    def test_engine_dedupes_queries(self):
+        recommendations = engine.get_recommendations_batch(titles=['Movie 3', 'Movie 3', 'Unknown'], ids=[5, 5, 2],
+                                                           top_n=3)
+        self.assertEqual(recommendations['query'].tolist(), ['Movie 3'] * 3 + [5] * 3 + [2] * 3)
+        self.assertEqual(recommendations['rank'].tolist(), [1, 2, 3] * 3)
+        for query, movie_id in (('Movie 3', 3), (5, 5), (2, 2)):
+            recommended = recommendations[recommendations['query'] == query]
+            self.assertNotIn(movie_id, recommended['id'].tolist())
+            np.testing.assert_allclose(recommended['score'], self.expected_scores(movie_id), atol=1e-6)
+
+    def test_endpoint(self):
+        response = self.client.post('/recommend/batch', json.dumps({'ids': [5, 5, 999], 'titles': ['Movie 3'] * 2,
+                                                                     'top_n': 3}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual([result['query'] for result in payload['results']], ['Movie 3', 5])
+        np.testing.assert_allclose([movie['score'] for movie in payload['results'][1]['recommendations']],
+                                   self.expected_scores(5), atol=1e-6)
+        self.assertEqual(payload['not_found'], [999])
+
+        for body in ({'titles': 'Heat'}, {'ids': '12'}, {'ids': ['x']}, ['Heat']):
+            response = self.client.post('/recommend/batch', json.dumps(body), content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+
+    def test_service_batch_groups_recommend_calls(self):
+        httpd = server.RecommendationServer(('127.0.0.1', 0), server.RecommendationHandler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+        calls = [{'op': 'recommend', 'id': 5, 'top_n': 3}, {'op': 'recommend', 'title': 'Movie 3', 'top_n': 3},
+                 {'op': 'recommend', 'id': 5, 'top_n': 3}, {'op': 'recommend', 'id': 7, 'top_n': 2},
+                 {'op': 'recommend', 'id': 5, 'top_n': 3, 'year_from': 1990}]
+
+        with mock.patch('engine.get_recommendations_batch', wraps=engine.get_recommendations_batch) as batched:
+            connection = http.client.HTTPConnection('127.0.0.1', httpd.server_address[1], timeout=5)
+            self.addCleanup(connection.close)
+            connection.request('POST', '/batch', json.dumps({'requests': calls}))
+            responses = json.loads(connection.getresponse().read())['responses']
+
+        self.assertEqual(sorted(call.kwargs['ids'] for call in batched.call_args_list), [[3, 5], [7]])
+        self.assertEqual([(response['id'], response['title']) for response in responses],
+                         [(5, None), (3, 'Movie 3'), (5, None), (7, None), (5, None)])
+        for call, response in zip(calls, responses):
+            self.assertEqual(response, server.recommend(call))
+            expected = self.expected_scores(response['id'], call['top_n'])
+            np.testing.assert_allclose([movie['score'] for movie in response['recommendations']], expected, atol=1e-6)
+
+
+class DisplayFrameTests(SimpleTestCase):
+    """
+    The display projection must carry every field the views render, with the values of the metadata rows.
+    """
+
+    def setUp(self):
+        self.resources = catalog_resources()
+        metadata = self.resources['metadata']
+        metadata['genres'] = metadata['genres'].where(metadata['id'] != 10, pd.Series([[]] * len(metadata)))
+        metadata['release_date'] = metadata['release_date'].where(metadata['id'] != 11)
+        self.resources['display'] = build_display_frame(metadata)
+        patcher = mock.patch('engine.load_resources', return_value=self.resources)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        engine.clear_caches()
+        self.addCleanup(engine.clear_caches)
+
+    def rendered_fields(self, template, name):
+        path = os.path.join(os.path.dirname(__file__), 'templates', 'recommendations', template)
+        with open(path, encoding='utf-8') as f:
+            return set(re.findall(r"\{\{ *" + name + r"\.(\w+)", f.read()))
+
+    def test_columns_cover_what_the_views_render(self):
+        match_fields = self.rendered_fields('matches.html', 'match')
+        recommendation_fields = self.rendered_fields('recommendations.html', 'recommendation')
+        self.assertTrue(match_fields and recommendation_fields)
+
+        self.assertLessEqual(recommendation_fields, set(self.resources['display'].columns))
+        self.assertLessEqual(match_fields - {'score'}, set(self.resources['display'].columns))
+        for record in views._recommendation_context(1, {})['recommendations']:
+            self.assertLessEqual(recommendation_fields, set(record))
+        records = views._match_records('Movie 1')
+        self.assertTrue(records)
+        for record in records:
+            self.assertLessEqual(match_fields, set(record))
+
+    def test_fuzzy_search_returns_the_metadata_rows(self):
+        metadata, display = self.resources['metadata'], self.resources['display']
+        for title_index in (None, self.resources['title_index']):
+            matches = fuzzy_search('Movie 1', metadata, title_index=title_index, display=display)
+            pd.testing.assert_frame_equal(matches, fuzzy_search('Movie 1', metadata, title_index=title_index))
+            self.assertTrue({10, 11} <= set(matches['id']))
+
+            expected = process.extract('Movie 1', metadata['title'], limit=10)
+            self.assertEqual(matches['title'].tolist(), [title for title, score, _ in expected if score > 70])
+            for match in matches.itertuples():
+                row = metadata[metadata['id'] == match.id].iloc[0]
+                self.assertEqual(match.title, row['title'])
+                self.assertEqual(match.genres, ', '.join(row['genres']) or 'Unknown')
+                release_date = row['release_date'] if pd.notna(row['release_date']) else 'Unknown'
+                self.assertEqual(match.release_date, release_date)
+
+
+class AsyncRecommendTests(SimpleTestCase):
+    """
+    Async recommendations only share an in-flight result between requests for the same title.
+    """
+
+    def test_coalescing_key_keeps_the_title_as_given(self):
+        keys = []
+
+        async def run(key, fn):
+            keys.append(key)
+            return fn()
+
+        with mock.patch('engine.load_resources', return_value=catalog_resources()), \
+                mock.patch('recommendations.views.offloader.run', run):
+            titles = [self.client.get('/async/recommend/', {'title': title, 'format': 'json'}).json()['title']
+                      for title in ('Movie 3', 'MOVIE 3!', 'Movie 3')]
+
+        self.assertEqual(titles, ['Movie 3'] * 3)
+        self.assertEqual([key[1] for key in keys], ['Movie 3', 'MOVIE 3!', 'Movie 3'])
+        self.assertEqual(keys[0], keys[2])
+
+
+class StreamingIngestionTests(SimpleTestCase):
+    """
+    Streaming ingestion must produce what loading the whole CSVs does.
+    """
+
+    def test_matches_in_memory_ingestion(self):
+        raw = raw_movies(range(1, 8), seed=1)
+        movies = raw[['id', 'title', 'genres']].assign(
+            adult='False', vote_count=range(10, 17), release_date=['2001-01-01', None] + ['1999-05-05'] * 5)
+        movies = pd.concat([movies, movies.iloc[[2]].assign(title='Duplicate id'),
+                            movies.iloc[[3]].assign(id=99, adult='Invalid')], ignore_index=True)
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, name) for name in ('movies.csv', 'credits.csv', 'keywords.csv')]
+            movies.to_csv(paths[0], index=False)
+            raw[raw['id'] != 4][['cast', 'crew', 'id']].to_csv(paths[1], index=False)
+            raw[['id', 'keywords']].to_csv(paths[2], index=False)
+
+            expected = load_and_merge_metadata(*paths, merged_cache_path=os.path.join(directory, 'cache.npz'),
+                                               workers=1)
+            metadata, counts, vocabulary = stream_ingest(*paths, chunk_size=2)
+
+        pd.testing.assert_frame_equal(metadata, expected.reset_index(drop=True), check_like=True)
+        expected_matrix, expected_vocabulary, _ = build_feature_matrix(expected)
+        self.assertEqual(vocabulary, expected_vocabulary)
+        np.testing.assert_allclose(FeatureWeighting().fit_transform(counts).toarray(), expected_matrix.toarray())
+
+
+def write_raw_csvs(directory, raw):
+    """
+    Writes raw movies (see raw_movies) as the three raw CSV files of a data directory.
+    """
+    movies = raw[['id', 'title', 'genres']].assign(adult='False', vote_count=range(10, 10 + len(raw)),
+                                                   vote_average=6.0, release_date='2001-01-01',
+                                                   video=[False] * (len(raw) - 1) + [None])
+    # One malformed row, as in the real file, keeps 'adult' a string column (and 'video' mixes booleans and NaN)
+    movies = pd.concat([movies, movies.iloc[[0]].assign(id=999, adult='Invalid')], ignore_index=True)
+    movies.to_csv(os.path.join(directory, 'movies_metadata.csv'), index=False)
+    raw[['cast', 'crew', 'id']].to_csv(os.path.join(directory, 'credits.csv'), index=False)
+    raw[['id', 'keywords']].to_csv(os.path.join(directory, 'keywords.csv'), index=False)
+
+
+class BuildGraphTests(SimpleTestCase):
+    """
+    Only the stages downstream of a change are rebuilt, and a partial rebuild leaves the same
+    artifacts as a clean build.
+    """
+
+    PATHS = ['MERGED_CACHE_PATH', 'MATRIX_PATH', 'MATRIX_DIR', 'VOCABULARY_PATH', 'WEIGHTING_PATH', 'MODEL_PATH',
+             'NEIGHBOR_INDICES_PATH', 'NEIGHBOR_DISTANCES_PATH', 'BUILD_MANIFEST_PATH', 'EMBEDDING_PATH',
+             'SVD_MODEL_PATH', 'ARTIFACT_LOCK_PATH']
+
+    def setUp(self):
+        self.directories = [self.enterContext(tempfile.TemporaryDirectory()) for _ in range(2)]
+        for directory in self.directories:
+            write_raw_csvs(directory, raw_movies(range(1, 13), seed=2))
+
+    def graph(self, directory, **params):
+        """
+        Points the build graph at a data directory, with optional parameter overrides.
+        """
+        paths = {name: os.path.join(directory, os.path.basename(getattr(build_graph, name))) for name in self.PATHS}
+        return mock.patch.multiple(build_graph, DATA_DIR=directory, read_delta_log=mock.Mock(return_value=[]),
+                                   NEIGHBOR_TABLE_K=params.pop('NEIGHBOR_TABLE_K', 4), **paths, **params)
+
+    def build(self, directory, **params):
+        with self.graph(directory, **params):
+            return build_graph.ensure_artifacts()
+
+    def stale(self, directory, **params):
+        with self.graph(directory, **params):
+            return build_graph.stale_stages()
+
+    def artifacts(self, directory):
+        with self.graph(directory):
+            return {
+                'metadata': load_metadata_cache(build_graph.MERGED_CACHE_PATH),
+                'matrix': load_csr_matrix(build_graph.MATRIX_DIR).toarray(),
+                'vocabulary': load_vocabulary(build_graph.VOCABULARY_PATH),
+                'neighbor_indices': load_array(build_graph.NEIGHBOR_INDICES_PATH),
+                'neighbor_distances': load_array(build_graph.NEIGHBOR_DISTANCES_PATH),
+            }
+
+    def test_unchanged_inputs_rebuild_nothing(self):
+        directory = self.directories[0]
+        self.assertEqual(self.build(directory), [stage.name for stage in build_graph.stages()])
+        self.assertEqual(self.build(directory), [])
+        self.assertEqual(self.stale(directory), [])
+
+    def test_build_waits_for_another_build(self):
+        directory = self.directories[0]
+        rebuilt = []
+        with file_lock(os.path.join(directory, 'artifacts.lock')):
+            thread = threading.Thread(target=lambda: rebuilt.append(self.build(directory)))
+            thread.start()
+            thread.join(0.3)
+            self.assertTrue(thread.is_alive())
+            self.assertFalse(os.path.exists(os.path.join(directory, 'build_manifest.json')))
+        thread.join(10)
+        self.assertEqual(rebuilt, [[stage.name for stage in build_graph.stages()]])
+
+    def test_changes_mark_only_downstream_stages_stale(self):
+        directory = self.directories[0]
+        self.build(directory)
+
+        self.assertEqual(self.stale(directory, NEIGHBOR_TABLE_K=3), ['neighbors'])
+        self.assertEqual(self.stale(directory, VECTORIZER_SCHEME='tfidf'), ['matrix', 'model', 'neighbors'])
+        self.assertEqual(self.build(directory, NEIGHBOR_TABLE_K=3), ['neighbors'])
+
+        write_raw_csvs(directory, raw_movies(range(1, 13), seed=3))
+        self.assertEqual(self.stale(directory, NEIGHBOR_TABLE_K=3), ['merged', 'matrix', 'model', 'neighbors'])
+
+    def test_partial_rebuild_matches_clean_build(self):
+        partial, clean = self.directories
+        self.build(partial, NEIGHBOR_TABLE_K=3)
+        os.remove(os.path.join(partial, 'count_matrix', 'CURRENT'))
+        self.assertEqual(self.build(partial), ['matrix', 'model', 'neighbors'])
+        self.build(clean)
+
+        rebuilt, expected = self.artifacts(partial), self.artifacts(clean)
+        pd.testing.assert_frame_equal(rebuilt.pop('metadata'), expected.pop('metadata'))
+        self.assertEqual(rebuilt.pop('vocabulary'), expected.pop('vocabulary'))
+        for name, array in expected.items():
+            np.testing.assert_array_equal(rebuilt[name], array, err_msg=name)
+
+
+class ParallelCleaningTests(SimpleTestCase):
+    """
+    Cleaning the feature columns on a process pool must give the single-process frame, row order included.
+    """
+
+    def test_pool_matches_single_process(self):
+        raw = raw_movies(range(1, 42), seed=5)
+        raw.index = np.random.default_rng(5).permutation(len(raw)) + 100
+        raw.loc[raw.index[3], 'keywords'] = np.nan
+
+        expected = clean_feature_columns(raw.copy(), workers=1)
+        for workers in (2, 3):
+            pd.testing.assert_frame_equal(clean_feature_columns(raw.copy(), workers=workers), expected)
+
+
+class MetadataCacheTests(SimpleTestCase):
+    """
+    The columnar metadata cache must give back the frame it was saved from, and only for the raw
+    files it was built from.
+    """
+
+    def test_round_trip_matches_csv_path(self):
+        with tempfile.TemporaryDirectory() as directory:
+            write_raw_csvs(directory, raw_movies(range(1, 13), seed=4))
+            paths = [os.path.join(directory, name) for name in ('movies_metadata.csv', 'credits.csv', 'keywords.csv')]
+            cache_path = os.path.join(directory, 'merged_metadata.npz')
+            expected = load_and_merge_metadata(*paths, merged_cache_path=cache_path, workers=1)
+            cached = load_metadata_cache(cache_path, source_fingerprint(paths))
+
+        self.assertEqual(expected['video'].map(type).value_counts().to_dict(), {bool: 11, float: 1})
+        pd.testing.assert_frame_equal(cached, expected)
+
+    def test_round_trip_keeps_dtypes(self):
+        metadata = pd.DataFrame({
+            'count': pd.array([1, None, 3], dtype='Int64'), 'name': pd.array(['a', None, 'c'], dtype='string'),
+            'flag': pd.array([True, None, False], dtype='boolean'), 'kind': pd.Categorical(['x', 'y', 'x']),
+            'day': pd.to_datetime(['2001-01-01', None, '2002-02-02']).tz_localize('UTC'),
+            'mixed': [1, 'a', None], 'video': [True, np.nan, False], 'cast': [['a'], np.nan, []],
+            'title': ['a', np.nan, 'c'], 'id': [1, 2, 3],
+        })
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.npz')
+            save_metadata_cache(metadata, path)
+            pd.testing.assert_frame_equal(load_metadata_cache(path), metadata)
+
+    def test_changed_or_unrecorded_source_is_stale(self):
+        metadata = pd.DataFrame({'id': [1, 2], 'title': ['a', 'b']})
+        with tempfile.TemporaryDirectory() as directory:
+            raw_path, path = os.path.join(directory, 'raw.csv'), os.path.join(directory, 'cache.npz')
+            metadata.to_csv(raw_path, index=False)
+            source_hash = source_fingerprint([raw_path])
+            save_metadata_cache(metadata, path, source_hash)
+            self.assertIsNotNone(load_metadata_cache(path, source_hash))
+
+            metadata.iloc[:1].to_csv(raw_path, index=False)
+            self.assertIsNone(load_metadata_cache(path, source_fingerprint([raw_path])))
+
+            save_metadata_cache(metadata, path)
+            self.assertIsNone(load_metadata_cache(path, source_hash))
+            self.assertIsNotNone(load_metadata_cache(path))
+
+
+class VersionedArtifactTests(SimpleTestCase):
+    """
+    Saving a matrix publishes a complete new version; older versions are pruned.
+    """
+
+    def test_save_publishes_and_prunes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertIsNone(load_csr_matrix(directory))
+            for value in (1, 2, 3):
+                save_csr_matrix(csr_matrix(np.eye(3, dtype=np.float32) * value), directory)
+
+            versions = sorted(name for name in os.listdir(directory) if name.startswith('v'))
+            self.assertEqual(len(versions), 2)
+            self.assertEqual(read_version(directory)['version'], versions[-1])
+            np.testing.assert_array_equal(load_csr_matrix(directory).toarray(), np.eye(3) * 3)
+
+
+class LRUCacheTests(SimpleTestCase):
+    """
+    The response cache evicts the least recently used entry, expires entries and counts lookups.
+    """
+
+    def test_eviction_expiry_and_stats(self):
+        cache = LRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual({key: cache.stats()[key] for key in ('size', 'hits', 'misses', 'evictions')},
+                         {'size': 2, 'hits': 3, 'misses': 1, 'evictions': 1})
+
+        expiring = LRUCache(ttl=-1)
+        expiring.set('a', 1)
+        self.assertEqual(expiring.get('a', 'missing'), 'missing')
+        self.assertEqual(expiring.stats()['expirations'], 1)
+
+    def test_memoize_normalizes_keys_and_returns_copies(self):
+        calls = []
+
+        @memoize(max_entries=4, key=query_key, copy=True)
+        def search(query):
+            calls.append(query)
+            return pd.DataFrame({'title': [query.strip()]})
+
+        search('Toy Story')['title'] = 'changed'
+        self.assertEqual(search(' toy story!')['title'].tolist(), ['Toy Story'])
+        self.assertEqual(calls, ['Toy Story'])
+        self.assertEqual((search.cache.stats()['hits'], search.cache.stats()['misses']), (1, 1))
+
+    def test_equivalent_queries_share_a_key(self):
+        self.assertEqual(query_key('Toy Story'), query_key('  toy story! '))
+        self.assertNotEqual(query_key('Up'), query_key('Up!!'))
+
+
+class ResourceManagerTests(SimpleTestCase):
+    """
+    Concurrent first requests share one load, and a reload swaps the set without touching held ones.
+    """
+
+    def test_single_flight_load_and_atomic_reload(self):
+        loads = []
+
+        def loader():
+            loads.append(len(loads))
+            time.sleep(0.05)
+            return {'generation': len(loads)}
+
+        manager = ResourceManager(loader)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(manager.get())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(loads), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+
+        held = manager.get()
+        manager.reload()
+        self.assertEqual((held['generation'], manager.get()['generation']), (1, 2))
+
+
+class OffloaderTests(SimpleTestCase):
+    """
+    Identical in-flight calls run once, and calls beyond max_pending are rejected instead of queued.
+    """
+
+    def test_coalescing_and_backpressure(self):
+        offloader = Offloader(max_workers=2, max_pending=2)
+        release = threading.Event()
+        calls = []
+
+        def work(key):
+            calls.append(key)
+            release.wait(5)
+            return key
+
+        async def scenario():
+            same = [asyncio.ensure_future(offloader.run('a', lambda: work('a'))) for _ in range(3)]
+            other = asyncio.ensure_future(offloader.run('b', lambda: work('b')))
+            await asyncio.sleep(0)
+            with self.assertRaises(Overloaded):
+                await offloader.run('c', lambda: work('c'))
+            release.set()
+            return await asyncio.gather(*same, other)
+
+        self.assertEqual(asyncio.run(scenario()), ['a', 'a', 'a', 'b'])
+        self.assertEqual(sorted(calls), ['a', 'b'])
+        self.assertEqual({k: offloader.stats()[k] for k in ('submitted', 'coalesced', 'rejected', 'in_flight')},
+                         {'submitted': 2, 'coalesced': 2, 'rejected': 1, 'in_flight': 0})
+
+    def test_cancelling_one_coalesced_caller_keeps_the_others(self):
+        offloader = Offloader(max_workers=1, max_pending=4)
+        release = threading.Event()
+
+        async def scenario():
+            busy = asyncio.ensure_future(offloader.run('busy', lambda: release.wait(5)))
+            first = asyncio.ensure_future(offloader.run('k', lambda: 'result'))
+            second = asyncio.ensure_future(offloader.run('k', lambda: 'other'))
+            await asyncio.sleep(0)
+            first.cancel()
+            await asyncio.sleep(0)
+            release.set()
+            await busy
+            return first.cancelled(), await second
+
+        self.assertEqual(asyncio.run(scenario()), (True, 'result'))
+
+
+class JsonServerTests(SimpleTestCase):
+    """
+    The standalone service answers several requests over one keep-alive connection, /batch
+    returns one response per call, in order, with per-call errors, and workers dying at startup
+    are restarted with a growing delay until the server gives up.
+    """
+
+    def test_keep_alive_and_batch(self):
+        httpd = server.RecommendationServer(('127.0.0.1', 0), server.RecommendationHandler)
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+
+        def request(method, path, body=None):
+            connection.request(method, path, body=body)
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+
+        with mock.patch.dict(server.OPERATIONS, {'echo': lambda args: {'echo': args.get('q')}}):
+            connection = http.client.HTTPConnection('127.0.0.1', httpd.server_address[1], timeout=5)
+            self.addCleanup(connection.close)
+            self.assertEqual(request('GET', '/echo?q=a'), (200, {'echo': 'a'}))
+            sock = connection.sock
+            self.assertEqual(request('GET', '/missing')[0], 404)
+            status, payload = request('POST', '/batch', json.dumps({'requests': [
+                {'op': 'echo', 'q': 'b'}, {'op': 'nope'}, {'op': 'echo', 'q': 'c'}]}))
+
+        self.assertIs(connection.sock, sock)
+        self.assertEqual(status, 200)
+        self.assertEqual(payload['responses'][0], {'echo': 'b'})
+        self.assertIn('error', payload['responses'][1])
+        self.assertEqual(payload['responses'][2], {'echo': 'c'})
+
+    def test_failing_workers_back_off_then_stop(self):
+        delays = []
+        with mock.patch('engine.load_resources', return_value={'metadata': pd.DataFrame()}), \
+                mock.patch.object(server, '_serve_worker', lambda httpd: os._exit(3)), \
+                mock.patch.object(server.time, 'sleep', delays.append), mock.patch.object(server.signal, 'signal'):
+            server.serve('127.0.0.1', 0, workers=2)
+
+        self.assertEqual(delays, [server.SERVER_RESTART_BACKOFF * 2 ** i
+                                  for i in range(server.SERVER_MAX_FAILED_STARTS - 1)])
@@ -5,6 +5,11 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('matches/', views.matches, name='matches'),
     path('recommend/', views.recommend, name='recommend'),
+    path('recommend/batch', views.recommend_batch, name='recommend_batch'),
     path('top/', views.top_movies, name='top_movies'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
+    path('async/matches/', views.matches_async, name='matches_async'),
+    path('async/recommend/', views.recommend_async, name='recommend_async'),
+    path('async/top/', views.top_movies_async, name='top_movies_async'),
 
 ]
\ No newline at end of file
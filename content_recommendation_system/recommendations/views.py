@@ -1,8 +1,16 @@
-from typing import List, Dict
-from django.http import HttpRequest, HttpResponse
+import json
+from typing import List, Dict, Optional
+from django.http import HttpRequest, HttpResponse, JsonResponse
 from django.shortcuts import render
-from .forms import MovieSearchForm
-from engine import get_matches, get_recommendations_by_title, get_top_rated_movies
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .cache import cached
+from .forms import MovieSearchForm, FacetFilterForm
+from .offload import Overloaded, offloader
+from engine import (get_matches, get_recommendations_by_id, get_recommendations_batch, get_top_rated_movies,
+                    get_completions, resolve_title)
+from title_index import query_key
+from config import RECOMMEND_BATCH_MAX
 
 
 def home(request: HttpRequest) -> HttpResponse:
@@ -19,6 +27,127 @@ def home(request: HttpRequest) -> HttpResponse:
     return render(request, 'recommendations/home.html', {'form': form})
 
 
+def _match_records(query: str) -> List[Dict]:
+    """
+    Fuzzy-match a title query, one result per distinct title.
+
+    Args:
+        query (str): Partial or full movie title.
+
+    Returns:
+        List[Dict]: Matching movies, best match first.
+    """
+    results = get_matches(query).drop_duplicates(subset='title', keep='first')
+    return results.to_dict(orient='records')
+
+
+def _wants_json(request: HttpRequest) -> bool:
+    """
+    Whether the client asked for JSON (?format=json or an Accept header preferring it) instead of HTML.
+    """
+    if request.GET.get('format') == 'json':
+        return True
+    return request.accepts('application/json') and not request.accepts('text/html')
+
+
+def _respond(request: HttpRequest, template: str, context: Dict, form=None) -> HttpResponse:
+    """
+    Render a view's context as JSON or as the HTML template (with its form).
+    """
+    if _wants_json(request):
+        return JsonResponse(context)
+    return render(request, template, {**context, 'form': form} if form is not None else context)
+
+
+def _invalid_filters(request: HttpRequest, form: FacetFilterForm) -> Optional[HttpResponse]:
+    """
+    Answer 400 with the field errors when a JSON client sent invalid filters. HTML pages apply the
+    valid filters and show the errors on the form instead.
+    """
+    if form.is_valid() or not _wants_json(request):
+        return None
+    return JsonResponse({'errors': form.errors}, status=400)
+
+
+def _search_form(request: HttpRequest) -> MovieSearchForm:
+    """
+    Bind the title search form to the POSTed form, or to a 'title' GET parameter (JSON clients).
+    """
+    if request.method == 'POST':
+        return MovieSearchForm(request.POST)
+    return MovieSearchForm(request.GET if 'title' in request.GET else None)
+
+
+def _matches_context(query: str) -> Dict:
+    """
+    Search titles matching a query. Results are cached per normalized query and catalog version
+    (see cache.cached).
+
+    Args:
+        query (str): Partial or full movie title.
+
+    Returns:
+        Dict: Context with the 'query', its 'matches' and a 'message' when there are none.
+    """
+    matches = cached('matches', query_key(query), lambda: _match_records(query))
+    return {'query': query, 'matches': matches, 'message': "" if matches else "No matches found."}
+
+
+def _recommendation_context(movie_id: int, filters: Dict) -> Dict:
+    """
+    Recommend movies similar to a movie.
+
+    Args:
+        movie_id (int): Id of the reference movie.
+        filters (Dict): Engine filter arguments restricting the recommended movies.
+
+    Returns:
+        Dict: Template context with the 'recommendations' and, when empty, a 'message'.
+    """
+    recommendations = get_recommendations_by_id(movie_id, filters=filters)
+    if recommendations.empty:
+        return {'recommendations': [], 'message': "No similar titles match the filters."}
+
+    return {'recommendations': recommendations[['title', 'release_date', 'genres']].to_dict(orient='records')}
+
+
+def _recommend_context(title: str, filters: Dict) -> Dict:
+    """
+    Recommend movies similar to a title. An exact catalog title (as linked from the matches page)
+    skips fuzzy search. Results are cached per movie, filters and catalog version (see cache.cached).
+
+    Args:
+        title (str): Title typed or picked by the user.
+        filters (Dict): Engine filter arguments restricting the recommended movies.
+
+    Returns:
+        Dict: Context with the matched 'title', its 'recommendations' and a 'message' when there are none.
+    """
+    movie = resolve_title(title)
+    if movie is None:
+        return {'title': title, 'recommendations': [], 'message': "No similar titles found."}
+
+    movie_id, best_match = movie
+    context = cached('recommend', [movie_id, filters], lambda: _recommendation_context(movie_id, filters))
+    return {'title': best_match, **context}
+
+
+def _top_movies_context(filters: Dict) -> Dict:
+    """
+    List the top 100 movies by weighted rating. The list is cached per filters and catalog version
+    (see cache.cached).
+
+    Args:
+        filters (Dict): Engine filter arguments restricting the listed movies.
+
+    Returns:
+        Dict: Context with the 'top_movies' records.
+    """
+    top_movies = cached('top_movies', filters,
+                        lambda: get_top_rated_movies(filters=filters).to_dict(orient='records'))
+    return {'top_movies': top_movies}
+
+
 def matches(request: HttpRequest) -> HttpResponse:
     """
     Handle movie title search and return matching results using fuzzy search.
@@ -27,78 +156,204 @@ def matches(request: HttpRequest) -> HttpResponse:
         request (HttpRequest): The incoming HTTP request.
 
     Returns:
-        HttpResponse: Rendered results page with list of similar movie titles or a message if none found.
+        HttpResponse: Rendered results page (or JSON) with list of similar movie titles or a message if none found.
     """
-    form = MovieSearchForm()
-    matches: List[Dict] = []
-    query: str = ""
-    message: str = ""
-
-    if request.method == 'POST':
-        form = MovieSearchForm(request.POST)
-        if form.is_valid():
-            query = form.cleaned_data['title']
-            results = get_matches(query)
-            results = results.drop_duplicates(subset='title', keep='first')
-
-            if not results.empty:
-                matches = results.to_dict(orient='records')
-            else:
-                message = "No matches found."
-
-    return render(request, 'recommendations/matches.html', {
-        'form': form,
-        'query': query,
-        'matches': matches,
-        'message': message,
-    })
+    form = _search_form(request)
+    context: Dict = {'query': "", 'matches': [], 'message': ""}
+    if form.is_bound and form.is_valid():
+        context = _matches_context(form.cleaned_data['title'])
+    return _respond(request, 'recommendations/matches.html', context, form)
 
 
 def recommend(request: HttpRequest) -> HttpResponse:
     """
     Generate and display movie recommendations based on the most similar title.
 
+    Optional 'genre', 'director', 'year_from' and 'year_to' GET parameters restrict the recommended movies.
+    Invalid ones are ignored and shown on the form, or answered with 400 and the field errors for JSON clients.
+
     Args:
         request (HttpRequest): The incoming HTTP request.
 
     Returns:
-        HttpResponse: Rendered recommendations page with similar movies.
+        HttpResponse: Rendered recommendations page (or JSON) with similar movies.
     """
     title: str = request.GET.get('title', '')
 
     if not title:
         return render(request, 'recommendations/home.html', {'form': MovieSearchForm()})
 
-    matches_df = get_matches(title)
-    if matches_df.empty:
-        return render(request, 'recommendations/recommendations.html', {
-            'title': title,
-            'recommendations': [],
-            'message': "No similar titles found."
-        })
-
-    best_match: str = matches_df.iloc[0]['title']
-    recommendations = get_recommendations_by_title(best_match)
+    form = FacetFilterForm(request.GET)
+    invalid = _invalid_filters(request, form)
+    if invalid is not None:
+        return invalid
 
-    return render(request, 'recommendations/recommendations.html', {
-        'title': best_match,
-        'recommendations': recommendations[['title', 'release_date', 'genres']].to_dict(orient='records')
-    })
+    context = _recommend_context(title, form.filters())
+    return _respond(request, 'recommendations/recommendations.html', context, form)
 
 
 def top_movies(request: HttpRequest) -> HttpResponse:
     """
     Display a list of the top 100 highest-rated movies based on IMDb-style weighted rating.
 
+    Optional 'genre', 'director', 'year_from' and 'year_to' GET parameters filter the list. Invalid ones
+    are ignored and shown on the form, or answered with 400 and the field errors for JSON clients.
+
+    Args:
+        request (HttpRequest): The incoming HTTP request.
+
+    Returns:
+        HttpResponse: Rendered page (or JSON) with top 100 movies.
+    """
+    form = FacetFilterForm(request.GET)
+    invalid = _invalid_filters(request, form)
+    if invalid is not None:
+        return invalid
+    return _respond(request, 'recommendations/top_movies.html', _top_movies_context(form.filters()), form)
+
+
+def _overloaded(request: HttpRequest) -> HttpResponse:
+    """
+    Answer 503 with Retry-After when the offload queue is full.
+    """
+    message = "The server is busy, please retry shortly."
+    response = (JsonResponse({'error': message}, status=503) if _wants_json(request)
+                else HttpResponse(message, status=503, content_type='text/plain'))
+    response['Retry-After'] = '1'
+    return response
+
+
+async def matches_async(request: HttpRequest) -> HttpResponse:
+    """
+    Async version of matches: the search runs on the bounded offload pool, and identical
+    in-flight searches are coalesced into one.
+
+    Args:
+        request (HttpRequest): The incoming HTTP request.
+
+    Returns:
+        HttpResponse: Same as matches, or 503 when the server is overloaded.
+    """
+    form = _search_form(request)
+    context: Dict = {'query': "", 'matches': [], 'message': ""}
+    if form.is_bound and form.is_valid():
+        query = form.cleaned_data['title']
+        try:
+            context = await offloader.run(('matches', query_key(query)), lambda: _matches_context(query))
+        except Overloaded:
+            return _overloaded(request)
+    return _respond(request, 'recommendations/matches.html', context, form)
+
+
+async def recommend_async(request: HttpRequest) -> HttpResponse:
+    """
+    Async version of recommend: title resolution and recommendations run on the bounded offload
+    pool, and identical in-flight requests are coalesced into one.
+
     Args:
         request (HttpRequest): The incoming HTTP request.
 
     Returns:
-        HttpResponse: Rendered page with top 100 movies.
+        HttpResponse: Same as recommend, or 503 when the server is overloaded.
     """
-    top_movies_df = get_top_rated_movies()
-    top_movies: List[Dict] = top_movies_df.to_dict(orient='records')
+    title: str = request.GET.get('title', '')
+
+    if not title:
+        return render(request, 'recommendations/home.html', {'form': MovieSearchForm()})
+
+    form = FacetFilterForm(request.GET)
+    invalid = _invalid_filters(request, form)
+    if invalid is not None:
+        return invalid
+
+    filters = form.filters()
+    # Keyed on the title as given: an exact catalog title resolves without fuzzy search, so spellings
+    # that normalize alike ('Up', 'UP!') can still resolve to different movies
+    key = ('recommend', title, json.dumps(filters, sort_keys=True))
+    try:
+        context = await offloader.run(key, lambda: _recommend_context(title, filters))
+    except Overloaded:
+        return _overloaded(request)
+    return _respond(request, 'recommendations/recommendations.html', context, form)
 
-    return render(request, 'recommendations/top_movies.html', {
-        'top_movies': top_movies
+
+async def top_movies_async(request: HttpRequest) -> HttpResponse:
+    """
+    Async version of top_movies: ranking runs on the bounded offload pool, and identical in-flight
+    requests are coalesced into one.
+
+    Args:
+        request (HttpRequest): The incoming HTTP request.
+
+    Returns:
+        HttpResponse: Same as top_movies, or 503 when the server is overloaded.
+    """
+    form = FacetFilterForm(request.GET)
+    invalid = _invalid_filters(request, form)
+    if invalid is not None:
+        return invalid
+
+    filters = form.filters()
+    try:
+        context = await offloader.run(('top_movies', json.dumps(filters, sort_keys=True)),
+                                      lambda: _top_movies_context(filters))
+    except Overloaded:
+        return _overloaded(request)
+    return _respond(request, 'recommendations/top_movies.html', context, form)
+
+
+@csrf_exempt
+@require_POST
+def recommend_batch(request: HttpRequest) -> JsonResponse:
+    """
+    Generate recommendations for many movies at once (JSON API for batch jobs).
+
+    Expects a JSON body {"titles": [...], "ids": [...], "top_n": 15}; either list may be omitted.
+    A title or id given more than once gets a single result entry.
+
+    Args:
+        request (HttpRequest): The incoming HTTP request.
+
+    Returns:
+        JsonResponse: {'results': [{'query': ..., 'recommendations': [...]}, ...], 'not_found': [...]},
+                      or a 400 error for malformed or oversized requests.
+    """
+    try:
+        payload = json.loads(request.body or b'{}')
+        titles, ids = payload.get('titles', []), payload.get('ids', [])
+        if not isinstance(titles, list) or not isinstance(ids, list):
+            raise TypeError("'titles' and 'ids' must be lists.")
+        titles = list(dict.fromkeys(str(title) for title in titles))
+        ids = list(dict.fromkeys(int(movie_id) for movie_id in ids))
+        top_n = int(payload.get('top_n', 15))
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'error': "Expected a JSON object with 'titles' and/or 'ids' lists."}, status=400)
+
+    if len(titles) + len(ids) > RECOMMEND_BATCH_MAX or not 1 <= top_n <= 100:
+        return JsonResponse({'error': f"At most {RECOMMEND_BATCH_MAX} movies and 1-100 results per movie."},
+                            status=400)
+
+    recommendations = get_recommendations_batch(titles=titles, ids=ids, top_n=top_n)
+    grouped = {query: group.drop(columns='query').to_dict(orient='records')
+               for query, group in recommendations.groupby('query', sort=False)}
+
+    return JsonResponse({
+        'results': [{'query': query, 'recommendations': grouped[query]} for query in titles + ids if query in grouped],
+        'not_found': [query for query in titles + ids if query not in grouped],
     })
+
+
+def autocomplete(request: HttpRequest) -> JsonResponse:
+    """
+    Return typeahead completions for a partially typed title, most popular first.
+
+    Served from an in-memory prefix index, so it is cheap enough to call on every keystroke.
+
+    Args:
+        request (HttpRequest): The incoming HTTP request with the typed text in the 'q' GET parameter.
+
+    Returns:
+        JsonResponse: {'query': ..., 'completions': [{'id', 'title', 'year'}, ...]}.
+    """
+    query: str = request.GET.get('q', '')[:100]
+    return JsonResponse({'query': query, 'completions': get_completions(query)})
@@ -0,0 +1,277 @@
+import argparse
+import http.client
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+import numpy as np
+import pandas as pd
+import engine
+from embeddings import build_embeddings
+from indexes import DotProductIndex, LSHIndex, create_index
+from utils import load_model, load_csr_matrix
+from logging_config import setup_logging
+from config import MATRIX_PATH, MATRIX_DIR, ARTIFACT_STORAGE, SERVER_HOST, SERVER_PORT
+
+logger = setup_logging()
+
+
+def recall_at_k(approx_indices, exact_indices):
+    """
+    Computes the mean recall@k of approximate neighbor lists against exact ones.
+
+    Args:
+        approx_indices (np.ndarray): Approximate neighbor positions, shape (n_queries, k).
+        exact_indices (np.ndarray): Exact neighbor positions, shape (n_queries, k).
+
+    Returns:
+        float: Average fraction of the exact neighbors found by the approximate search.
+    """
+    hits = [len(np.intersect1d(approx, exact)) / len(exact) for approx, exact in zip(approx_indices, exact_indices)]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def _timed_kneighbors(index, queries, k):
+    """
+    Runs one kneighbors call per query row, as the web views do.
+
+    Returns:
+        tuple: (neighbor indices of shape (n_queries, k), mean latency in milliseconds).
+    """
+    results = []
+    start = time.perf_counter()
+    for row in range(queries.shape[0]):
+        _, neighbors = index.kneighbors(queries[row], n_neighbors=k)
+        results.append(neighbors[0])
+    elapsed = time.perf_counter() - start
+    return np.vstack(results), elapsed * 1000 / max(queries.shape[0], 1)
+
+
+def index_recall_report(count_matrix, lsh_configs=None, k=10, n_queries=200, random_state=0):
+    """
+    Compares LSH index configurations with the exact brute-force baseline.
+
+    Args:
+        count_matrix (csr_matrix): Movie feature matrix.
+        lsh_configs (list[dict], optional): LSHIndex keyword arguments to evaluate.
+        k (int): Number of neighbors per query.
+        n_queries (int): Number of randomly sampled catalog movies used as queries.
+        random_state (int): Seed for the query sample.
+
+    Returns:
+        pd.DataFrame: One row per index with recall@k, mean query latency and speedup over brute force.
+    """
+    if lsh_configs is None:
+        lsh_configs = [
+            {'n_tables': 4, 'n_bits': 14, 'n_probes': 2},
+            {'n_tables': 8, 'n_bits': 12, 'n_probes': 4},
+            {'n_tables': 16, 'n_bits': 10, 'n_probes': 6},
+        ]
+
+    rng = np.random.default_rng(random_state)
+    sample = rng.choice(count_matrix.shape[0], size=min(n_queries, count_matrix.shape[0]), replace=False)
+    queries = count_matrix[sample]
+
+    baseline = create_index('brute').fit(count_matrix)
+    exact, brute_ms = _timed_kneighbors(baseline, queries, k)
+    rows = [{'index': 'brute', 'params': '', f'recall@{k}': 1.0, 'latency_ms': brute_ms, 'speedup': 1.0}]
+
+    for params in lsh_configs:
+        index = LSHIndex(**params).fit(count_matrix)
+        approx, lsh_ms = _timed_kneighbors(index, queries, k)
+        rows.append({
+            'index': 'lsh',
+            'params': ', '.join(f'{key}={value}' for key, value in params.items()),
+            f'recall@{k}': recall_at_k(approx, exact),
+            'latency_ms': lsh_ms,
+            'speedup': brute_ms / lsh_ms if lsh_ms else np.nan,
+        })
+    return pd.DataFrame(rows)
+
+
+def embedding_quality_report(count_matrix, dims=(64, 128, 256), k=10, n_queries=200, random_state=0):
+    """
+    Compares dense SVD embeddings of several sizes with exact search on the sparse feature matrix.
+
+    Args:
+        count_matrix (csr_matrix): Movie feature matrix.
+        dims (tuple[int]): Embedding dimensions to evaluate.
+        k (int): Number of neighbors per query.
+        n_queries (int): Number of randomly sampled catalog movies used as queries.
+        random_state (int): Seed for the query sample.
+
+    Returns:
+        pd.DataFrame: One row per search space with recall@k against the sparse neighbors, build time,
+                      mean per-query latency and the time of one batched (GEMM) call over all queries.
+    """
+    rng = np.random.default_rng(random_state)
+    sample = rng.choice(count_matrix.shape[0], size=min(n_queries, count_matrix.shape[0]), replace=False)
+
+    def measure(name, vectors, build_s, exact=None):
+        index = DotProductIndex().fit(vectors)
+        queries = vectors[sample]
+        neighbors, query_ms = _timed_kneighbors(index, queries, k)
+        start = time.perf_counter()
+        index.kneighbors(queries, n_neighbors=k)
+        batch_ms = (time.perf_counter() - start) * 1000
+        return neighbors, {
+            'space': name,
+            f'recall@{k}': 1.0 if exact is None else recall_at_k(neighbors, exact),
+            'build_s': build_s,
+            'latency_ms': query_ms,
+            'batch_ms': batch_ms,
+        }
+
+    exact, baseline = measure('sparse', count_matrix, 0.0)
+    rows = [baseline]
+    for dim in dims:
+        start = time.perf_counter()
+        embeddings, _ = build_embeddings(count_matrix, dim)
+        build_s = time.perf_counter() - start
+        rows.append(measure(f'svd-{embeddings.shape[1]}', embeddings, build_s, exact)[1])
+    return pd.DataFrame(rows)
+
+
+def batch_throughput_report(titles, top_n=15, repeats=3):
+    """
+    Compares the per-title recommendation loop with one batch call over the same titles.
+
+    The engine caches are cleared before every timed run, so the loop measures recommendations
+    rather than memoized hits (see engine.clear_caches). Each method keeps its best of `repeats` runs.
+
+    Args:
+        titles (list[str]): Reference movie titles.
+        top_n (int): Recommendations per title.
+        repeats (int): Timed runs per method.
+
+    Returns:
+        pd.DataFrame: One row per method with total time and titles per second.
+    """
+    engine.load_resources()
+
+    def timed(run):
+        best = float('inf')
+        for _ in range(repeats):
+            engine.clear_caches()
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    loop_s = timed(lambda: [engine.get_recommendations_by_title(title, top_n=top_n) for title in titles])
+    batch_s = timed(lambda: engine.get_recommendations_batch(titles=titles, top_n=top_n))
+
+    return pd.DataFrame([
+        {'method': 'per-title loop', 'titles': len(titles), 'seconds': loop_s, 'titles_per_s': len(titles) / loop_s},
+        {'method': 'batch', 'titles': len(titles), 'seconds': batch_s, 'titles_per_s': len(titles) / batch_s},
+    ])
+
+
+def _http_load(base_url, requests, concurrency):
+    """
+    Sends requests over keep-alive connections, one per client thread.
+
+    Args:
+        base_url (str): Server URL, e.g. http://127.0.0.1:8100/
+        requests (list[tuple]): (method, path, body or None) per request.
+        concurrency (int): Client threads.
+
+    Returns:
+        tuple: (latencies in milliseconds, number of non-200 responses, elapsed seconds).
+    """
+    url = urlsplit(base_url)
+    prefix = url.path.rstrip('/')
+    local = threading.local()
+
+    def send(request):
+        method, path, body = request
+        start = time.perf_counter()
+        for attempt in range(2):
+            if getattr(local, 'connection', None) is None:
+                local.connection = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+            try:
+                local.connection.request(method, prefix + path, body=body,
+                                         headers={'Content-Type': 'application/json', 'Accept': 'application/json'})
+                response = local.connection.getresponse()
+                response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    local.connection.close()
+                    local.connection = None
+                return (time.perf_counter() - start) * 1000, response.status
+            except (http.client.HTTPException, OSError):
+                local.connection.close()
+                local.connection = None
+                if attempt:
+                    raise
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, requests))
+    return [latency for latency, _ in results], sum(status != 200 for _, status in results), time.perf_counter() - start
+
+
+def serving_latency_report(titles, service_url, django_url=None, concurrency=4, batch_size=50):
+    """
+    Compares recommendation latency and throughput of the standalone JSON service (server.py) with
+    the Django views, for the same titles. Both servers must be running. Every target is sent its
+    requests once before the timed pass, so all of them are measured with warm caches.
+
+    Args:
+        titles (list[str]): Reference movie titles, one request each.
+        service_url (str): Base URL of server.py, e.g. http://127.0.0.1:8100/
+        django_url (str, optional): Base URL of the Django site, e.g. http://127.0.0.1:8000/
+        concurrency (int): Concurrent keep-alive client connections.
+        batch_size (int): Titles per POST /batch request.
+
+    Returns:
+        pd.DataFrame: One row per target with titles per second and p50/p95 latency per request.
+    """
+    targets = {
+        'service GET /recommend': (service_url, [
+            ('GET', '/recommend?' + urlencode({'title': title}), None) for title in titles]),
+        f'service POST /batch ({batch_size} titles)': (service_url, [
+            ('POST', '/batch', json.dumps({'requests': [{'op': 'recommend', 'title': title}
+                                                        for title in titles[i:i + batch_size]]}))
+            for i in range(0, len(titles), batch_size)]),
+    }
+    if django_url:
+        targets['django recommend (JSON)'] = (django_url, [
+            ('GET', '/recommend/?' + urlencode({'title': title, 'format': 'json'}), None) for title in titles])
+        targets['django recommend (HTML)'] = (django_url, [
+            ('GET', '/recommend/?' + urlencode({'title': title}), None) for title in titles])
+
+    rows = []
+    for name, (base_url, requests) in targets.items():
+        _http_load(base_url, requests, concurrency)
+        latencies, failed, seconds = _http_load(base_url, requests, concurrency)
+        rows.append({'target': name, 'requests': len(requests), 'failed': failed, 'seconds': seconds,
+                     'titles_per_s': len(titles) / seconds, 'p50_ms': np.percentile(latencies, 50),
+                     'p95_ms': np.percentile(latencies, 95)})
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks, or a serving comparison against running servers.")
+    parser.add_argument('--service-url', help=f"Run the serving comparison against server.py, "
+                                              f"e.g. http://{SERVER_HOST}:{SERVER_PORT}/")
+    parser.add_argument('--django-url', help="Include the Django views, e.g. http://127.0.0.1:8000/")
+    parser.add_argument('--titles', type=int, default=1000, help="Titles requested in the serving comparison.")
+    options = parser.parse_args()
+
+    if options.service_url:
+        metadata = engine.load_resources()['metadata']
+        sample = metadata['title'].drop_duplicates().sample(frac=1, random_state=0).head(options.titles).tolist()
+        report = serving_latency_report(sample, options.service_url, options.django_url)
+        logger.info("\n" + report.to_string(index=False))
+    else:
+        matrix = load_csr_matrix(MATRIX_DIR) if ARTIFACT_STORAGE == 'mmap' else load_model(MATRIX_PATH)
+        if matrix is None:
+            logger.error("Count matrix not found. Run main.py or start the web app once to build it.")
+        else:
+            logger.info("\n" + index_recall_report(matrix).to_string(index=False))
+            logger.info("\n" + embedding_quality_report(matrix).to_string(index=False))
+
+            metadata = engine.load_resources()['metadata']
+            sample = metadata['title'].drop_duplicates().sample(frac=1, random_state=0)
+            logger.info("\n" + batch_throughput_report(sample.head(1000).tolist()).to_string(index=False))
@@ -0,0 +1,399 @@
+import hashlib
+import json
+import os
+from collections import namedtuple
+from catalog import load_snapshot, persist_catalog, read_delta_log, read_snapshot, replay_delta_log
+from data_preprocessing import extract_raw_data, get_or_build_count_matrix, load_and_merge_metadata
+from ingestion import ingest_streaming
+from metadata_cache import CACHE_FORMAT_VERSION, load_metadata_cache
+from embeddings import build_embeddings
+from indexes import DotProductIndex, index_is_persisted, train_model
+from neighbor_table import build_neighbor_table
+from utils import VERSION_POINTER, file_lock, load_csr_matrix, load_model, load_vocabulary, load_array, save_array, save_model
+from logging_config import setup_logging
+from config import (ARTIFACT_LOCK_PATH, ARTIFACT_STORAGE, BM25_PARAMS, BUILD_MANIFEST_PATH, DATA_DIR, EMBEDDING_DIM,
+                    EMBEDDING_PATH, FIELD_WEIGHTS, HASH_BUCKETS, INDEX_BACKEND, INGESTION_MODE, LSH_PARAMS, MATRIX_DIR,
+                    MATRIX_PATH, MERGED_CACHE_PATH, MODEL_PATH, NEIGHBOR_DISTANCES_PATH, NEIGHBOR_INDICES_PATH,
+                    NEIGHBOR_TABLE_K, SVD_MODEL_PATH, VECTORIZER_SCHEME, VOCABULARY_PATH, WEIGHTING_PATH)
+
+logger = setup_logging()
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# One build step: its upstream stages, raw input files, the source modules its output depends on,
+# the parameters that change its output and the files it writes.
+Stage = namedtuple('Stage', ['name', 'deps', 'inputs', 'code', 'params', 'outputs', 'build'])
+
+
+def raw_paths():
+    """
+    Returns:
+        list[str]: Paths of the three raw CSV files.
+    """
+    return [os.path.join(DATA_DIR, name) for name in ('movies_metadata.csv', 'credits.csv', 'keywords.csv')]
+
+
+def matrix_outputs():
+    """
+    Returns:
+        list[str]: Files written for the count matrix in the configured storage mode.
+    """
+    if ARTIFACT_STORAGE == 'mmap':
+        matrix_files = [os.path.join(MATRIX_DIR, VERSION_POINTER)]
+    else:
+        matrix_files = [MATRIX_PATH]
+    return matrix_files + [VOCABULARY_PATH, WEIGHTING_PATH]
+
+
+def model_outputs():
+    """
+    Returns:
+        list[str]: Files written for the nearest-neighbor model (none when the index is refitted at
+                   load time, see indexes.index_is_persisted).
+    """
+    return [MODEL_PATH] if index_is_persisted() else []
+
+
+def _load_count_matrix():
+    """
+    Returns:
+        csr_matrix or None: The saved count matrix in the configured storage mode.
+    """
+    if ARTIFACT_STORAGE == 'mmap':
+        return load_csr_matrix(MATRIX_DIR, mmap_mode='r')
+    return load_model(MATRIX_PATH)
+
+
+def _load_vectors():
+    """
+    Returns:
+        csr_matrix or np.ndarray: What similarity search runs on: the saved embeddings in embedding
+                                  mode, otherwise the count matrix.
+    """
+    if EMBEDDING_DIM:
+        return load_array(EMBEDDING_PATH)
+    return _load_count_matrix()
+
+
+def _build_merged():
+    """
+    Rebuilds the merged metadata cache from the raw files. In streaming mode the count
+    matrix is produced in the same pass.
+
+    Returns:
+        list[str]: Other stages built along the way.
+    """
+    metadata_path, credits_path, keywords_path = raw_paths()
+    if INGESTION_MODE == 'streaming':
+        if os.path.exists(MERGED_CACHE_PATH):
+            os.remove(MERGED_CACHE_PATH)
+        ingest_streaming(metadata_path, credits_path, keywords_path, MERGED_CACHE_PATH, MATRIX_PATH,
+                         MATRIX_DIR, storage=ARTIFACT_STORAGE, vocabulary_path=VOCABULARY_PATH,
+                         weighting_path=WEIGHTING_PATH)
+        return ['matrix']
+
+    if os.path.exists(MERGED_CACHE_PATH):
+        os.remove(MERGED_CACHE_PATH)
+    load_and_merge_metadata(metadata_path, credits_path, keywords_path, MERGED_CACHE_PATH)
+    return []
+
+
+def _build_matrix():
+    """
+    Re-vectorizes the cleaned features of the merged metadata.
+
+    Returns:
+        list[str]: Other stages built along the way.
+    """
+    metadata = load_metadata_cache(MERGED_CACHE_PATH)
+    for path in matrix_outputs():
+        if os.path.exists(path):
+            os.remove(path)
+    get_or_build_count_matrix(metadata, MATRIX_PATH, MATRIX_DIR, storage=ARTIFACT_STORAGE,
+                              vocabulary_path=VOCABULARY_PATH, weighting_path=WEIGHTING_PATH)
+    return []
+
+
+def _build_embeddings():
+    """
+    Reduces the count matrix to dense embeddings and saves them with the fitted SVD.
+
+    Returns:
+        list[str]: Other stages built along the way.
+    """
+    embeddings, svd = build_embeddings(_load_count_matrix(), EMBEDDING_DIM)
+    save_array(embeddings, EMBEDDING_PATH)
+    save_model(svd, SVD_MODEL_PATH)
+    return []
+
+
+def _build_model():
+    """
+    Retrains the nearest-neighbor model on the count matrix.
+
+    Returns:
+        list[str]: Other stages built along the way.
+    """
+    if model_outputs():
+        save_model(train_model(_load_count_matrix(), INDEX_BACKEND), MODEL_PATH)
+    return []
+
+
+def _build_neighbors():
+    """
+    Recomputes the top-K neighbor table from the count matrix (or the embeddings).
+
+    Returns:
+        list[str]: Other stages built along the way.
+    """
+    neighbor_indices, neighbor_distances = build_neighbor_table(_load_vectors(), top_k=NEIGHBOR_TABLE_K)
+    save_array(neighbor_indices, NEIGHBOR_INDICES_PATH)
+    save_array(neighbor_distances, NEIGHBOR_DISTANCES_PATH)
+    return []
+
+
+def stages():
+    """
+    Describes the build graph: raw -> merged -> matrix -> [embeddings] -> (model, neighbors).
+    The embeddings stage only exists when EMBEDDING_DIM is set.
+
+    Returns:
+        list[Stage]: Stages in dependency order.
+    """
+    vectors = 'embeddings' if EMBEDDING_DIM else 'matrix'
+    embedding_stages = [
+        Stage('embeddings', ['matrix'], [],
+              ['embeddings.py'],
+              {'dim': EMBEDDING_DIM},
+              [EMBEDDING_PATH, SVD_MODEL_PATH], _build_embeddings),
+    ] if EMBEDDING_DIM else []
+    return [
+        Stage('merged', [], raw_paths(),
+              ['data_cleaning.py', 'data_preprocessing.py', 'ingestion.py', 'metadata_cache.py'],
+              {'cache_format': CACHE_FORMAT_VERSION},
+              [MERGED_CACHE_PATH], _build_merged),
+        Stage('matrix', ['merged'], [],
+              ['data_preprocessing.py', 'ingestion.py', 'utils.py', 'vectorization.py'],
+              {'storage': ARTIFACT_STORAGE, 'scheme': VECTORIZER_SCHEME, 'field_weights': FIELD_WEIGHTS,
+               'bm25': BM25_PARAMS, 'hash_buckets': HASH_BUCKETS},
+              matrix_outputs(), _build_matrix),
+    ] + embedding_stages + [
+        Stage('model', ['matrix'], [],
+              ['indexes.py'],
+              {'backend': INDEX_BACKEND, 'lsh': LSH_PARAMS, 'storage': ARTIFACT_STORAGE, 'embeddings': EMBEDDING_DIM},
+              model_outputs(), _build_model),
+        Stage('neighbors', [vectors], [],
+              ['neighbor_table.py'],
+              {'top_k': NEIGHBOR_TABLE_K, 'vectors': vectors},
+              [NEIGHBOR_INDICES_PATH, NEIGHBOR_DISTANCES_PATH], _build_neighbors),
+    ]
+
+
+def load_manifest(path=None):
+    """
+    Loads the build manifest (stage keys and cached raw file hashes).
+
+    Returns:
+        dict: Manifest with 'stages' and 'files' entries (empty if missing or unreadable).
+    """
+    path = path or BUILD_MANIFEST_PATH
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        return {'stages': manifest.get('stages', {}), 'files': manifest.get('files', {})}
+    except (OSError, ValueError):
+        return {'stages': {}, 'files': {}}
+
+
+def save_manifest(manifest, path=None):
+    """
+    Atomically writes the build manifest.
+
+    Returns:
+        None
+    """
+    path = path or BUILD_MANIFEST_PATH
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def file_hash(path, manifest):
+    """
+    Returns the SHA-256 of a file's content. Hashes are cached in the manifest by size and
+    modification time, so unchanged multi-hundred-megabyte CSVs are not re-read on every start.
+
+    Returns:
+        str or None: Hex digest, or None if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    cached = manifest['files'].get(path)
+    if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+        return cached['sha256']
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    manifest['files'][path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+    return digest.hexdigest()
+
+
+def stage_keys(manifest):
+    """
+    Computes the key of every stage: a hash of its raw inputs, source code, parameters and
+    the keys of its upstream stages. A stage whose key changed must be rebuilt.
+
+    Returns:
+        dict: Stage name -> key.
+    """
+    keys = {}
+    for stage in stages():
+        digest = hashlib.sha256(stage.name.encode())
+        for path in stage.inputs:
+            digest.update(f"input:{os.path.basename(path)}:{file_hash(path, manifest)};".encode())
+        for module in stage.code:
+            digest.update(f"code:{module}:{file_hash(os.path.join(SRC_DIR, module), manifest)};".encode())
+        digest.update(f"params:{json.dumps(stage.params, sort_keys=True)};".encode())
+        for dep in stage.deps:
+            digest.update(f"dep:{dep}:{keys[dep]};".encode())
+        keys[stage.name] = digest.hexdigest()
+    return keys
+
+
+def stale_stages(manifest=None):
+    """
+    Lists the stages whose recorded key differs from the current one or whose outputs are missing.
+
+    Returns:
+        list[str]: Names of stale stages, in build order.
+    """
+    manifest = manifest or load_manifest()
+    keys = stage_keys(manifest)
+    return [stage.name for stage in stages()
+            if manifest['stages'].get(stage.name) != keys[stage.name]
+            or not all(os.path.exists(path) for path in stage.outputs)]
+
+
+def ensure_artifacts(zip_path=None):
+    """
+    Brings every artifact up to date, rebuilding only the stale stages.
+
+    When the delta log holds catalog updates that the published snapshot does not (e.g. after a
+    rebuild from the raw files), they are replayed into a new snapshot so they survive the rebuild.
+
+    Every serving process calls this at startup, so the check and the rebuild run under an
+    exclusive lock on ARTIFACT_LOCK_PATH: a process that waited for another one's build finds the
+    artifacts up to date instead of rewriting them underneath it.
+
+    Args:
+        zip_path (str, optional): raw_data.zip to extract when the raw CSVs are missing.
+
+    Returns:
+        list[str]: Names of the stages that were rebuilt.
+    """
+    with file_lock(ARTIFACT_LOCK_PATH):
+        if zip_path:
+            extract_raw_data(zip_path, DATA_DIR)
+
+        manifest = load_manifest()
+        keys = stage_keys(manifest)
+        rebuilt = []
+        for stage in stages():
+            if stage.name in rebuilt:
+                continue  # Already produced by an upstream stage (e.g. the matrix by streaming ingestion)
+            up_to_date = (manifest['stages'].get(stage.name) == keys[stage.name]
+                          and all(os.path.exists(path) for path in stage.outputs))
+            if up_to_date and not any(dep in rebuilt for dep in stage.deps):
+                continue
+
+            logger.info(f"Rebuilding stale stage '{stage.name}'...")
+            also_built = stage.build()
+            for name in [stage.name] + also_built:
+                manifest['stages'][name] = keys[name]
+                rebuilt.append(name)
+            save_manifest(manifest)
+
+        save_manifest(manifest)
+        if read_delta_log() and current_snapshot(manifest) is None:
+            _replay_catalog_deltas(manifest)
+    return rebuilt
+
+
+def build_id(manifest):
+    """
+    Identifies a complete base build (before catalog updates) by the keys of all its stages.
+
+    Returns:
+        str: Hex digest.
+    """
+    return hashlib.sha256(json.dumps(manifest['stages'], sort_keys=True).encode()).hexdigest()
+
+
+def current_snapshot(manifest=None):
+    """
+    Returns the published catalog snapshot if it holds the current base build plus every batch of
+    the delta log, i.e. if it is what should be served.
+
+    Returns:
+        dict or None: Snapshot pointer (see catalog.read_snapshot), or None.
+    """
+    manifest = manifest or load_manifest()
+    snapshot = read_snapshot()
+    if snapshot and snapshot.get('base') == build_id(manifest) and snapshot.get('deltas') == len(read_delta_log()):
+        return snapshot
+    return None
+
+
+def artifacts_complete(manifest=None):
+    """
+    Tells whether the artifacts on disk form a complete set that can be loaded: no stage is stale
+    and, when catalog updates were logged, a snapshot holding all of them is published. While a
+    rebuild or a delta replay is in progress this is False.
+
+    Returns:
+        bool: Whether the artifacts are complete.
+    """
+    manifest = manifest or load_manifest()
+    return not stale_stages(manifest) and (not read_delta_log() or current_snapshot(manifest) is not None)
+
+
+def _replay_catalog_deltas(manifest):
+    """
+    Applies the catalog delta log to the base artifacts and publishes the result as a new snapshot.
+    A snapshot of the same base build holding only the first batches (e.g. after an interrupted
+    update) is continued instead of starting over.
+
+    Returns:
+        None
+    """
+    base = build_id(manifest)
+    log = read_delta_log()
+    snapshot = read_snapshot()
+    resources = None
+    if snapshot and snapshot.get('base') == base and snapshot.get('deltas', 0) < len(log):
+        resources = load_snapshot(snapshot)
+    if resources is not None:
+        start = snapshot['deltas']
+    else:
+        start = 0
+        resources = {
+            'metadata': load_metadata_cache(MERGED_CACHE_PATH),
+            'count_matrix': _load_count_matrix(),
+            'vectors': _load_vectors(),
+            'neighbor_indices': load_array(NEIGHBOR_INDICES_PATH),
+            'neighbor_distances': load_array(NEIGHBOR_DISTANCES_PATH),
+            'weighting_path': WEIGHTING_PATH,
+            'vocabulary_path': VOCABULARY_PATH,
+        }
+        resources['nn_model'] = load_model(MODEL_PATH) if index_is_persisted() \
+            else DotProductIndex().fit(resources['vectors'])
+
+    logger.info(f"Replaying catalog delta log from batch {start + 1} of {len(log)}...")
+    weighting = load_model(resources['weighting_path'])
+    resources, vocabulary = replay_delta_log(resources, load_vocabulary(resources['vocabulary_path']), weighting,
+                                             start=start)
+    persist_catalog(resources, vocabulary, weighting, base, len(log))
@@ -0,0 +1,336 @@
+import json
+import os
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix, vstack
+from data_cleaning import clean_features
+from data_preprocessing import FEATURE_COLUMNS
+from vectorization import create_vocabulary
+from metadata_cache import load_metadata_cache, read_cache_header, save_metadata_cache
+from neighbor_table import normalize_rows, query_top_k
+from indexes import DotProductIndex, index_is_persisted, update_index
+from embeddings import project_embeddings
+from utils import (save_model, load_model, save_array, load_array, save_csr_matrix, load_csr_matrix,
+                   save_vocabulary, to_dense, new_version_dir, publish_version, read_version)
+from logging_config import setup_logging
+from config import (MERGED_CACHE_PATH, NEIGHBOR_BLOCK_SIZE, ARTIFACT_STORAGE, DELTA_LOG_PATH, DELTA_DIR,
+                    EMBEDDING_DIM, SVD_MODEL_PATH, CATALOG_DIR)
+
+logger = setup_logging()
+
+
+def prepare_movies(movies):
+    """
+    Cleans new or updated movies given in the raw dataset format.
+
+    Args:
+        movies (pd.DataFrame): One row per movie with the movies_metadata.csv columns plus the raw
+                               'cast', 'crew' (credits.csv) and 'keywords' (keywords.csv) strings.
+                               Missing feature columns are treated as empty lists.
+
+    Returns:
+        pd.DataFrame: Rows shaped like the merged metadata (cleaned features).
+    """
+    movies = movies.copy()
+    movies['id'] = movies['id'].astype(int)
+    for feature in FEATURE_COLUMNS:
+        if feature not in movies.columns:
+            movies[feature] = '[]'
+    movies = clean_features(movies)
+    return movies.drop(columns=['crew'])
+
+
+def update_neighbor_table(neighbor_indices, neighbor_distances, remap, normalized, new_positions,
+                          block_size=NEIGHBOR_BLOCK_SIZE):
+    """
+    Updates a precomputed neighbor table after rows were removed and appended.
+
+    Surviving movies keep their neighbor lists (re-indexed through remap); the new movies are
+    merged into them as extra candidates. Only movies that lost a neighbor to a removal, and the
+    new movies themselves, are recomputed against the whole catalog.
+
+    Args:
+        neighbor_indices (np.ndarray): Previous table, shape (n_old, K).
+        neighbor_distances (np.ndarray): Previous distances, shape (n_old, K).
+        remap (np.ndarray): New position of each previous row, -1 for removed rows.
+        normalized (csr_matrix or np.ndarray): L2-normalized matrix (or embeddings) of the updated catalog.
+        new_positions (np.ndarray): Positions of the appended rows in the updated catalog.
+        block_size (int): Number of rows processed per block.
+
+    Returns:
+        tuple: (neighbor_indices, neighbor_distances) for the updated catalog.
+    """
+    n_total = normalized.shape[0]
+    top_k = min(neighbor_indices.shape[1], n_total - 1)
+    keep = remap >= 0
+
+    indices = remap[np.asarray(neighbor_indices[keep][:, :top_k], dtype=np.int64)]
+    distances = np.asarray(neighbor_distances[keep][:, :top_k], dtype=np.float32).copy()
+    stale = (indices < 0).any(axis=1)
+
+    # Merge the appended movies into the surviving neighbor lists
+    if len(new_positions) and len(indices) and top_k:
+        new_rows = normalized[new_positions].T
+        for start in range(0, len(indices), block_size):
+            stop = min(start + block_size, len(indices))
+            similarities = to_dense(normalized[start:stop] @ new_rows)
+            candidates = np.hstack([indices[start:stop], np.broadcast_to(new_positions, similarities.shape)])
+            candidate_distances = np.hstack([distances[start:stop], 1.0 - similarities])
+            top = np.argpartition(candidate_distances, top_k - 1, axis=1)[:, :top_k]
+            top = np.take_along_axis(top, np.argsort(np.take_along_axis(candidate_distances, top, axis=1),
+                                                     axis=1, kind='stable'), axis=1)
+            indices[start:stop] = np.take_along_axis(candidates, top, axis=1)
+            distances[start:stop] = np.take_along_axis(candidate_distances, top, axis=1)
+
+    table_indices = np.empty((n_total, top_k), dtype=np.int32)
+    table_distances = np.empty((n_total, top_k), dtype=np.float32)
+    table_indices[:len(indices)] = indices
+    table_distances[:len(indices)] = distances
+
+    recompute = np.concatenate([np.flatnonzero(stale), np.asarray(new_positions, dtype=np.int64)])
+    if len(recompute) and top_k:
+        table_indices[recompute], table_distances[recompute] = query_top_k(normalized, recompute, top_k, block_size)
+    logger.info(f"Neighbor table updated: {len(new_positions)} new rows, {int(stale.sum())} rows recomputed.")
+    return table_indices, table_distances
+
+
+def apply_catalog_update(resources, vocabulary, weighting, movies=None, delete_ids=None):
+    """
+    Applies added, updated and deleted movies to loaded resources without a full rebuild.
+
+    Updated and deleted movies are removed; added and updated movies are vectorized against the
+    existing vocabulary (unseen tokens get new columns; with HASH_BUCKETS they hash into the fixed
+    ones) and weighting, and appended. In embedding mode the new rows are projected with the saved
+    SVD (unseen tokens do not contribute until the next full rebuild). The neighbor table and the
+    nearest-neighbor index are updated incrementally (see indexes.update_index); the given resources
+    are not modified.
+
+    Args:
+        resources (dict): Resources as returned by engine.load_resources (at least 'metadata',
+                          'count_matrix', 'vectors', 'nn_model' and the neighbor table).
+        vocabulary (dict): Token -> column vocabulary of resources['count_matrix'].
+        weighting (FeatureWeighting): Weighting the feature matrix was built with (extended in place
+                                      for unseen tokens, see FeatureWeighting.extend).
+        movies (pd.DataFrame, optional): Movies to add or replace, in the format of prepare_movies.
+        delete_ids (iterable[int], optional): Movie ids to delete.
+
+    Returns:
+        tuple: (updated resources dict, updated vocabulary dict).
+    """
+    metadata = resources['metadata']
+    count_matrix = resources['count_matrix']
+    new_movies = prepare_movies(movies) if movies is not None and len(movies) else None
+
+    removed_ids = set(int(i) for i in (delete_ids or []))
+    if new_movies is not None:
+        removed_ids.update(new_movies['id'].tolist())
+    keep = ~metadata['id'].isin(removed_ids).to_numpy()
+    remap = np.full(len(metadata), -1, dtype=np.int64)
+    remap[keep] = np.arange(int(keep.sum()))
+
+    vectorizer = create_vocabulary(vocabulary)
+    parts = [metadata[keep]]
+    new_counts = None
+    if new_movies is not None:
+        new_counts = vectorizer.transform_fields(new_movies, weighting.field_weights)
+        new_counts = weighting.extend(vectorizer.n_columns).transform(new_counts)
+        parts.append(new_movies)
+    n_columns = vectorizer.n_columns
+
+    kept_counts = csr_matrix(count_matrix[np.flatnonzero(keep)])
+    kept_counts = csr_matrix((kept_counts.data, kept_counts.indices, kept_counts.indptr),
+                             shape=(kept_counts.shape[0], n_columns))
+    updated_matrix = vstack([kept_counts, new_counts], format='csr') if new_counts is not None else kept_counts
+    updated_metadata = pd.concat(parts, ignore_index=True)[metadata.columns]
+    new_positions = np.arange(int(keep.sum()), len(updated_metadata))
+
+    vectors = updated_matrix
+    if EMBEDDING_DIM:
+        kept_vectors = np.asarray(resources['vectors'][np.flatnonzero(keep)], dtype=np.float32)
+        if new_counts is not None:
+            kept_vectors = np.vstack([kept_vectors, project_embeddings(load_model(SVD_MODEL_PATH), new_counts)])
+        vectors = kept_vectors
+
+    neighbor_indices, neighbor_distances = update_neighbor_table(
+        resources['neighbor_indices'], resources['neighbor_distances'], remap,
+        normalize_rows(vectors), new_positions)
+
+    updated = dict(resources)
+    updated.update({
+        'metadata': updated_metadata,
+        'indices': pd.Series(updated_metadata.index, index=updated_metadata['title']).drop_duplicates(),
+        'count_matrix': updated_matrix,
+        'vectors': vectors,
+        'neighbor_indices': neighbor_indices,
+        'neighbor_distances': neighbor_distances,
+        'nn_model': update_index(resources['nn_model'], vectors, remap),
+    })
+    logger.info(f"Catalog updated: {len(new_positions)} movies added or replaced, "
+                f"{len(metadata) - int(keep.sum())} removed or replaced.")
+    return updated, vectorizer.vocabulary
+
+
+def snapshot_paths(directory):
+    """
+    Returns:
+        dict: Artifact name -> path inside one catalog snapshot directory.
+    """
+    return {
+        'metadata': os.path.join(directory, 'merged_metadata.npz'),
+        'matrix': os.path.join(directory, 'count_matrix'),
+        'vocabulary': os.path.join(directory, 'vocabulary.json'),
+        'weighting': os.path.join(directory, 'feature_weighting.joblib'),
+        'model': os.path.join(directory, 'nn_model.joblib'),
+        'neighbor_indices': os.path.join(directory, 'neighbor_indices.npy'),
+        'neighbor_distances': os.path.join(directory, 'neighbor_distances.npy'),
+        'embeddings': os.path.join(directory, 'embeddings.npy'),
+    }
+
+
+def read_snapshot(catalog_dir=CATALOG_DIR):
+    """
+    Returns:
+        dict or None: The published catalog snapshot: 'version' (its subdirectory of catalog_dir),
+                      'base' (build the delta batches were applied to, see build_graph.build_id) and
+                      'deltas' (number of logged batches it contains); None if there is none.
+    """
+    return read_version(catalog_dir)
+
+
+def load_snapshot(snapshot, catalog_dir=CATALOG_DIR, mmap_mode=None):
+    """
+    Loads the artifacts of a catalog snapshot.
+
+    Args:
+        snapshot (dict): Snapshot pointer from read_snapshot.
+        catalog_dir (str): Directory holding the snapshots.
+        mmap_mode (str, optional): 'r' to memory-map the matrix, embeddings and neighbor table.
+
+    Returns:
+        dict or None: 'metadata', 'count_matrix', 'vectors', 'nn_model', 'neighbor_indices',
+                      'neighbor_distances', 'vocabulary_path' and 'weighting_path' (where the
+                      vocabulary and weighting of this set are saved), or None if the snapshot is
+                      incomplete (e.g. pruned).
+    """
+    paths = snapshot_paths(os.path.join(catalog_dir, snapshot['version']))
+    loaded = {
+        'metadata': load_metadata_cache(paths['metadata']),
+        'count_matrix': load_csr_matrix(paths['matrix'], mmap_mode=mmap_mode),
+        'neighbor_indices': load_array(paths['neighbor_indices'], mmap_mode=mmap_mode),
+        'neighbor_distances': load_array(paths['neighbor_distances'], mmap_mode=mmap_mode),
+    }
+    loaded['vectors'] = load_array(paths['embeddings'], mmap_mode=mmap_mode) if EMBEDDING_DIM \
+        else loaded['count_matrix']
+    if any(value is None for value in loaded.values()):
+        logger.warning(f"Catalog snapshot {snapshot['version']} is incomplete.")
+        return None
+    loaded['nn_model'] = load_model(paths['model'], mmap_mode=mmap_mode) if index_is_persisted() \
+        else DotProductIndex().fit(loaded['vectors'])
+    if loaded['nn_model'] is None:
+        return None
+    loaded.update({'vocabulary_path': paths['vocabulary'], 'weighting_path': paths['weighting']})
+    return loaded
+
+
+def persist_catalog(resources, vocabulary, weighting, base, deltas, catalog_dir=CATALOG_DIR):
+    """
+    Saves updated resources as a new catalog snapshot and publishes it.
+
+    The whole artifact set is written to a new version directory first; a single atomic pointer
+    swap then makes it current (utils.publish_version), so readers never combine files of
+    different updates. The base artifacts of the full build are left untouched. The metadata
+    cache keeps the raw-data fingerprint of the base build. With 'mmap' storage the saved arrays
+    are re-opened memory-mapped, so this process shares them like freshly started workers.
+
+    Args:
+        resources (dict): Updated resources from apply_catalog_update.
+        vocabulary (dict): Updated vocabulary.
+        weighting (FeatureWeighting): Weighting extended with the idf of the new columns.
+        base (str): Build the batches were applied to (see build_graph.build_id).
+        deltas (int): Number of delta log batches contained in the snapshot.
+        catalog_dir (str): Directory holding the snapshots.
+
+    Returns:
+        dict: Resources backed by the saved snapshot, with its 'vocabulary_path' and 'weighting_path'.
+    """
+    name, directory = new_version_dir(catalog_dir)
+    paths = snapshot_paths(directory)
+    header = read_cache_header(MERGED_CACHE_PATH)
+    save_metadata_cache(resources['metadata'], paths['metadata'], header['source_hash'] if header else None)
+    save_vocabulary(vocabulary, paths['vocabulary'])
+    save_model(weighting, paths['weighting'])
+    save_csr_matrix(resources['count_matrix'], paths['matrix'])
+    save_array(resources['neighbor_indices'], paths['neighbor_indices'])
+    save_array(resources['neighbor_distances'], paths['neighbor_distances'])
+    if EMBEDDING_DIM:
+        save_array(resources['vectors'], paths['embeddings'])
+    if index_is_persisted():
+        save_model(resources['nn_model'], paths['model'])
+    publish_version(catalog_dir, name, {'base': base, 'deltas': deltas})
+
+    persisted = dict(resources)
+    persisted.update({'vocabulary_path': paths['vocabulary'], 'weighting_path': paths['weighting']})
+    if ARTIFACT_STORAGE == 'mmap':
+        persisted.update(load_snapshot({'version': name}, catalog_dir, mmap_mode='r') or {})
+    logger.info(f"Catalog snapshot {name} published ({deltas} delta batches on build {base[:12]}).")
+    return persisted
+
+
+def read_delta_log(log_path=DELTA_LOG_PATH):
+    """
+    Reads the catalog delta log.
+
+    Returns:
+        list[dict]: Applied batches in order (version, timestamp, upserted_ids, deleted_ids, rows).
+    """
+    if not os.path.exists(log_path):
+        return []
+    with open(log_path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_delta_log(movies=None, delete_ids=None, log_path=DELTA_LOG_PATH, delta_dir=DELTA_DIR):
+    """
+    Records one applied batch in the delta log. The raw rows of added/updated movies are kept
+    in a columnar file next to the log, so the batch can be replayed after a full rebuild.
+    The caller holds the artifact file lock (config.ARTIFACT_LOCK_PATH) until the snapshot holding
+    the batch is published, so two processes never take the same version.
+
+    Returns:
+        int: Catalog version after this batch (number of applied batches).
+    """
+    version = len(read_delta_log(log_path)) + 1
+    rows_path = None
+    if movies is not None and len(movies):
+        os.makedirs(delta_dir, exist_ok=True)
+        rows_path = os.path.join(delta_dir, f"{version:06d}.npz")
+        save_metadata_cache(movies.reset_index(drop=True), rows_path)
+
+    entry = {
+        'version': version,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'upserted_ids': [] if movies is None else [int(i) for i in movies['id']],
+        'deleted_ids': [int(i) for i in (delete_ids or [])],
+        'rows': os.path.relpath(rows_path, os.path.dirname(log_path)) if rows_path else None,
+    }
+    with open(log_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry) + '\n')
+    return version
+
+
+def replay_delta_log(resources, vocabulary, weighting, log_path=DELTA_LOG_PATH, start=0):
+    """
+    Re-applies the logged batches from position `start` on, e.g. after the catalog was rebuilt
+    from the raw files (start=0) or on top of a snapshot holding the first `start` batches.
+
+    Returns:
+        tuple: (updated resources dict, updated vocabulary dict).
+    """
+    for entry in read_delta_log(log_path)[start:]:
+        movies = None
+        if entry['rows']:
+            movies = load_metadata_cache(os.path.join(os.path.dirname(log_path), entry['rows']))
+        resources, vocabulary = apply_catalog_update(resources, vocabulary, weighting, movies,
+                                                     entry['deleted_ids'])
+    return resources, vocabulary
@@ -2,7 +2,111 @@ import os
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
-MERGED_CACHE_PATH = os.path.join(DATA_DIR, 'merged_metadata.csv')
+MERGED_CACHE_PATH = os.path.join(DATA_DIR, 'merged_metadata.npz')
 MODEL_PATH = os.path.join(DATA_DIR, 'nn_model.joblib')
 MATRIX_PATH = os.path.join(DATA_DIR, 'count_matrix.joblib')
+MATRIX_DIR = os.path.join(DATA_DIR, 'count_matrix')  # Raw CSR arrays used by the 'mmap' storage mode
+VOCABULARY_PATH = os.path.join(DATA_DIR, 'vocabulary.json')  # Token -> count matrix column
+BUILD_MANIFEST_PATH = os.path.join(DATA_DIR, 'build_manifest.json')  # Input/parameter hashes of every built artifact
+ARTIFACT_LOCK_PATH = os.path.join(DATA_DIR, 'artifacts.lock')  # Serializes builds and catalog updates across processes
 
+# Artifact storage: 'mmap' writes the count matrix and neighbor tables as raw .npy files that every
+# worker process memory-maps read-only (one shared page-cache copy); 'joblib' pickles private copies.
+ARTIFACT_STORAGE = 'mmap'
+
+# Precomputed top-K neighbor table (one row per movie, self excluded)
+NEIGHBOR_INDICES_PATH = os.path.join(DATA_DIR, 'neighbor_indices.npy')
+NEIGHBOR_DISTANCES_PATH = os.path.join(DATA_DIR, 'neighbor_distances.npy')
+NEIGHBOR_TABLE_K = 50
+NEIGHBOR_BLOCK_SIZE = 512  # rows per sparse product block; bounds the dense block to BLOCK x n_movies float32
+
+# Nearest-neighbor index backend: 'brute' (exact cosine scan) or 'lsh' (approximate, random-projection LSH)
+INDEX_BACKEND = 'brute'
+LSH_PARAMS = {'n_tables': 8, 'n_bits': 12, 'n_probes': 4}
+
+# Worker processes used to clean features during a full rebuild (1 = single process). Capped because
+# a web worker starting on stale artifacts runs the rebuild too, and would fork one process per core
+PREPROCESSING_WORKERS = min(os.cpu_count() or 1, 4)
+
+# Raw data ingestion: 'memory' loads the whole CSVs at once; 'streaming' processes them in
+# INGEST_CHUNK_SIZE-row chunks so the raw text is never held whole (the cleaned catalog still is)
+INGESTION_MODE = 'memory'
+INGEST_CHUNK_SIZE = 5000
+
+# Incremental catalog updates: append-only log of applied batches and the batch rows it refers to
+DELTA_LOG_PATH = os.path.join(DATA_DIR, 'catalog_deltas.jsonl')
+DELTA_DIR = os.path.join(DATA_DIR, 'deltas')
+CATALOG_DIR = os.path.join(DATA_DIR, 'catalog')  # Versioned snapshots of the updated catalog plus a CURRENT pointer
+
+# Fuzzy title search: character n-gram size of the inverted index and candidates scored per ranking
+TITLE_NGRAM = 3
+TITLE_SHORTLIST_SIZE = 512
+# Score a shortlisted title must reach to count as a strong match; with fewer strong matches than requested,
+# every title is scored instead, so weak queries rank exactly like a full scan
+TITLE_STRONG_SCORE = 80
+
+# Typeahead: completions returned per request and the shortest prefix that is looked up
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MIN_CHARS = 2
+
+# Batch recommendations: most reference movies accepted per /recommend/batch request
+RECOMMEND_BATCH_MAX = 1000
+
+# Extra neighbors fetched per recommendation request to make up for duplicate rows of one movie id
+RECOMMEND_OVERFETCH = 5
+
+# Top-rated leaderboard: default vote-count percentile and number of movies ranked ahead of time
+TOP_MOVIES_PERCENTILE = 0.90
+LEADERBOARD_SIZE = 1000
+
+# Facet filters: recommendations restricted to at most this many movies are ranked directly
+# against those movies instead of filtering the (over-fetched) neighbor lists
+FACET_PREFILTER_MAX = 5000
+
+# Facet filters: larger filters walk at most this many neighbors per movie before the movies still
+# short of recommendations are ranked directly against the filter
+FACET_WALK_MAX = 1000
+
+# Feature matrix: token counts of each cleaned field scaled by its weight, then term weighting
+# ('count', 'tfidf' or 'bm25') and L2 row normalization to float32, so cosine similarity is a dot product
+VECTORIZER_SCHEME = 'count'
+FIELD_WEIGHTS = {'keywords': 1.0, 'cast': 1.0, 'director': 1.0, 'genres': 1.0}
+BM25_PARAMS = {'k1': 1.2, 'b': 0.75}
+WEIGHTING_PATH = os.path.join(DATA_DIR, 'feature_weighting.joblib')  # Fitted idf used to vectorize new movies
+# Set (e.g. 2 ** 18) to hash field-namespaced tokens into that many columns instead of keeping a vocabulary
+HASH_BUCKETS = None
+
+# Dense embedding mode: the feature matrix reduced with TruncatedSVD to EMBEDDING_DIM float32 dimensions
+# (unit rows) and searched with dense matrix products; None serves the sparse feature matrix directly
+EMBEDDING_DIM = None
+EMBEDDING_PATH = os.path.join(DATA_DIR, 'embeddings.npy')
+SVD_MODEL_PATH = os.path.join(DATA_DIR, 'svd_model.joblib')  # Projects new movies into the embedding space
+
+# View response cache: per-process LRU entries and their lifetime in seconds. Set RESPONSE_CACHE_SHARED to
+# a Django cache alias (settings.CACHES) to also share entries between worker processes
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL = 300
+RESPONSE_CACHE_SHARED = None
+
+# Engine memoization: cached results per function (get_matches, get_recommendations_by_id/_by_title)
+ENGINE_CACHE_SIZE = 512
+
+# Seconds between checks for artifacts rebuilt or updated by another process, which are then hot-swapped
+# into running servers (see engine.warm_up); None disables the checks
+RESOURCE_RELOAD_INTERVAL = None
+
+# Async views: threads running engine calls, and calls queued or running before requests get a 503
+ASYNC_WORKERS = 4
+ASYNC_MAX_PENDING = 64
+
+# Standalone JSON service (src/server.py): listening address and pre-forked worker processes (None = one per CPU)
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8100
+SERVER_WORKERS = None
+
+# Standalone JSON service: a worker exiting within SERVER_QUICK_EXIT seconds of its start failed to start.
+# Each failed start in a row doubles the wait before the next restart (from SERVER_RESTART_BACKOFF
+# seconds); after SERVER_MAX_FAILED_STARTS of them the server stops instead of forking in a loop
+SERVER_QUICK_EXIT = 5
+SERVER_RESTART_BACKOFF = 0.5
+SERVER_MAX_FAILED_STARTS = 5
@@ -1,10 +1,26 @@
+import re
 import numpy as np
 import pandas as pd
 from ast import literal_eval
+from itertools import islice
 from logging_config import setup_logging
 
 logger = setup_logging()
 
+# A Python-literal value as written by repr(): a quoted string (with escapes) or a bare token (None, numbers)
+_VALUE = r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|[^,}]*)"""
+# 'name' entries of a stringified list of dicts, e.g. "[{'id': 16, 'name': 'Animation'}, ...]"
+NAME_PATTERN = re.compile(r"(?:\{|, )'name': " + _VALUE)
+# Name of the first crew member whose job is exactly 'Director' (crew dicts store 'job' right before 'name')
+DIRECTOR_PATTERN = re.compile(r"'job': 'Director', 'name': " + _VALUE)
+# A complete repr() of a list of flat dicts with string, number, bool or None values
+_STRING = r"""(?:'[^'\\]*(?:\\.[^'\\]*)*'|"[^"\\]*(?:\\.[^"\\]*)*")"""
+_LITERAL = _STRING + r"|None|True|False|-?\d+(?:\.\d*)?(?:e[-+]?\d+)?"
+_DICT = r"\{(?:" + _STRING + ": (?:" + _LITERAL + r")(?:, " + _STRING + ": (?:" + _LITERAL + r"))*)?\}"
+LIST_OF_DICTS_PATTERN = re.compile(r"\[(?:" + _DICT + r"(?:, " + _DICT + r")*)?\]")
+# A crew entry laid out and quoted like DIRECTOR_PATTERN expects, whatever its job
+CREW_ENTRY_PATTERN = re.compile(r"'job': '[^'\\]*(?:\\.[^'\\]*)*', 'name': ")
+
 
 def safe_literal_eval(val):
     """
@@ -100,9 +116,94 @@ def clean_metadata(metadata):
     return metadata
 
 
-def clean_features(metadata):
+def parse_literal_string(token):
     """
-    Performs feature-specific cleaning of 'cast', 'crew', 'keywords', 'genres' columns.
+    Converts one value token matched by NAME_PATTERN/DIRECTOR_PATTERN into a Python value.
+
+    Args:
+        token (str): Quoted string literal or bare token.
+
+    Returns:
+        str or None: The string value, or None for non-string tokens (e.g. None or numbers).
+    """
+    if not token or token[0] not in '\'"':
+        return None
+    if '\\' in token:
+        return literal_eval(token)  # Rare: escaped characters need the full literal parser
+    return token[1:-1]
+
+
+def is_literal_list(val):
+    """
+    Checks whether a value looks like a stringified Python list.
+
+    Returns:
+        bool: True if the value is a string enclosed in square brackets.
+    """
+    return isinstance(val, str) and val.startswith('[') and val.endswith(']')
+
+
+def extract_names(val, limit=3):
+    """
+    Extracts up to `limit` cleaned 'name' values from a stringified list of dicts,
+    without evaluating the whole structure.
+
+    Equivalent to clean_data(get_list(safe_literal_eval(val))). Values that are not a
+    well-formed list of dicts (e.g. truncated ones) are evaluated like the reference, so they
+    give no names instead of the names before the damage.
+
+    Args:
+        val (str): Stringified list of dicts, e.g. a raw 'cast', 'keywords' or 'genres' value.
+        limit (int): Maximum number of names to return.
+
+    Returns:
+        list: Up to `limit` names, lowercased and without spaces.
+    """
+    if not is_literal_list(val):
+        return []
+    if not LIST_OF_DICTS_PATTERN.fullmatch(val):
+        parsed = safe_literal_eval(val)
+        items = parsed if isinstance(parsed, list) else []
+        return clean_data([item.get('name') for item in items if isinstance(item, dict)][:limit])
+    names = (parse_literal_string(match.group(1)) for match in islice(NAME_PATTERN.finditer(val), limit))
+    return [name.replace(" ", "").lower() for name in names if isinstance(name, str)]
+
+
+def extract_directors(crew):
+    """
+    Extracts the cleaned director name of every row of a raw 'crew' column.
+
+    The first 'Director' entry is located with one vectorized regex pass over the column.
+    Rows where the regex does not see every entry (another key order or quoting, as in
+    extract_names) fall back to the literal_eval path, so an earlier director is never skipped.
+
+    Args:
+        crew (pd.Series): Raw stringified crew lists.
+
+    Returns:
+        pd.Series: Director names, lowercased and without spaces ('' if none).
+    """
+    crew = crew.where(crew.map(is_literal_list), np.nan)
+    tokens = crew.str.extract(DIRECTOR_PATTERN, expand=False)
+    complete = crew.str.count(CREW_ENTRY_PATTERN) == crew.str.count(r"\{")
+
+    directors = []
+    for raw, token, seen_all in zip(crew.to_numpy(), tokens.to_numpy(), complete.to_numpy()):
+        if not isinstance(raw, str):
+            directors.append('')
+        elif not seen_all:
+            directors.append(clean_data(get_director(safe_literal_eval(raw))))
+        elif isinstance(token, str):
+            directors.append(clean_data(parse_literal_string(token)))
+        else:
+            directors.append('')
+    return pd.Series(directors, index=crew.index, dtype=object)
+
+
+def clean_features_literal_eval(metadata):
+    """
+    Performs feature-specific cleaning of 'cast', 'crew', 'keywords', 'genres' columns
+    by fully evaluating every stringified list. Reference implementation for clean_features.
 
     Args:
         metadata (pd.DataFrame): Merged metadata dataset.
@@ -127,3 +228,27 @@ def clean_features(metadata):
         metadata[feature] = metadata[feature].apply(clean_data)
 
     return metadata
+
+
+def clean_features(metadata):
+    """
+    Performs feature-specific cleaning of 'cast', 'crew', 'keywords', 'genres' columns.
+
+    Produces the same 'cast', 'keywords', 'genres' and 'director' values as
+    clean_features_literal_eval, but only extracts the needed names with regular
+    expressions instead of evaluating the full lists of dicts. The raw 'crew'
+    column is left untouched.
+
+    Args:
+        metadata (pd.DataFrame): Merged metadata dataset.
+
+    Returns:
+        pd.DataFrame: Cleaned metadata dataset with feature columns processed.
+    """
+    metadata['director'] = extract_directors(metadata['crew'])
+
+    # Top 3 cleaned names for 'cast', 'keywords', 'genres'
+    for feature in ['cast', 'keywords', 'genres']:
+        metadata[feature] = [extract_names(val) for val in metadata[feature].to_numpy()]
+
+    return metadata
@@ -1,7 +1,12 @@
 import os
 import pandas as pd
 import zipfile
-from data_cleaning import clean_data, get_list, get_director, clean_metadata, clean_features
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from data_cleaning import clean_metadata, clean_features
+from metadata_cache import load_metadata_cache, save_metadata_cache, source_fingerprint
+from utils import load_model, save_model, load_csr_matrix, save_csr_matrix, save_vocabulary
+from vectorization import build_feature_matrix
+from config import PREPROCESSING_WORKERS
 from logging_config import setup_logging
 
 logger = setup_logging()
@@ -38,27 +43,88 @@ def extract_raw_data(zip_path, extract_to):
         raise
 
 
-def create_soup(x):
+FEATURE_COLUMNS = ['cast', 'crew', 'keywords', 'genres']
+
+
+def read_raw_csvs(metadata_path, credits_path, keywords_path, workers=1):
     """
-    Combines keywords, cast, director, and genres into a single string
-    for text-based similarity.
+    Reads the three raw CSV files, concurrently when more than one worker is allowed.
+    The pandas C parser releases the GIL, so threads overlap the reads.
 
     Args:
-        x (pd.Series): Movie metadata row with required fields.
+        metadata_path (str): Path to the movie metadata CSV file.
+        credits_path (str): Path to the movie credits CSV file.
+        keywords_path (str): Path to the movie keywords CSV file.
+        workers (int): Number of concurrent readers allowed.
 
     Returns:
-        str: Concatenated text string for vectorization.
+        tuple: (metadata, credits, keywords) DataFrames.
     """
-    return ' '.join(x['keywords']) + ' ' + ' '.join(x['cast']) + ' ' + x['director'] + ' ' + ' '.join(x['genres'])
+    if workers <= 1:
+        return (pd.read_csv(metadata_path, low_memory=False),
+                pd.read_csv(credits_path),
+                pd.read_csv(keywords_path))
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        metadata = executor.submit(pd.read_csv, metadata_path, low_memory=False)
+        credits_df = executor.submit(pd.read_csv, credits_path)
+        keywords = executor.submit(pd.read_csv, keywords_path)
+        return metadata.result(), credits_df.result(), keywords.result()
+
+
+def _clean_feature_chunk(features):
+    """
+    Cleans one chunk of feature columns. Runs inside pool workers.
+
+    Args:
+        features (pd.DataFrame): Chunk with raw 'cast', 'crew', 'keywords', 'genres' columns.
+
+    Returns:
+        pd.DataFrame: Chunk with cleaned 'cast', 'keywords', 'genres' and 'director' columns.
+    """
+    features = clean_features(features)
+    return features[['cast', 'keywords', 'genres', 'director']]
+
+
+def clean_feature_columns(metadata, workers=1):
+    """
+    Cleans the feature columns, splitting the rows across a process pool when more than
+    one worker is configured.
+
+    Args:
+        metadata (pd.DataFrame): Merged metadata with raw feature columns.
+        workers (int): Number of worker processes (1 runs in the current process).
+
+    Returns:
+        pd.DataFrame: Metadata with cleaned feature columns.
+    """
+    n_rows = len(metadata)
+    if workers <= 1 or n_rows < 2 * workers:
+        return clean_features(metadata)
+
+    # Only the feature columns are shipped to the workers; two chunks per worker evens out the load
+    n_chunks = workers * 2
+    bounds = [n_rows * i // n_chunks for i in range(n_chunks + 1)]
+    features = metadata[FEATURE_COLUMNS]
+    chunks = [features.iloc[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    logger.info(f"Cleaning {n_rows} rows in {n_chunks} chunks on {workers} worker processes...")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        cleaned = pd.concat(executor.map(_clean_feature_chunk, chunks))
+
+    for column in cleaned.columns:
+        metadata[column] = cleaned[column]
+    return metadata
 
 
 def load_and_merge_metadata(
         metadata_path,
         credits_path,
         keywords_path,
-        merged_cache_path='merged_metadata.csv',
+        merged_cache_path='merged_metadata.npz',
         zip_path=None,
-        extract_to=None):
+        extract_to=None,
+        workers=PREPROCESSING_WORKERS):
     """
     Loads and merges movie metadata, credits, and keywords datasets.
     Performs data merging and stores the processed dataset.
@@ -67,9 +133,10 @@ def load_and_merge_metadata(
         metadata_path (str): Path to the movie metadata CSV file.
         credits_path (str): Path to the movie credits CSV file.
         keywords_path (str): Path to the movie keywords CSV file.
-        merged_cache_path (str): Path to cache the processed merged dataset.
+        merged_cache_path (str): Path to the columnar (.npz) cache of the processed merged dataset.
         zip_path (str): Path to the zip file (if data needs extraction).
         extract_to (str): Directory to extract files to (if data needs extraction).
+        workers (int): Number of processes used for reading and cleaning.
 
     Returns:
         pd.DataFrame: The processed metadata with merged data.
@@ -78,10 +145,12 @@ def load_and_merge_metadata(
         if zip_path and extract_to:
             extract_raw_data(zip_path, extract_to)
 
-        # Check if cached file exists
-        if os.path.exists(merged_cache_path):
+        # Check if an up-to-date cached file exists
+        source_hash = source_fingerprint([metadata_path, credits_path, keywords_path])
+        cached = load_metadata_cache(merged_cache_path, source_hash)
+        if cached is not None:
             logger.info(f"Found cached merged metadata at: {merged_cache_path}")
-            return pd.read_csv(merged_cache_path)
+            return cached
 
         # Check if input files exist
         if not os.path.exists(metadata_path):
@@ -95,9 +164,7 @@ def load_and_merge_metadata(
             return None
 
         # Load datasets
-        metadata = pd.read_csv(metadata_path, low_memory=False)
-        credits_df = pd.read_csv(credits_path)
-        keywords = pd.read_csv(keywords_path)
+        metadata, credits_df, keywords = read_raw_csvs(metadata_path, credits_path, keywords_path, workers)
 
         # Clean metadata
         metadata = clean_metadata(metadata)
@@ -106,14 +173,15 @@ def load_and_merge_metadata(
         metadata = metadata.merge(credits_df, on='id', how='left')
         metadata = metadata.merge(keywords, on='id', how='left')
 
-        # Clean features: 'cast', 'crew', 'keywords', 'genres'
-        metadata = clean_features(metadata)
+        # Clean features ('cast', 'crew', 'keywords', 'genres') into the name lists the
+        # feature matrix is built from
+        metadata = clean_feature_columns(metadata, workers)
 
-        # Create 'soup' for content-based recommendation system
-        metadata['soup'] = metadata.apply(create_soup, axis=1)
+        # 'crew' is only needed to derive 'director'; don't carry the full crew lists into the cache
+        metadata = metadata.drop(columns=['crew'])
 
         # Save the cleaned and merged dataset to a file
-        metadata.to_csv(merged_cache_path, index=False)
+        save_metadata_cache(metadata, merged_cache_path, source_hash)
         logger.info(f"Merged metadata processed and saved to {merged_cache_path}")
 
         return metadata
@@ -121,3 +189,40 @@ def load_and_merge_metadata(
     except Exception as e:
         logger.error(f"Error loading and processing datasets: {e}")
         raise
+
+
+def get_or_build_count_matrix(metadata, matrix_path, matrix_dir, storage='joblib', vocabulary_path=None,
+                              weighting_path=None):
+    """
+    Loads the feature matrix if it exists; otherwise vectorizes the cleaned features and saves it.
+
+    Args:
+        metadata (pd.DataFrame): Processed metadata with cleaned 'keywords', 'cast', 'director' and 'genres'.
+        matrix_path (str): Joblib file used by the 'joblib' storage mode.
+        matrix_dir (str): Directory of raw CSR arrays used by the 'mmap' storage mode.
+        storage (str): 'joblib' (private pickled copy) or 'mmap' (read-only memory-mapped arrays).
+        vocabulary_path (str, optional): Where to save the fitted vocabulary (needed for incremental updates).
+        weighting_path (str, optional): Where to save the fitted FeatureWeighting (same purpose).
+
+    Returns:
+        csr_matrix: Weighted, L2-normalized float32 features (see vectorization.build_feature_matrix).
+    """
+    if storage == 'mmap':
+        count_matrix = load_csr_matrix(matrix_dir, mmap_mode='r')
+    else:
+        count_matrix = load_model(matrix_path)
+    if count_matrix is not None:
+        return count_matrix
+
+    count_matrix, vocabulary, weighting = build_feature_matrix(metadata)
+    if vocabulary_path:
+        save_vocabulary(vocabulary, vocabulary_path)
+    if weighting_path:
+        save_model(weighting, weighting_path)
+    if storage == 'mmap':
+        save_csr_matrix(count_matrix, matrix_dir)
+        # Re-open the saved arrays so this process maps the shared copy as well
+        count_matrix = load_csr_matrix(matrix_dir, mmap_mode='r')
+    else:
+        save_model(count_matrix, matrix_path)
+    return count_matrix
@@ -0,0 +1,67 @@
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+from utils import save_model, save_array, load_array
+from config import EMBEDDING_DIM
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+
+def project_embeddings(svd, matrix):
+    """
+    Projects feature rows into the embedding space and L2-normalizes them.
+
+    Columns added to the vocabulary after the SVD was fitted (unseen tokens) have no loading
+    in it and are ignored.
+
+    Args:
+        svd (TruncatedSVD): Fitted SVD model.
+        matrix (csr_matrix): Feature rows.
+
+    Returns:
+        np.ndarray: float32 embeddings of shape (n_rows, dim) with unit-length rows.
+    """
+    components = svd.components_.astype(np.float32)
+    embeddings = matrix[:, :components.shape[1]] @ components.T
+    return normalize(np.asarray(embeddings, dtype=np.float32), norm='l2', axis=1)
+
+
+def build_embeddings(matrix, dim=EMBEDDING_DIM, random_state=42):
+    """
+    Reduces the sparse feature matrix to dense low-rank embeddings with TruncatedSVD.
+
+    Args:
+        matrix (csr_matrix): Feature matrix (see vectorization).
+        dim (int): Number of dimensions (capped below the number of features).
+        random_state (int): Seed of the randomized SVD.
+
+    Returns:
+        tuple: (float32 embeddings with unit-length rows, fitted TruncatedSVD).
+    """
+    dim = max(1, min(dim, matrix.shape[1] - 1))
+    svd = TruncatedSVD(n_components=dim, algorithm='randomized', random_state=random_state)
+    svd.fit(matrix)
+    logger.info(f"Embeddings built: {matrix.shape[0]} movies x {dim} dimensions, "
+                f"{svd.explained_variance_ratio_.sum():.1%} of the variance kept.")
+    return project_embeddings(svd, matrix), svd
+
+
+def get_or_build_embeddings(matrix, embedding_path, svd_path, dim=EMBEDDING_DIM, mmap_mode=None):
+    """
+    Loads the saved embeddings if they match the matrix and dimension; otherwise builds and saves them.
+    With mmap_mode='r' the embeddings are memory-mapped read-only.
+
+    Returns:
+        np.ndarray: float32 embeddings of shape (n_movies, dim).
+    """
+    embeddings = load_array(embedding_path, mmap_mode=mmap_mode)
+    expected_dim = max(1, min(dim, matrix.shape[1] - 1))
+    if embeddings is None or embeddings.shape != (matrix.shape[0], expected_dim):
+        logger.info("No up-to-date embeddings found. Building now...")
+        embeddings, svd = build_embeddings(matrix, dim)
+        save_array(embeddings, embedding_path)
+        save_model(svd, svd_path)
+        if mmap_mode:
+            embeddings = load_array(embedding_path, mmap_mode=mmap_mode)
+    return embeddings
@@ -1,74 +1,262 @@
 import os
+import time
+import numpy as np
 import pandas as pd
-from sklearn.feature_extraction.text import CountVectorizer
-from recommender import fuzzy_search, get_recommendations, get_or_train_model, get_top_movies
-from data_preprocessing import load_and_merge_metadata
-from utils import load_model, save_model
-from config import BASE_DIR, DATA_DIR, MERGED_CACHE_PATH, MATRIX_PATH, MODEL_PATH
+from recommender import (fuzzy_search, get_recommendations, get_unique_neighbors, get_top_movies, weighted_ratings,
+                         build_display_frame, build_id_positions)
+from neighbor_table import get_or_build_neighbor_table
+from data_preprocessing import get_or_build_count_matrix
+from build_graph import artifacts_complete, build_id, current_snapshot, ensure_artifacts, load_manifest
+from embeddings import get_or_build_embeddings
+from indexes import DotProductIndex, get_or_train_model
+from title_index import TitleSearchIndex, PrefixIndex, query_key
+from facets import FacetIndex
+from metadata_cache import load_metadata_cache
+from catalog import (apply_catalog_update, persist_catalog, append_delta_log, load_snapshot, read_delta_log,
+                     replay_delta_log)
+from lru import memoize
+from logging_config import setup_logging
+from resource_manager import ResourceManager
+from utils import file_lock, load_vocabulary, load_model
+from config import (ARTIFACT_LOCK_PATH, BASE_DIR, DATA_DIR, MERGED_CACHE_PATH, MATRIX_PATH, MATRIX_DIR,
+                    VOCABULARY_PATH, WEIGHTING_PATH, MODEL_PATH,
+                    NEIGHBOR_INDICES_PATH, NEIGHBOR_DISTANCES_PATH, ARTIFACT_STORAGE,
+                    AUTOCOMPLETE_LIMIT, AUTOCOMPLETE_MIN_CHARS, LEADERBOARD_SIZE, TOP_MOVIES_PERCENTILE,
+                    EMBEDDING_DIM, EMBEDDING_PATH, SVD_MODEL_PATH, ENGINE_CACHE_SIZE, RESOURCE_RELOAD_INTERVAL)
 
-
-# Global resource cache
-_resources = {}
+logger = setup_logging()
 
 
 def load_resources():
     """
-    Loads and caches all necessary resources for movie recommendation:
+    Returns the loaded resources, loading them on first use. Concurrent first requests share
+    one load, and reload_resources() swaps in a new set without blocking requests.
+
+    Resources for movie recommendation:
     - Metadata (merged)
     - Index mapping from titles
     - Count matrix (text vectorization)
     - NearestNeighbors model
+    - Precomputed top-K neighbor table
+    - Fuzzy title search and prefix (typeahead) indexes
+    - Display-ready projection of the metadata
+    - Weighted-rating leaderboard for the default percentile
+    - Facet indexes over genres, release year and director
 
     Returns:
         dict: Dictionary containing:
             - 'metadata' (pd.DataFrame): Merged and cleaned movie metadata.
             - 'indices' (pd.Series): Mapping from movie titles to DataFrame indices.
-            - 'count_matrix' (csr_matrix): CountVectorizer-transformed text features.
+            - 'id_positions' (pd.Series): Mapping from movie ids to DataFrame indices (first row per id).
+            - 'count_matrix' (csr_matrix): Weighted, L2-normalized float32 features (see vectorization).
+            - 'vectors' (csr_matrix or np.ndarray): What similarity search runs on: the feature matrix,
+              or its dense embeddings when EMBEDDING_DIM is set.
             - 'nn_model' (NearestNeighbors): Trained recommendation model.
+            - 'neighbor_indices' (np.ndarray): Top-K neighbor positions per movie (int32).
+            - 'neighbor_distances' (np.ndarray): Matching cosine distances (float32).
+            - 'title_index' (TitleSearchIndex): N-gram index over the titles for fuzzy search.
+            - 'prefix_index' (PrefixIndex): Sorted word-start index over the titles for completions.
+            - 'display' (pd.DataFrame): id, title, release_date and formatted genres by row position.
+            - 'ratings' (dict): percentile -> weighted rating per row; other percentiles are added on first use.
+            - 'leaderboards' (dict): percentile -> (size, top-rated movies), likewise.
+            - 'facets' (FacetIndex): Genre, release year and director posting lists for filters.
+            - 'version' (str): Identifies the loaded artifact set (see catalog_version).
+    """
+    return _manager.get()
+
+
+def _build_resources():
     """
-    global _resources
-    if _resources:
-        return _resources  # Already loaded
+    Brings the artifacts up to date and loads them (see load_resources).
 
-    metadata_path = os.path.join(DATA_DIR, 'movies_metadata.csv')
-    credits_path = os.path.join(DATA_DIR, 'credits.csv')
-    keywords_path = os.path.join(DATA_DIR, 'keywords.csv')
+    Returns:
+        dict: A complete, new resource set.
+    """
     zip_path = os.path.join(DATA_DIR, 'raw_data.zip')
-    extract_to = DATA_DIR
-
-    metadata = load_and_merge_metadata(
-        metadata_path,
-        credits_path,
-        keywords_path,
-        MERGED_CACHE_PATH,
-        zip_path=zip_path,
-        extract_to=extract_to)
-    if metadata is None or metadata.empty:
-        raise ValueError("Metadata failed to load.")
 
-    indices = pd.Series(metadata.index, index=metadata['title']).drop_duplicates()
+    # Rebuild only the stale artifacts (raw -> merged -> matrix -> model/neighbors), then load them
+    ensure_artifacts(zip_path=zip_path)
+
+    # With 'mmap' storage, large arrays are memory-mapped read-only and shared by all worker processes
+    mmap_mode = 'r' if ARTIFACT_STORAGE == 'mmap' else None
+
+    # Load under a shared lock, so another process cannot start rewriting the set being read
+    with file_lock(ARTIFACT_LOCK_PATH, shared=True):
+        manifest = load_manifest()
 
-    count_matrix = load_model(MATRIX_PATH)
-    if count_matrix is None:
-        vectorizer = CountVectorizer(stop_words='english')
-        count_matrix = vectorizer.fit_transform(metadata['soup'])
-        save_model(count_matrix, MATRIX_PATH)
+        # Catalog updates are served from the published snapshot (base build plus every logged batch)
+        snapshot = current_snapshot(manifest)
+        loaded = load_snapshot(snapshot, mmap_mode=mmap_mode) if snapshot else None
+        if loaded is None:
+            snapshot = None
+            loaded = _load_base_artifacts(mmap_mode)
 
-    nn_model = get_or_train_model(count_matrix, MODEL_PATH)
+    metadata = loaded['metadata']
+    resources = dict(loaded)
+    resources.update({
+        'indices': pd.Series(metadata.index, index=metadata['title']).drop_duplicates(),
+        'id_positions': build_id_positions(metadata),
+        'title_index': TitleSearchIndex(metadata['title']),
+        'prefix_index': PrefixIndex(metadata['title'], metadata['vote_count']),
+        'display': build_display_frame(metadata),
+        'facets': FacetIndex(metadata),
+        'version': _artifact_version(manifest, snapshot),
+        'base': build_id(manifest),
+        'deltas': snapshot['deltas'] if snapshot else 0,
+    })
+    _reset_leaderboards(resources)
+    return resources
 
-    _resources = {
+
+def _load_base_artifacts(mmap_mode=None):
+    """
+    Loads the artifacts of the full build (no catalog updates applied).
+
+    Returns:
+        dict: Same entries as catalog.load_snapshot.
+    """
+    metadata = load_metadata_cache(MERGED_CACHE_PATH)
+    if metadata is None or metadata.empty:
+        raise ValueError("Metadata failed to load.")
+    count_matrix = get_or_build_count_matrix(metadata, MATRIX_PATH, MATRIX_DIR, storage=ARTIFACT_STORAGE,
+                                             vocabulary_path=VOCABULARY_PATH, weighting_path=WEIGHTING_PATH)
+
+    # In embedding mode, search runs on the dense embeddings with a dot-product (GEMM) index
+    vectors = count_matrix
+    if EMBEDDING_DIM:
+        vectors = get_or_build_embeddings(count_matrix, EMBEDDING_PATH, SVD_MODEL_PATH, mmap_mode=mmap_mode)
+        nn_model = DotProductIndex().fit(vectors)
+    else:
+        nn_model = get_or_train_model(count_matrix, MODEL_PATH, mmap_mode=mmap_mode)
+    neighbor_indices, neighbor_distances = get_or_build_neighbor_table(
+        vectors, NEIGHBOR_INDICES_PATH, NEIGHBOR_DISTANCES_PATH, mmap_mode=mmap_mode)
+    return {
         'metadata': metadata,
-        'indices': indices,
         'count_matrix': count_matrix,
-        'nn_model': nn_model
+        'vectors': vectors,
+        'nn_model': nn_model,
+        'neighbor_indices': neighbor_indices,
+        'neighbor_distances': neighbor_distances,
+        'vocabulary_path': VOCABULARY_PATH,
+        'weighting_path': WEIGHTING_PATH,
     }
-    return _resources
 
 
+# Resource set shared by every request of this process
+_manager = ResourceManager(_build_resources)
+
+
+def reload_resources():
+    """
+    Rebuilds stale artifacts and loads a fresh resource set, then swaps it in atomically.
+    Requests keep being served from the current set while the new one loads.
+
+    Returns:
+        dict: The new resources.
+    """
+    return _manager.reload()
+
+
+def reload_if_changed():
+    """
+    Hot-swaps the resources when a completed rebuild or catalog update (e.g. by another process)
+    changed the artifacts on disk. Does nothing while a rebuild or delta replay is still in progress
+    (see build_graph.artifacts_complete).
+
+    Returns:
+        bool: Whether a new resource set was loaded.
+    """
+    manifest = load_manifest()
+    if not _manager.is_loaded() or not artifacts_complete(manifest):
+        return False
+    if _artifact_version(manifest, current_snapshot(manifest)) == catalog_version():
+        return False
+    logger.info("Artifacts changed on disk; reloading resources...")
+    reload_resources()
+    return True
+
+
+def warm_up(reload_interval=RESOURCE_RELOAD_INTERVAL):
+    """
+    Loads the resources ahead of the first request and, with a reload interval, keeps checking
+    for new artifacts (reload_if_changed). Meant to run in a background thread of each server process.
+
+    Args:
+        reload_interval (float, optional): Seconds between checks; None stops after loading.
+
+    Returns:
+        None
+    """
+    try:
+        load_resources()
+    except Exception as e:
+        logger.error(f"Resource warm-up failed: {e}")
+    if not reload_interval:
+        return
+    while True:
+        time.sleep(reload_interval)
+        try:
+            reload_if_changed()
+        except Exception as e:
+            logger.error(f"Resource reload failed: {e}")
+
+
+def _artifact_version(manifest=None, snapshot=None):
+    """
+    Fingerprints an artifact set: the base build (keys of every stage) plus the catalog snapshot
+    served on top of it, if any. Any rebuild, catalog update or delta replay yields a new version.
+    Without arguments, fingerprints the set currently published on disk.
+
+    Args:
+        manifest (dict, optional): Build manifest of the set.
+        snapshot (dict, optional): Catalog snapshot pointer of the set (see catalog.read_snapshot).
+
+    Returns:
+        str: Short version string.
+    """
+    if manifest is None:
+        manifest = load_manifest()
+        snapshot = current_snapshot(manifest)
+    return f"{build_id(manifest)[:12]}.{snapshot['version'] if snapshot else 'base'}"
+
+
+def catalog_version() -> str:
+    """
+    Returns the version of the loaded artifact set. Caches of engine results key on it, so they
+    are invalidated when the artifacts are rebuilt or the catalog is updated.
+
+    Returns:
+        str: Version string (see _artifact_version).
+    """
+    return load_resources()['version']
+
+
+def _filters_key(filters):
+    """
+    Turns filter keyword arguments into a hashable, order-independent cache key part.
+    """
+    return tuple(sorted((name, tuple(value) if isinstance(value, list) else value)
+                        for name, value in (filters or {}).items()))
+
+
+def _title_position(res, title):
+    """
+    Returns:
+        int or None: Row position of the first movie with exactly this title, or None.
+    """
+    if title not in res['indices']:
+        return None
+    positions = res['indices'][title]
+    return positions.iloc[0] if isinstance(positions, pd.Series) else positions
+
+
+@memoize(ENGINE_CACHE_SIZE, key=lambda user_input: (catalog_version(), query_key(user_input)), copy=True)
 def get_matches(user_input: str) -> pd.DataFrame:
     """
     Performs fuzzy search on movie titles based on user input.
 
+    Memoized per normalized query and catalog version (see cache_stats).
+
     Args:
         user_input (str): Partial or full movie title to search for.
 
@@ -76,49 +264,300 @@ def get_matches(user_input: str) -> pd.DataFrame:
         pd.DataFrame: Top matched movie titles with their scores and metadata (e.g. genres, release date).
     """
     res = load_resources()
-    return fuzzy_search(user_input, res['metadata'])
+    return fuzzy_search(user_input, res['metadata'], title_index=res['title_index'], display=res['display'])
 
 
-def get_recommendations_by_title(title: str, top_n=15) -> pd.DataFrame:
+def get_completions(prefix: str, limit: int = AUTOCOMPLETE_LIMIT) -> list:
     """
-    Generates movie recommendations based on a given movie title.
+    Returns typeahead completions for a partially typed title, most popular first.
 
     Args:
-        title (str): Title of the reference movie.
+        prefix (str): Text typed so far; matched against the start of any word of a title.
+        limit (int, optional): Maximum number of completions. Defaults to AUTOCOMPLETE_LIMIT.
+
+    Returns:
+        list[dict]: Completions with 'id', 'title' and 'year' (empty for prefixes shorter than
+                    AUTOCOMPLETE_MIN_CHARS).
+    """
+    if len(prefix.strip()) < AUTOCOMPLETE_MIN_CHARS:
+        return []
+
+    res = load_resources()
+    positions = res['prefix_index'].complete(prefix, limit=limit)
+    metadata = res['metadata']
+    ids = metadata['id'].to_numpy()[positions]
+    titles = metadata['title'].to_numpy()[positions]
+    dates = metadata['release_date'].to_numpy()[positions]
+    return [
+        {'id': int(movie_id), 'title': title, 'year': date[:4] if isinstance(date, str) else ''}
+        for movie_id, title, date in zip(ids, titles, dates)
+    ]
+
+
+@memoize(ENGINE_CACHE_SIZE, copy=True,
+         key=lambda movie_id, top_n=15, filters=None: (catalog_version(), movie_id, top_n, _filters_key(filters)))
+def get_recommendations_by_id(movie_id: int, top_n=15, filters=None) -> pd.DataFrame:
+    """
+    Generates movie recommendations based on a given movie id.
+
+    Memoized per arguments and catalog version (see cache_stats).
+
+    Args:
+        movie_id (int): Id of the reference movie.
         top_n (int, optional): Number of recommendations to return. Defaults to 15.
+        filters (dict, optional): FacetIndex.mask arguments restricting the recommended movies.
 
     Returns:
-        pd.DataFrame: DataFrame containing recommended movies with metadata (title, genres, release date).
-                     Returns empty DataFrame if the title is not found.
+        pd.DataFrame: top_n distinct movies, most similar first, with id, title, genres, release date and
+                      cosine similarity 'score'. Returns empty DataFrame if the id is not found.
     """
     res = load_resources()
 
-    if title not in res['indices']:
-        return pd.DataFrame()  # Title not found
+    if movie_id not in res['id_positions'].index:
+        return pd.DataFrame()  # Id not found
 
     return get_recommendations(
-        title,
+        movie_id,
         res['nn_model'],
         res['metadata'],
-        res['indices'],
-        res['count_matrix'],
-        top_n=top_n
+        res['id_positions'],
+        res['vectors'],
+        top_n=top_n,
+        neighbor_indices=res['neighbor_indices'],
+        neighbor_distances=res['neighbor_distances'],
+        display=res['display'],
+        allowed=_filter_mask(res, filters)
     )
 
 
-def get_top_rated_movies(top_n=100, percentile=0.90) -> pd.DataFrame:
+@memoize(ENGINE_CACHE_SIZE, copy=True,
+         key=lambda title, top_n=15, filters=None: (catalog_version(), title, top_n, _filters_key(filters)))
+def get_recommendations_by_title(title: str, top_n=15, filters=None) -> pd.DataFrame:
+    """
+    Generates movie recommendations based on a given movie title (the first movie with that title).
+
+    Memoized per arguments and catalog version (see cache_stats).
+
+    Args:
+        title (str): Title of the reference movie.
+        top_n (int, optional): Number of recommendations to return. Defaults to 15.
+        filters (dict, optional): FacetIndex.mask arguments restricting the recommended movies.
+
+    Returns:
+        pd.DataFrame: Same as get_recommendations_by_id. Returns empty DataFrame if the title is not found.
+    """
+    res = load_resources()
+    position = _title_position(res, title)
+    if position is None:
+        return pd.DataFrame()  # Title not found
+
+    return get_recommendations_by_id(res['display']['id'].iat[position], top_n=top_n, filters=filters)
+
+
+def resolve_title(title: str):
+    """
+    Finds the movie a title refers to. An exact catalog title (e.g. picked from the matches page)
+    resolves directly to the first movie with that title, without fuzzy search; anything else
+    resolves to the best fuzzy match.
+
+    Args:
+        title (str): Exact or approximate movie title.
+
+    Returns:
+        tuple or None: (movie id, catalog title), or None when nothing matches.
+    """
+    res = load_resources()
+    position = _title_position(res, title)
+    if position is not None:
+        return int(res['display']['id'].iat[position]), title
+
+    matches = get_matches(title)
+    if matches.empty:
+        return None
+    return int(matches.iloc[0]['id']), matches.iloc[0]['title']
+
+
+def cache_stats() -> dict:
+    """
+    Reports the memoization counters of the engine functions, for sizing ENGINE_CACHE_SIZE.
+
+    Returns:
+        dict: Function name -> size, max_entries, hits, misses, evictions, expirations and hit_rate.
+    """
+    return {func.__name__: func.cache.stats()
+            for func in (get_matches, get_recommendations_by_id, get_recommendations_by_title)}
+
+
+def clear_caches() -> None:
+    """
+    Drops the memoized engine results (the counters are kept), e.g. before a cold benchmark run.
+    """
+    for func in (get_matches, get_recommendations_by_id, get_recommendations_by_title):
+        func.cache.clear()
+
+
+def _first_positions(column, values):
+    """
+    Maps values to the position of their first occurrence in a metadata column.
+
+    Returns:
+        np.ndarray: Row positions, -1 for values that do not occur.
+    """
+    first = ~column.duplicated(keep='first').to_numpy()
+    positions = pd.Index(column[first]).get_indexer(values)
+    return np.where(positions >= 0, np.flatnonzero(first)[positions], -1)
+
+
+def get_recommendations_batch(titles=None, ids=None, top_n=15) -> pd.DataFrame:
+    """
+    Generates recommendations for many movies in one vectorized neighbor query. A title or id
+    given more than once is answered once.
+
+    Args:
+        titles (list[str], optional): Titles of the reference movies (first movie with each title).
+        ids (list[int], optional): Movie ids of the reference movies.
+        top_n (int, optional): Number of recommendations per movie. Defaults to 15.
+
+    Returns:
+        pd.DataFrame: One row per recommendation with 'query' (the requested title or id), 'rank'
+                      (1 = most similar), 'id', 'title', 'release_date', 'genres' and 'score', grouped
+                      by query in the order of first request. Unknown titles and ids have no rows.
+    """
+    res = load_resources()
+    metadata = res['metadata']
+    titles = list(dict.fromkeys(titles or []))
+    ids = list(dict.fromkeys(ids or []))
+
+    title_rows = _first_positions(metadata['title'], titles)
+    id_rows = res['id_positions'].reindex(pd.to_numeric(pd.Series(ids, dtype=object), errors='coerce'))
+    id_rows = id_rows.fillna(-1).to_numpy(dtype=np.int64)
+
+    queries = np.array(titles + ids, dtype=object)
+    rows = np.concatenate([title_rows, id_rows]).astype(np.int64)
+    found = rows >= 0
+    distances, positions = get_unique_neighbors(rows[found], res['display']['id'].to_numpy(), res['nn_model'],
+                                                res['vectors'], top_n=top_n,
+                                                neighbor_indices=res['neighbor_indices'],
+                                                neighbor_distances=res['neighbor_distances'])
+
+    recommendations = res['display'].take(positions.ravel()).reset_index(drop=True)
+    recommendations['score'] = 1.0 - distances.ravel()
+    recommendations.insert(0, 'query', np.repeat(queries[found], positions.shape[1]))
+    recommendations.insert(1, 'rank', np.tile(np.arange(1, positions.shape[1] + 1), int(found.sum())))
+    return recommendations[positions.ravel() >= 0].reset_index(drop=True)
+
+
+def _ratings(res, percentile):
+    """
+    Returns the cached weighted rating of every movie for a percentile, computing it on first use.
+    """
+    ratings = res['ratings'].get(percentile)
+    if ratings is None:
+        ratings = res['ratings'][percentile] = weighted_ratings(res['metadata'], percentile)
+    return ratings
+
+
+def _build_leaderboard(res, percentile, size=LEADERBOARD_SIZE):
+    """
+    Ranks the top `size` movies by weighted rating, ready for display.
+
+    Returns:
+        tuple: (size, pd.DataFrame of the top movies with missing values filled with 'Unknown').
+    """
+    top_movies = get_top_movies(res['metadata'], top_n=size, ratings=_ratings(res, percentile))
+    return size, top_movies.fillna('Unknown')
+
+
+def _reset_leaderboards(res):
+    """
+    Drops the cached ratings and leaderboards, then ranks the default percentile again.
+    """
+    res['ratings'] = {}
+    res['leaderboards'] = {TOP_MOVIES_PERCENTILE: _build_leaderboard(res, TOP_MOVIES_PERCENTILE)}
+
+
+def _filter_mask(res, filters):
+    """
+    Turns filter keyword arguments into a row mask.
+
+    Returns:
+        np.ndarray or None: Boolean mask over the metadata rows, or None when no filter is set.
+    """
+    return res['facets'].mask(**filters) if filters else None
+
+
+def get_top_rated_movies(top_n=100, percentile=TOP_MOVIES_PERCENTILE, filters=None) -> pd.DataFrame:
     """
     Returns the top N movies based on a weighted IMDb-style rating.
 
+    Ratings and leaderboards are computed once per percentile and cached with the resources, so an
+    unfiltered request only slices the precomputed ordering. Filtered requests rank the movies left
+    by the facet indexes.
+
     Args:
         top_n (int, optional): Number of top-rated movies to return. Defaults to 100.
         percentile (float, optional): Minimum vote count threshold percentile. Defaults to 0.90.
+        filters (dict, optional): FacetIndex.mask arguments (genres, year_from, year_to, director).
 
     Returns:
         pd.DataFrame: DataFrame of top-rated movies, sorted by weighted rating.
                       Missing values are filled with 'Unknown'.
     """
     res = load_resources()
-    metadata = res['metadata']
-    top_movies_df = get_top_movies(metadata, top_n=top_n, percentile=percentile)
-    return top_movies_df.fillna('Unknown')
+    allowed = _filter_mask(res, filters)
+    if allowed is not None:
+        top_movies = get_top_movies(res['metadata'], top_n=top_n, ratings=_ratings(res, percentile), allowed=allowed)
+        return top_movies.fillna('Unknown')
+
+    leaderboards = res['leaderboards']
+    size, leaderboard = leaderboards.get(percentile, (0, None))
+    if leaderboard is None or top_n > size:
+        size, leaderboard = _build_leaderboard(res, percentile, max(top_n, LEADERBOARD_SIZE))
+        leaderboards[percentile] = (size, leaderboard)
+    return leaderboard.head(top_n).copy()
+
+
+def update_catalog(movies: pd.DataFrame = None, delete_ids=None) -> int:
+    """
+    Adds, updates or deletes movies without rebuilding all artifacts.
+
+    New and changed movies are vectorized against the saved vocabulary and weighting, the neighbor table and
+    index are updated incrementally, the batch is appended to the delta log and the updated set is published
+    as a new catalog snapshot (see catalog.persist_catalog). The updated set is swapped in atomically;
+    requests keep being served from the previous one meanwhile. Updates from several processes are
+    serialized by the artifact file lock, and batches logged by another process are applied first.
+
+    Args:
+        movies (pd.DataFrame, optional): Movies to add or replace (matched by 'id'), with the
+                                         movies_metadata.csv columns plus raw 'cast', 'crew' and 'keywords'.
+        delete_ids (iterable[int], optional): Ids of movies to delete.
+
+    Returns:
+        int: New catalog version (number of batches applied so far).
+    """
+    with _manager.exclusive() as res, file_lock(ARTIFACT_LOCK_PATH):
+        if res['base'] != build_id(load_manifest()):
+            raise ValueError("The artifacts were rebuilt since they were loaded; reload them before updating.")
+        vocabulary = load_vocabulary(res['vocabulary_path'])
+        weighting = load_model(res['weighting_path'])
+        if vocabulary is None or weighting is None:
+            raise ValueError("No saved vocabulary for the count matrix; rebuild the artifacts once before updating.")
+
+        # Batches logged by another process since these resources were loaded come first
+        current = res
+        if res['deltas'] < len(read_delta_log()):
+            current, vocabulary = replay_delta_log(res, vocabulary, weighting, start=res['deltas'])
+
+        updated, vocabulary = apply_catalog_update(current, vocabulary, weighting, movies, delete_ids)
+        updated['title_index'] = TitleSearchIndex(updated['metadata']['title'])
+        updated['prefix_index'] = PrefixIndex(updated['metadata']['title'], updated['metadata']['vote_count'])
+        updated['display'] = build_display_frame(updated['metadata'])
+        updated['id_positions'] = build_id_positions(updated['metadata'])
+        updated['facets'] = FacetIndex(updated['metadata'])
+        _reset_leaderboards(updated)
+        # Log first: a snapshot missing a logged batch is completed by the next ensure_artifacts
+        version = append_delta_log(movies, delete_ids)
+        persisted = persist_catalog(updated, vocabulary, weighting, res['base'], version)
+        persisted.update({'version': _artifact_version(), 'base': res['base'], 'deltas': version})
+        _manager.swap(persisted)
+    return version
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+from data_cleaning import clean_data
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+_MAX_YEAR = 9999
+
+
+def _postings(values, positions):
+    """
+    Groups row positions by value.
+
+    Args:
+        values (array-like): Facet value of each entry (empty values are skipped).
+        positions (np.ndarray): Row position of each entry.
+
+    Returns:
+        dict: value -> sorted, distinct row positions (int32).
+    """
+    groups = pd.Series(positions).groupby(np.asarray(values, dtype=object)).indices
+    return {value: np.unique(positions[locations]).astype(np.int32)
+            for value, locations in groups.items() if isinstance(value, str) and value}
+
+
+def release_years(release_dates):
+    """
+    Extracts the release year of every movie.
+
+    Returns:
+        np.ndarray: Year per row (int16), -1 when the date is missing or malformed.
+    """
+    years = pd.to_numeric(pd.Series(release_dates, dtype=object).str[:4], errors='coerce')
+    return years.fillna(-1).to_numpy(dtype=np.int16)
+
+
+class FacetIndex:
+    """
+    Posting lists over genres, release year and director, built once at load time.
+
+    A filter is answered by OR-ing the posting lists of the requested values into a boolean
+    row bitmap and AND-ing the facets together, so no DataFrame column is scanned per request.
+    Years are kept sorted, and a year range is one contiguous slice found with searchsorted.
+
+    Args:
+        metadata (pd.DataFrame): Movie metadata with cleaned 'genres' lists, cleaned 'director'
+                                 names and 'release_date' strings.
+    """
+
+    def __init__(self, metadata):
+        self.size = len(metadata)
+        rows = np.arange(self.size)
+
+        genres = [value if isinstance(value, list) else [] for value in metadata['genres']]
+        self.genres = _postings([genre for value in genres for genre in value],
+                                np.repeat(rows, [len(value) for value in genres]))
+        self.directors = _postings(metadata['director'].to_numpy(), rows)
+
+        years = release_years(metadata['release_date'])
+        self.year_order = np.argsort(years, kind='stable').astype(np.int32)
+        self.sorted_years = years[self.year_order]
+        logger.info(f"Facet index built: {len(self.genres)} genres, {len(self.directors)} directors.")
+
+    def _any_of(self, postings, values):
+        """
+        Returns the bitmap of rows holding at least one of the values (cleaned like the metadata).
+        """
+        if isinstance(values, str):
+            values = [values]
+        mask = np.zeros(self.size, dtype=bool)
+        for value in values:
+            mask[postings.get(clean_data(value), [])] = True
+        return mask
+
+    def mask(self, genres=None, year_from=None, year_to=None, director=None):
+        """
+        Builds the row bitmap of the movies matching every given filter.
+
+        Args:
+            genres (str or list[str], optional): Movies with any of these genres.
+            year_from (int, optional): Earliest release year (inclusive).
+            year_to (int, optional): Latest release year (inclusive).
+            director (str or list[str], optional): Movies by any of these directors.
+
+        Returns:
+            np.ndarray or None: Boolean mask over the metadata rows, or None when no filter is given.
+        """
+        mask = None
+        if genres:
+            mask = self._any_of(self.genres, genres)
+        if director:
+            by_director = self._any_of(self.directors, director)
+            mask = by_director if mask is None else mask & by_director
+        if year_from is not None or year_to is not None:
+            # Movies without a known year (-1) fall outside every range
+            first = 0 if year_from is None else min(max(int(year_from), 0), _MAX_YEAR)
+            last = _MAX_YEAR if year_to is None else min(max(int(year_to), -1), _MAX_YEAR)
+            start = np.searchsorted(self.sorted_years, first, 'left')
+            stop = np.searchsorted(self.sorted_years, last, 'right')
+            by_year = np.zeros(self.size, dtype=bool)
+            by_year[self.year_order[start:stop]] = True
+            mask = by_year if mask is None else mask & by_year
+        return mask
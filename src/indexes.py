@@ -0,0 +1,317 @@
+import copy
+import numpy as np
+from scipy.sparse import issparse
+from sklearn.neighbors import NearestNeighbors
+from sklearn.preprocessing import normalize
+from utils import to_dense, save_model, load_model
+from config import INDEX_BACKEND, LSH_PARAMS, ARTIFACT_STORAGE, EMBEDDING_DIM
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+
+class DotProductIndex:
+    """
+    Exact cosine nearest-neighbor search over a matrix whose rows are already L2-normalized
+    (the sparse feature matrix built by vectorization, or dense embeddings). Similarity is a plain
+    dot product (a dense GEMM for embeddings): neither the matrix nor the queries are normalized
+    again, and fitting only keeps a reference to the (possibly memory-mapped) matrix.
+    """
+
+    def __init__(self, n_neighbors=11):
+        self.n_neighbors = n_neighbors
+
+    def fit(self, matrix):
+        """
+        Stores the matrix.
+
+        Args:
+            matrix (csr_matrix or np.ndarray): Matrix with unit-length rows, possibly memory-mapped.
+
+        Returns:
+            DotProductIndex: The fitted index.
+        """
+        self.matrix_ = matrix
+        return self
+
+    def kneighbors(self, X, n_neighbors=None, return_distance=True):
+        """
+        Finds the exact nearest neighbors of each query row (rows of the same normalized space).
+
+        Returns:
+            tuple or np.ndarray: (distances, indices) arrays of shape (n_queries, n_neighbors),
+                                 or only the indices if return_distance is False.
+        """
+        n_neighbors = n_neighbors or self.n_neighbors
+        if not issparse(X):
+            X = np.atleast_2d(X)
+        similarities = to_dense(X @ self.matrix_.T)
+
+        indices = np.argpartition(-similarities, n_neighbors - 1, axis=1)[:, :n_neighbors]
+        top = np.take_along_axis(similarities, indices, axis=1)
+        order = np.argsort(-top, axis=1, kind='stable')
+        indices = np.take_along_axis(indices, order, axis=1)
+        distances = 1.0 - np.take_along_axis(top, order, axis=1)
+
+        if return_distance:
+            return distances, indices
+        return indices
+
+
+class LSHIndex:
+    """
+    Approximate cosine nearest-neighbor index based on random-projection (SimHash) LSH.
+
+    Every movie vector is hashed by n_tables independent sets of n_bits random hyperplanes.
+    A query only scores the movies that share a bucket with it in at least one table,
+    plus n_probes neighboring buckets per table (the buckets reached by flipping the
+    query's least certain bits). Candidates are then re-ranked with exact cosine distance.
+
+    Recall/latency trade-offs:
+        - more n_tables or n_probes: higher recall, more candidates to score;
+        - more n_bits: smaller buckets, fewer candidates, lower recall.
+
+    Exposes the same fit/kneighbors interface as sklearn's NearestNeighbors.
+    """
+
+    def __init__(self, n_tables=8, n_bits=12, n_probes=4, n_neighbors=11, random_state=42):
+        if not 1 <= n_bits <= 62:
+            raise ValueError("n_bits must be between 1 and 62.")
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.n_probes = min(n_probes, n_bits)
+        self.n_neighbors = n_neighbors
+        self.random_state = random_state
+
+    def _project(self, X):
+        """
+        Projects L2-normalized rows on the random hyperplanes.
+
+        Returns:
+            np.ndarray: Array of shape (n_rows, n_tables, n_bits).
+        """
+        projected = X @ self.hyperplanes_
+        return np.asarray(projected, dtype=np.float32).reshape(X.shape[0], self.n_tables, self.n_bits)
+
+    def _codes(self, projected):
+        """
+        Packs the projection signs into one integer bucket code per table.
+
+        Returns:
+            np.ndarray: int64 array of shape (n_rows, n_tables).
+        """
+        weights = np.left_shift(np.int64(1), np.arange(self.n_bits, dtype=np.int64))
+        return ((projected > 0).astype(np.int64) * weights).sum(axis=2)
+
+    def fit(self, matrix):
+        """
+        Hashes every row of the matrix into the LSH tables.
+
+        Args:
+            matrix (csr_matrix): Movie feature matrix (e.g. the count matrix).
+
+        Returns:
+            LSHIndex: The fitted index.
+        """
+        rng = np.random.default_rng(self.random_state)
+        self.matrix_ = normalize(matrix.astype(np.float32), norm='l2', axis=1).tocsr()
+        self.hyperplanes_ = rng.standard_normal((matrix.shape[1], self.n_tables * self.n_bits)).astype(np.float32)
+
+        codes = self._codes(self._project(self.matrix_))
+        self.bucket_order_ = np.argsort(codes, axis=0, kind='stable').astype(np.int32)
+        self.bucket_codes_ = np.take_along_axis(codes, self.bucket_order_, axis=0)
+        logger.info(f"LSH index fitted: {matrix.shape[0]} rows, {self.n_tables} tables x {self.n_bits} bits.")
+        return self
+
+    def update(self, matrix, remap):
+        """
+        Returns a new index for a catalog whose surviving rows were kept in order and whose new rows
+        were appended (see catalog.apply_catalog_update). Only the appended rows are hashed; the
+        surviving rows keep their bucket codes. The fitted index itself is not modified, so it can
+        keep serving while the update runs.
+
+        Hyperplane rows for columns added since the fit are drawn from the same random stream as
+        in fit, so the result is the same as fitting the updated matrix from scratch.
+
+        Args:
+            matrix (csr_matrix): Updated feature matrix.
+            remap (np.ndarray): New position of each previously fitted row, -1 for removed rows.
+
+        Returns:
+            LSHIndex: The updated index.
+        """
+        n_kept = int((remap >= 0).sum())
+        codes = np.empty_like(self.bucket_codes_)
+        np.put_along_axis(codes, self.bucket_order_.astype(np.int64), self.bucket_codes_, axis=0)
+
+        updated = copy.copy(self)
+        updated.matrix_ = normalize(matrix.astype(np.float32), norm='l2', axis=1).tocsr()
+        if matrix.shape[1] > self.hyperplanes_.shape[0]:
+            rng = np.random.default_rng(self.random_state)
+            planes = rng.standard_normal((matrix.shape[1], self.n_tables * self.n_bits)).astype(np.float32)
+            updated.hyperplanes_ = np.vstack([self.hyperplanes_, planes[self.hyperplanes_.shape[0]:]])
+
+        new_codes = updated._codes(updated._project(updated.matrix_[n_kept:]))
+        codes = np.vstack([codes[remap >= 0], new_codes])
+        updated.bucket_order_ = np.argsort(codes, axis=0, kind='stable').astype(np.int32)
+        updated.bucket_codes_ = np.take_along_axis(codes, updated.bucket_order_, axis=0)
+        logger.info(f"LSH index updated: {matrix.shape[0] - n_kept} rows hashed, {n_kept} kept.")
+        return updated
+
+    def _candidates(self, codes, projected):
+        """
+        Collects the movies sharing a probed bucket with one query.
+
+        Args:
+            codes (np.ndarray): Query bucket code per table.
+            projected (np.ndarray): Query projections, shape (n_tables, n_bits).
+
+        Returns:
+            np.ndarray: Unique candidate row positions.
+        """
+        found = []
+        for table in range(self.n_tables):
+            # Probe the exact bucket, then the buckets across the least certain hyperplanes
+            uncertain_bits = np.argsort(np.abs(projected[table]))[:self.n_probes]
+            probes = np.concatenate(([codes[table]], codes[table] ^ np.left_shift(np.int64(1), uncertain_bits)))
+            column = self.bucket_codes_[:, table]
+            starts = np.searchsorted(column, probes, side='left')
+            stops = np.searchsorted(column, probes, side='right')
+            for start, stop in zip(starts, stops):
+                if stop > start:
+                    found.append(self.bucket_order_[start:stop, table])
+        if not found:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(np.concatenate(found))
+
+    def kneighbors(self, X, n_neighbors=None, return_distance=True):
+        """
+        Finds approximate nearest neighbors of each query row.
+
+        Queries whose probed buckets hold fewer than n_neighbors movies fall back to an
+        exact scan, so every query returns exactly n_neighbors results.
+
+        Args:
+            X (csr_matrix): Query rows in the same feature space as the fitted matrix.
+            n_neighbors (int, optional): Number of neighbors to return. Defaults to self.n_neighbors.
+            return_distance (bool): Whether to return the cosine distances as well.
+
+        Returns:
+            tuple or np.ndarray: (distances, indices) arrays of shape (n_queries, n_neighbors),
+                                 or only the indices if return_distance is False.
+        """
+        n_neighbors = n_neighbors or self.n_neighbors
+        queries = normalize(X.astype(np.float32), norm='l2', axis=1).tocsr()
+        projected = self._project(queries)
+        codes = self._codes(projected)
+
+        distances = np.empty((queries.shape[0], n_neighbors), dtype=np.float32)
+        indices = np.empty((queries.shape[0], n_neighbors), dtype=np.int64)
+        for row in range(queries.shape[0]):
+            candidates = self._candidates(codes[row], projected[row])
+            if candidates.size < n_neighbors:
+                candidates = np.arange(self.matrix_.shape[0])
+            similarities = (self.matrix_[candidates] @ queries[row].T).toarray().ravel()
+            top = np.argpartition(-similarities, n_neighbors - 1)[:n_neighbors]
+            top = top[np.argsort(-similarities[top], kind='stable')]
+            indices[row] = candidates[top]
+            distances[row] = 1.0 - similarities[top]
+
+        if return_distance:
+            return distances, indices
+        return indices
+
+
+# Index backends selectable through config.INDEX_BACKEND
+INDEX_BACKENDS = {
+    'brute': NearestNeighbors,
+    'lsh': LSHIndex,
+}
+
+
+def create_index(backend=INDEX_BACKEND):
+    """
+    Creates an unfitted nearest-neighbor index for the given backend.
+
+    Args:
+        backend (str): One of INDEX_BACKENDS ('brute' for exact cosine search, 'lsh' for approximate).
+
+    Returns:
+        NearestNeighbors or LSHIndex: Unfitted index exposing fit() and kneighbors().
+    """
+    if backend == 'brute':
+        return NearestNeighbors(metric='cosine', algorithm='brute', n_neighbors=11, n_jobs=-1)
+    if backend == 'lsh':
+        return LSHIndex(**LSH_PARAMS)
+    raise ValueError(f"Unknown index backend '{backend}'. Expected one of: {', '.join(INDEX_BACKENDS)}.")
+
+
+def train_model(count_matrix, backend=INDEX_BACKEND):
+    """
+    Trains a nearest-neighbor index using the given count matrix.
+
+    Args:
+        count_matrix (csr_matrix): Feature matrix (see vectorization).
+        backend (str): Index backend, see indexes.INDEX_BACKENDS ('brute' or 'lsh').
+
+    Returns:
+        NearestNeighbors or LSHIndex: Trained nearest neighbor model.
+    """
+    model = create_index(backend)
+    model.fit(count_matrix)
+    return model
+
+
+def update_index(model, matrix, remap):
+    """
+    Brings a fitted nearest-neighbor index up to date after a catalog update without modifying it.
+    The LSH index only hashes the appended rows (LSHIndex.update); the exact indexes merely keep a
+    reference to the matrix, so a fresh copy is fitted.
+
+    Args:
+        model: Fitted index (NearestNeighbors, DotProductIndex or LSHIndex).
+        matrix (csr_matrix or np.ndarray): Updated matrix the index searches.
+        remap (np.ndarray): New position of each previously fitted row, -1 for removed rows.
+
+    Returns:
+        The updated index.
+    """
+    if isinstance(model, LSHIndex):
+        return model.update(matrix, remap)
+    return copy.copy(model).fit(matrix)
+
+
+def index_is_persisted():
+    """
+    Returns:
+        bool: Whether the configured index is saved with the artifacts. The brute-force backend with
+              'mmap' storage and the embedding mode use a dot-product index refitted on the
+              memory-mapped vectors at load time instead.
+    """
+    return not (EMBEDDING_DIM or (INDEX_BACKEND == 'brute' and ARTIFACT_STORAGE == 'mmap'))
+
+
+def get_or_train_model(count_matrix, model_path, backend=INDEX_BACKEND, mmap_mode=None):
+    """
+    Loads a trained nearest-neighbor model if it exists and matches the configured backend;
+    otherwise trains and saves a new one.
+
+    With mmap_mode='r' the saved model's arrays are memory-mapped. The brute-force backend
+    is then not persisted at all: the (shared, memory-mapped) feature matrix already has unit
+    rows, so a dot-product index over it is used instead of a second private copy of the matrix.
+
+    Returns:
+        NearestNeighbors, DotProductIndex or LSHIndex: Trained model.
+    """
+    if backend == 'brute' and mmap_mode:
+        return DotProductIndex().fit(count_matrix)
+
+    model = load_model(model_path, mmap_mode=mmap_mode)
+    if model is not None and not isinstance(model, INDEX_BACKENDS[backend]):
+        logger.info(f"Saved model does not match the '{backend}' index backend. Retraining...")
+        model = None
+    if model is None:
+        logger.info("No pre-trained model found. Training now...")
+        model = train_model(count_matrix, backend)
+        save_model(model, model_path)
+    return model
@@ -0,0 +1,213 @@
+import pandas as pd
+from data_cleaning import extract_names, extract_directors
+from data_preprocessing import extract_raw_data
+from metadata_cache import metadata_cache_is_fresh, save_metadata_cache, source_fingerprint
+from utils import save_model, save_csr_matrix, save_vocabulary
+from vectorization import FeatureWeighting, create_vocabulary
+from logging_config import setup_logging
+from config import INGEST_CHUNK_SIZE
+
+logger = setup_logging()
+
+
+class _DtypeTracker:
+    """
+    Tracks, over every raw chunk, which columns pandas would parse as numbers or booleans
+    when reading the whole file at once. Chunks are read as strings so that per-chunk
+    inference cannot disagree; restore() then applies the whole-file types.
+    """
+
+    def __init__(self):
+        self.numeric = {}
+        self.boolean = {}
+        self.missing = {}
+
+    def update(self, chunk):
+        """
+        Records the value types seen in one raw chunk (before any rows are filtered out).
+
+        Returns:
+            None
+        """
+        for column in chunk.columns:
+            values = chunk[column]
+            present = values.notna()
+            numeric = pd.to_numeric(values, errors='coerce').notna()
+            self.numeric[column] = self.numeric.get(column, True) and bool((numeric | ~present).all())
+            self.boolean[column] = self.boolean.get(column, True) and bool((values.isin(['True', 'False']) | ~present).all())
+            self.missing[column] = self.missing.get(column, False) or bool((~present).any())
+
+    def restore(self, metadata):
+        """
+        Converts the string columns of the assembled metadata to the whole-file types.
+
+        Returns:
+            pd.DataFrame: Metadata with numeric and boolean columns converted.
+        """
+        for column, numeric in self.numeric.items():
+            if column == 'id' or column not in metadata.columns:
+                continue
+            if numeric and self.missing[column]:
+                metadata[column] = pd.to_numeric(metadata[column]).astype(float)
+            elif numeric:
+                metadata[column] = pd.to_numeric(metadata[column])
+            elif self.boolean[column]:
+                metadata[column] = metadata[column].map({'True': True, 'False': False})
+                if not self.missing[column]:
+                    metadata[column] = metadata[column].astype(bool)
+        return metadata
+
+
+def _stream_credits(credits_path, chunk_size):
+    """
+    Reduces credits.csv to compact per-movie features, one chunk at a time.
+
+    Returns:
+        pd.DataFrame: Columns 'id', 'cast' (top 3 cleaned names) and 'director'.
+    """
+    parts = []
+    for chunk in pd.read_csv(credits_path, chunksize=chunk_size):
+        parts.append(pd.DataFrame({
+            'id': chunk['id'].to_numpy(),
+            'cast': [extract_names(val) for val in chunk['cast'].to_numpy()],
+            'director': extract_directors(chunk['crew']).to_numpy(),
+        }))
+    return pd.concat(parts, ignore_index=True)
+
+
+def _stream_keywords(keywords_path, chunk_size):
+    """
+    Reduces keywords.csv to compact per-movie features, one chunk at a time.
+
+    Returns:
+        pd.DataFrame: Columns 'id' and 'keywords' (top 3 cleaned keywords).
+    """
+    parts = []
+    for chunk in pd.read_csv(keywords_path, chunksize=chunk_size):
+        parts.append(pd.DataFrame({
+            'id': chunk['id'].to_numpy(),
+            'keywords': [extract_names(val) for val in chunk['keywords'].to_numpy()],
+        }))
+    return pd.concat(parts, ignore_index=True)
+
+
+def stream_ingest(metadata_path, credits_path, keywords_path, chunk_size=INGEST_CHUNK_SIZE):
+    """
+    Builds the merged metadata and the field-weighted token counts by streaming the raw CSVs in chunks.
+
+    credits.csv and keywords.csv are reduced chunk by chunk to the few cleaned names the
+    feature matrix needs, then movies_metadata.csv is streamed, cleaned, merged and
+    vectorized one chunk at a time. The result matches load_and_merge_metadata followed by
+    vectorizing the whole catalog at once.
+
+    Memory bound: the raw credits and keywords text (most of the raw data) and whole-file
+    parsing are never held at once, but the output is: peak memory is one raw chunk plus the
+    reduced credits and keywords, the cleaned metadata (twice while the chunks are concatenated)
+    and its token counts (twice while the shards are stacked). The cleaned catalog must fit in
+    memory, as it must for serving.
+
+    Args:
+        metadata_path (str): Path to the movie metadata CSV file.
+        credits_path (str): Path to the movie credits CSV file.
+        keywords_path (str): Path to the movie keywords CSV file.
+        chunk_size (int): Number of CSV rows processed at a time.
+
+    Returns:
+        tuple: (metadata DataFrame, weighted counts csr_matrix, vocabulary dict).
+    """
+    credits_df = _stream_credits(credits_path, chunk_size)
+    keywords = _stream_keywords(keywords_path, chunk_size)
+
+    dtypes = _DtypeTracker()
+    seen_ids = set()
+    invalid_adult = 0
+    vocabulary = create_vocabulary()
+    parts = []
+    for chunk in pd.read_csv(metadata_path, chunksize=chunk_size, dtype=str):
+        dtypes.update(chunk)
+
+        # Same cleaning as clean_metadata, with duplicate ids tracked across chunks
+        chunk = chunk[~chunk['id'].isin(seen_ids)].drop_duplicates(subset='id', keep='first')
+        seen_ids.update(chunk['id'].tolist())
+        valid = chunk['adult'].isin(['True', 'False'])
+        invalid_adult += int((~valid).sum())
+        chunk = chunk[valid].copy()
+        chunk['id'] = chunk['id'].astype(int)
+
+        chunk = chunk.merge(credits_df, on='id', how='left')
+        chunk = chunk.merge(keywords, on='id', how='left')
+        for feature in ['cast', 'keywords']:
+            chunk[feature] = [val if isinstance(val, list) else [] for val in chunk[feature].to_numpy()]
+        chunk['director'] = chunk['director'].fillna('')
+        chunk['genres'] = [extract_names(val) for val in chunk['genres'].to_numpy()]
+
+        vocabulary.add_chunk(chunk)
+        parts.append(chunk)
+
+    logger.info(f"Found {invalid_adult} rows with invalid 'adult' values.")
+    metadata = pd.concat(parts, ignore_index=True)
+    parts.clear()  # Don't hold the chunks next to the assembled frame while the counts are stacked
+    metadata = metadata[[c for c in metadata.columns if c not in ('cast', 'director', 'keywords')]
+                        + ['cast', 'keywords', 'director']]
+    metadata = dtypes.restore(metadata)
+
+    count_matrix, vocab = vocabulary.finalize()
+    logger.info(f"Streamed {len(metadata)} movies into a {count_matrix.shape} count matrix.")
+    return metadata, count_matrix, vocab
+
+
+def ingest_streaming(
+        metadata_path,
+        credits_path,
+        keywords_path,
+        merged_cache_path,
+        matrix_path,
+        matrix_dir,
+        storage='joblib',
+        vocabulary_path=None,
+        weighting_path=None,
+        chunk_size=INGEST_CHUNK_SIZE,
+        zip_path=None,
+        extract_to=None):
+    """
+    Runs stream_ingest, weights the counts into the feature matrix and saves the outputs where
+    load_and_merge_metadata and get_or_build_count_matrix look for them. Does nothing if the
+    metadata cache is up to date.
+
+    Args:
+        metadata_path (str): Path to the movie metadata CSV file.
+        credits_path (str): Path to the movie credits CSV file.
+        keywords_path (str): Path to the movie keywords CSV file.
+        merged_cache_path (str): Path of the columnar metadata cache.
+        matrix_path (str): Count matrix file for the 'joblib' storage mode.
+        matrix_dir (str): Count matrix directory for the 'mmap' storage mode.
+        storage (str): 'joblib' or 'mmap'.
+        vocabulary_path (str, optional): Where to save the vocabulary (needed for incremental updates).
+        weighting_path (str, optional): Where to save the fitted FeatureWeighting (same purpose).
+        chunk_size (int): Number of CSV rows processed at a time.
+        zip_path (str): Path to the zip file (if data needs extraction).
+        extract_to (str): Directory to extract files to (if data needs extraction).
+
+    Returns:
+        None
+    """
+    if zip_path and extract_to:
+        extract_raw_data(zip_path, extract_to)
+
+    source_hash = source_fingerprint([metadata_path, credits_path, keywords_path])
+    if source_hash is None or metadata_cache_is_fresh(merged_cache_path, source_hash):
+        return
+
+    logger.info(f"Streaming raw data in chunks of {chunk_size} rows...")
+    metadata, counts, vocabulary = stream_ingest(metadata_path, credits_path, keywords_path, chunk_size)
+    weighting = FeatureWeighting()
+    count_matrix = weighting.fit_transform(counts)
+    if vocabulary_path:
+        save_vocabulary(vocabulary, vocabulary_path)
+    if weighting_path:
+        save_model(weighting, weighting_path)
+    if storage == 'mmap':
+        save_csr_matrix(count_matrix, matrix_dir)
+    else:
+        save_model(count_matrix, matrix_path)
+    save_metadata_cache(metadata, merged_cache_path, source_hash)
@@ -0,0 +1,114 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded least-recently-used cache with an optional time to live.
+
+    Reads move an entry to the most recent end; inserting past max_entries evicts the least
+    recently used one. Expired entries are dropped when they are read. Hit, miss, eviction and
+    expiration counts are kept for sizing the cache (see stats()).
+
+    Args:
+        max_entries (int): Maximum number of entries kept.
+        ttl (float, optional): Seconds an entry stays valid; None keeps entries until evicted.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for key, or default when it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """
+        Stores value under key, evicting the least recently used entries beyond max_entries.
+        """
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Drops every entry (the counters are kept).
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Returns:
+            dict: size, max_entries, hits, misses, evictions, expirations and hit_rate.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def memoize(max_entries=1024, key=None, ttl=None, copy=False):
+    """
+    Memoizes a function in an LRUCache.
+
+    Args:
+        max_entries (int): Maximum number of cached results.
+        key (callable, optional): Maps the call arguments to a hashable cache key, e.g. to normalize
+                                  them; defaults to the positional and keyword arguments themselves.
+        ttl (float, optional): Seconds a result stays valid.
+        copy (bool): Return result.copy(), so callers may modify results (e.g. DataFrames) freely.
+
+    Returns:
+        callable: Decorator. The wrapped function exposes its cache as .cache.
+    """
+    def decorator(func):
+        cache = LRUCache(max_entries, ttl)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs) if key else (args, tuple(sorted(kwargs.items())))
+            value = cache.get(cache_key, _MISSING)
+            if value is _MISSING:
+                value = func(*args, **kwargs)
+                cache.set(cache_key, value)
+            return value.copy() if copy else value
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+# Bump whenever the on-disk layout or the cleaning pipeline output changes
+CACHE_FORMAT_VERSION = 3
+
+_SEPARATOR = '\x00'
+_HEADER_KEY = '__header__'
+
+
+def source_fingerprint(paths):
+    """
+    Computes a cheap fingerprint of the raw input files (name, size and modification time).
+
+    Args:
+        paths (list[str]): Raw input file paths.
+
+    Returns:
+        str or None: Hex digest, or None if any of the files is missing.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+def _encode_strings(values):
+    """
+    Encodes a sequence of strings as one NUL-separated UTF-8 buffer.
+
+    Returns:
+        np.ndarray: uint8 array holding the encoded buffer.
+    """
+    joined = _SEPARATOR.join(values)
+    if joined.count(_SEPARATOR) != max(len(values) - 1, 0):
+        raise ValueError("String values must not contain NUL characters.")
+    return np.frombuffer(joined.encode('utf-8'), dtype=np.uint8)
+
+
+def _decode_strings(buffer, count):
+    """
+    Decodes a buffer written by _encode_strings.
+
+    Returns:
+        list[str]: Decoded strings.
+    """
+    if count == 0:
+        return []
+    return buffer.tobytes().decode('utf-8').split(_SEPARATOR)
+
+
+def _is_null(value):
+    """
+    Returns:
+        bool: Whether a cell holds a missing value (None, pd.NA or NaN).
+    """
+    return value is None or value is pd.NA or (isinstance(value, float) and np.isnan(value))
+
+
+def _encode_json(values, prefix, arrays, default=None):
+    """
+    Encodes Python values (str, int, float, bool, None and lists of them) as one JSON document,
+    keeping each value's type. NaN is written as JSON NaN and read back as float NaN. Other values
+    are passed to `default` (e.g. str), or raise TypeError without it.
+    """
+    arrays[f'{prefix}json'] = np.frombuffer(json.dumps(values, default=default).encode('utf-8'), dtype=np.uint8)
+
+
+def _encode_column(series, prefix, arrays):
+    """
+    Encodes one DataFrame column into typed arrays.
+
+    Column kinds:
+        - 'numeric': NumPy int/float/bool/datetime columns stored as-is.
+        - 'category': pandas categoricals stored as codes plus string categories.
+        - 'extension': other pandas extension dtypes (Int64, string, boolean, ...) stored as JSON
+                       values (missing values as null) plus the dtype name.
+        - 'list': columns of string lists stored as lengths plus flattened strings, with a null mask.
+        - 'str': object columns of strings stored with a null mask.
+        - 'object': any other object column (e.g. mixed booleans and NaN), stored as JSON values.
+
+    Returns:
+        dict: Header entry of the column ('kind', plus 'dtype' for extension columns).
+
+    Raises:
+        TypeError: If an object column holds values JSON cannot represent.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        arrays[f'{prefix}codes'] = series.cat.codes.to_numpy()
+        categories = [str(c) for c in series.cat.categories]
+        arrays[f'{prefix}categories'] = _encode_strings(categories)
+        arrays[f'{prefix}n_categories'] = np.array([len(categories)])
+        return {'kind': 'category'}
+
+    if isinstance(series.dtype, pd.api.extensions.ExtensionDtype):
+        values = [None if _is_null(v) else v for v in series.astype(object).tolist()]
+        # Values JSON cannot hold (e.g. timestamps) are stored as strings the dtype parses back
+        _encode_json([v.item() if isinstance(v, np.generic) else v for v in values], prefix, arrays, default=str)
+        return {'kind': 'extension', 'dtype': str(series.dtype)}
+
+    if series.dtype != object:
+        arrays[f'{prefix}values'] = series.to_numpy()
+        return {'kind': 'numeric'}
+
+    values = series.tolist()
+    nulls = np.array([_is_null(v) for v in values], dtype=bool)
+    present = [v for v, null in zip(values, nulls) if not null]
+    if present and all(isinstance(v, list) and all(isinstance(item, str) for item in v) for v in present):
+        lists = [[] if null else v for v, null in zip(values, nulls)]
+        arrays[f'{prefix}lengths'] = np.array([len(items) for items in lists], dtype=np.int32)
+        arrays[f'{prefix}items'] = _encode_strings([item for items in lists for item in items])
+        arrays[f'{prefix}nulls'] = nulls
+        return {'kind': 'list'}
+
+    if all(isinstance(v, str) for v in present):
+        arrays[f'{prefix}nulls'] = nulls
+        arrays[f'{prefix}strings'] = _encode_strings(['' if null else v for v, null in zip(values, nulls)])
+        return {'kind': 'str'}
+
+    _encode_json([v.item() if isinstance(v, np.generic) else v for v in values], prefix, arrays)
+    return {'kind': 'object'}
+
+
+def _decode_column(bundle, prefix, column, n_rows):
+    """
+    Decodes one column written by _encode_column.
+
+    Returns:
+        np.ndarray or pd.Categorical or pd.api.extensions.ExtensionArray or list: Column values.
+    """
+    kind = column['kind']
+    if kind == 'numeric':
+        return bundle[f'{prefix}values']
+    if kind == 'category':
+        categories = _decode_strings(bundle[f'{prefix}categories'], int(bundle[f'{prefix}n_categories'][0]))
+        return pd.Categorical.from_codes(bundle[f'{prefix}codes'], categories=categories)
+    if kind in ('extension', 'object'):
+        values = json.loads(bundle[f'{prefix}json'].tobytes().decode('utf-8'))
+        if kind == 'extension':
+            return pd.array(values, dtype=column['dtype'])
+        column_values = np.empty(len(values), dtype=object)
+        column_values[:] = values
+        return column_values
+
+    values = np.empty(n_rows, dtype=object)
+    if kind == 'list':
+        lengths = bundle[f'{prefix}lengths']
+        flat = _decode_strings(bundle[f'{prefix}items'], int(lengths.sum()))
+        offsets = np.concatenate(([0], np.cumsum(lengths))).tolist()
+        values[:] = [flat[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+    else:
+        values[:] = _decode_strings(bundle[f'{prefix}strings'], n_rows)
+    values[bundle[f'{prefix}nulls']] = np.nan
+    return values
+
+
+def save_metadata_cache(metadata, path, source_hash=None):
+    """
+    Saves the merged metadata as a typed, columnar NumPy .npz bundle.
+
+    List columns ('cast', 'keywords', 'genres') are stored as real lists, so loading
+    does not need to re-parse stringified Python.
+
+    Args:
+        metadata (pd.DataFrame): Merged and cleaned metadata.
+        path (str): Destination .npz file.
+        source_hash (str, optional): Fingerprint of the raw inputs the data was built from.
+
+    Returns:
+        None
+    """
+    try:
+        arrays = {}
+        columns = []
+        for position, name in enumerate(metadata.columns):
+            columns.append({'name': str(name), **_encode_column(metadata[name], f'{position}:', arrays)})
+
+        header = {
+            'version': CACHE_FORMAT_VERSION,
+            'source_hash': source_hash,
+            'n_rows': int(len(metadata)),
+            'columns': columns,
+        }
+        arrays[_HEADER_KEY] = np.frombuffer(json.dumps(header).encode('utf-8'), dtype=np.uint8)
+
+        tmp_path = f'{path}.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        logger.info(f"Metadata cache saved to: {path}")
+    except Exception as e:
+        logger.error(f"Failed to save metadata cache to '{path}': {e}")
+
+
+def read_cache_header(path):
+    """
+    Reads only the header of a metadata cache.
+
+    Returns:
+        dict or None: Header (version, source_hash, n_rows, columns), or None if missing or unreadable.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as bundle:
+            return json.loads(bundle[_HEADER_KEY].tobytes().decode('utf-8'))
+    except Exception as e:
+        logger.error(f"Failed to read metadata cache header from '{path}': {e}")
+        return None
+
+
+def metadata_cache_is_fresh(path, source_hash=None):
+    """
+    Checks whether a metadata cache exists in the current format and matches the raw inputs.
+
+    Returns:
+        bool: True if the cache can be used as-is.
+    """
+    header = read_cache_header(path)
+    if header is None or header['version'] != CACHE_FORMAT_VERSION:
+        return False
+    return source_hash is None or header['source_hash'] == source_hash
+
+
+def load_metadata_cache(path, source_hash=None):
+    """
+    Loads merged metadata written by save_metadata_cache.
+
+    Args:
+        path (str): Cached .npz file.
+        source_hash (str, optional): Expected raw input fingerprint. When given, a cache built
+                                     from different raw files, or with no recorded fingerprint,
+                                     is treated as stale.
+
+    Returns:
+        pd.DataFrame or None: Cached metadata, or None if missing, stale or unreadable.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as bundle:
+            header = json.loads(bundle[_HEADER_KEY].tobytes().decode('utf-8'))
+            if header['version'] != CACHE_FORMAT_VERSION:
+                logger.info(f"Metadata cache format {header['version']} is outdated (expected {CACHE_FORMAT_VERSION}).")
+                return None
+            if source_hash is not None and header['source_hash'] != source_hash:
+                logger.info("Metadata cache was built from different (or unrecorded) raw data.")
+                return None
+
+            n_rows = header['n_rows']
+            data = {
+                column['name']: _decode_column(bundle, f'{position}:', column, n_rows)
+                for position, column in enumerate(header['columns'])
+            }
+        return pd.DataFrame(data, columns=[column['name'] for column in header['columns']])
+    except Exception as e:
+        logger.error(f"Failed to load metadata cache from '{path}': {e}")
+        return None
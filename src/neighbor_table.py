@@ -0,0 +1,105 @@
+import numpy as np
+from scipy.sparse import issparse
+from sklearn.preprocessing import normalize
+from utils import save_array, load_array, to_dense
+from config import NEIGHBOR_TABLE_K, NEIGHBOR_BLOCK_SIZE
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+
+def normalize_rows(count_matrix):
+    """
+    L2-normalizes the rows of a feature matrix (or dense embeddings) as float32, so cosine similarity
+    becomes a dot product.
+
+    Returns:
+        csr_matrix or np.ndarray: Normalized float32 matrix, sparse if the input is sparse.
+    """
+    normalized = normalize(count_matrix.astype(np.float32), norm='l2', axis=1)
+    return normalized.tocsr() if issparse(normalized) else normalized
+
+
+def query_top_k(normalized, rows, top_k, block_size=NEIGHBOR_BLOCK_SIZE):
+    """
+    Finds the top K cosine neighbors of the given rows against every row of the matrix.
+
+    Similarities are computed as a blocked product (block_size query rows against the whole
+    catalog at a time; a dense GEMM for embeddings), so peak memory is bounded by block_size x n_movies.
+
+    Args:
+        normalized (csr_matrix or np.ndarray): L2-normalized matrix (see normalize_rows).
+        rows (np.ndarray): Positions of the query rows; each row is excluded from its own neighbors.
+        top_k (int): Number of neighbors to keep per row.
+        block_size (int): Number of rows multiplied per block.
+
+    Returns:
+        tuple: (neighbor_indices, neighbor_distances) arrays of shape (len(rows), top_k),
+               int32 and float32, ordered from the most to the least similar movie.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    transposed = normalized.T.tocsr() if issparse(normalized) else np.ascontiguousarray(normalized.T)
+    neighbor_indices = np.empty((len(rows), top_k), dtype=np.int32)
+    neighbor_distances = np.empty((len(rows), top_k), dtype=np.float32)
+    if top_k == 0:
+        return neighbor_indices, neighbor_distances
+
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        similarities = to_dense(normalized[block] @ transposed)
+        similarities[np.arange(len(block)), block] = -np.inf  # Exclude the movie itself
+
+        top = np.argpartition(-similarities, top_k - 1, axis=1)[:, :top_k]
+        top_similarities = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_similarities, axis=1, kind='stable')
+
+        neighbor_indices[start:start + len(block)] = np.take_along_axis(top, order, axis=1)
+        neighbor_distances[start:start + len(block)] = 1.0 - np.take_along_axis(top_similarities, order, axis=1)
+    return neighbor_indices, neighbor_distances
+
+
+def build_neighbor_table(count_matrix, top_k=NEIGHBOR_TABLE_K, block_size=NEIGHBOR_BLOCK_SIZE):
+    """
+    Precomputes the top K cosine neighbors of every movie.
+
+    Rows are L2-normalized once, then cosine similarities are computed as a blocked
+    sparse product (block_size rows against the whole catalog at a time), so peak memory
+    is bounded by block_size x n_movies instead of n_movies x n_movies.
+
+    Args:
+        count_matrix (csr_matrix): Feature matrix (see vectorization).
+        top_k (int): Number of neighbors to keep per movie (the movie itself is excluded).
+        block_size (int): Number of rows multiplied per block.
+
+    Returns:
+        tuple: (neighbor_indices, neighbor_distances) arrays of shape (n_movies, top_k),
+               int32 and float32, ordered from the most to the least similar movie.
+    """
+    n_movies = count_matrix.shape[0]
+    top_k = max(0, min(top_k, n_movies - 1))
+    neighbor_indices, neighbor_distances = query_top_k(
+        normalize_rows(count_matrix), np.arange(n_movies), top_k, block_size)
+
+    logger.info(f"Neighbor table built: {n_movies} movies x {top_k} neighbors.")
+    return neighbor_indices, neighbor_distances
+
+
+def get_or_build_neighbor_table(count_matrix, indices_path, distances_path, mmap_mode=None):
+    """
+    Loads the precomputed neighbor table if it exists; otherwise builds and saves a new one.
+    With mmap_mode='r' the table is memory-mapped read-only.
+
+    Returns:
+        tuple: (neighbor_indices, neighbor_distances) arrays.
+    """
+    neighbor_indices = load_array(indices_path, mmap_mode=mmap_mode)
+    neighbor_distances = load_array(distances_path, mmap_mode=mmap_mode)
+    if neighbor_indices is None or neighbor_distances is None or neighbor_indices.shape[0] != count_matrix.shape[0]:
+        logger.info("No up-to-date neighbor table found. Building now...")
+        neighbor_indices, neighbor_distances = build_neighbor_table(count_matrix)
+        save_array(neighbor_indices, indices_path)
+        save_array(neighbor_distances, distances_path)
+        if mmap_mode:
+            neighbor_indices = load_array(indices_path, mmap_mode=mmap_mode)
+            neighbor_distances = load_array(distances_path, mmap_mode=mmap_mode)
+    return neighbor_indices, neighbor_distances
@@ -1,148 +1,368 @@
+import numpy as np
 import pandas as pd
-from sklearn.neighbors import NearestNeighbors
-from utils import save_model, load_model
+from neighbor_table import normalize_rows
+from utils import to_dense
+from config import NEIGHBOR_BLOCK_SIZE, RECOMMEND_OVERFETCH, FACET_PREFILTER_MAX, FACET_WALK_MAX
 from logging_config import setup_logging
 from fuzzywuzzy import process
 
 logger = setup_logging()
 
 
-def get_top_movies(df, top_n=100, percentile=0.90):
+def weighted_ratings(df, percentile=0.90):
+    """
+    Computes the IMDb-style weighted rating of every movie at once.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing at least 'vote_count' and 'vote_average'.
+        percentile (float): Minimum vote count threshold (percentile-based).
+
+    Returns:
+        np.ndarray: Rating per row (float64); -inf for movies below the vote count threshold.
+    """
+    votes = df['vote_count'].to_numpy(dtype=np.float64)
+    averages = df['vote_average'].to_numpy(dtype=np.float64)
+    C = np.nanmean(averages)  # All movies average score
+    m = df['vote_count'].quantile(percentile)  # Minimum requirement of votes (90%)
+
+    with np.errstate(invalid='ignore'):  # 0 / 0 when m == 0 and a movie has no votes
+        ratings = (votes / (votes + m) * averages) + (m / (votes + m) * C)
+    ratings[~(votes >= m)] = -np.inf
+    return ratings
+
+
+def top_rated_positions(ratings, top_n, allowed=None):
+    """
+    Selects the top N qualified movies with argpartition, then sorts only those.
+
+    Args:
+        ratings (np.ndarray): Ratings from weighted_ratings.
+        top_n (int): Number of movies to select.
+        allowed (np.ndarray, optional): Boolean row mask (e.g. from FacetIndex.mask) restricting the movies.
+
+    Returns:
+        np.ndarray: Row positions, best first; ties keep catalog order and unrated movies come last.
+    """
+    qualified = ratings != -np.inf
+    if allowed is not None:
+        qualified &= allowed
+    candidates = np.flatnonzero(qualified)
+
+    keys = np.where(np.isnan(ratings[candidates]), -np.inf, ratings[candidates])
+    top = np.arange(len(candidates))
+    if 0 < top_n < len(candidates):
+        # Ties at the cut-off go to the movies listed first
+        threshold = np.partition(keys, len(keys) - top_n)[len(keys) - top_n]
+        above = np.flatnonzero(keys > threshold)
+        top = np.concatenate([above, np.flatnonzero(keys == threshold)[:top_n - len(above)]])
+    top = top[np.lexsort((top, -keys[top]))][:max(top_n, 0)]
+    return candidates[top]
+
+
+def get_top_movies(df, top_n=100, percentile=0.90, ratings=None, allowed=None):
     """
     Returns the top N movies ranked by IMDb-style weighted rating.
 
+    The rating is computed for all movies at once with NumPy, and only the top N are
+    selected (argpartition) and sorted.
+
     Args:
         df (pd.DataFrame): DataFrame containing at least 'vote_count' and 'vote_average'.
         top_n (int): Number of top-rated movies to return.
         percentile (float): Minimum vote count threshold (percentile-based).
+        ratings (np.ndarray, optional): Precomputed weighted_ratings(df, percentile).
+        allowed (np.ndarray, optional): Boolean row mask restricting the ranked movies (filters).
 
     Returns:
-        pd.DataFrame: Top N movies sorted by weighted rating.
+        pd.DataFrame: Top N movies sorted by weighted rating (ties keep catalog order).
     """
     if df.empty:
         logger.warning("Input DataFrame is empty. Returning empty result.")
         return pd.DataFrame()
 
-    C = df['vote_average'].mean()  # All movies average score
-    m = df['vote_count'].quantile(percentile) # Minimum requirement of votes (90%)
-
-    qualified = df[df['vote_count'] >= m].copy()
-
-    if qualified.empty:
+    if ratings is None:
+        ratings = weighted_ratings(df, percentile)
+    positions = top_rated_positions(ratings, top_n, allowed)
+    if not len(positions):
         logger.warning("No movies meet the minimum vote count threshold.")
         return pd.DataFrame()
 
-    def weighted_rating(x, m=m, C=C):
-        v = x['vote_count'] # Single movie vote count
-        R = x['vote_average'] # Single movie vote average
-        return (v / (v + m) * R) + (m / (v + m) * C)
-
-    qualified['weighted_rating'] = qualified.apply(weighted_rating, axis=1)
-    return qualified.sort_values('weighted_rating', ascending=False).head(top_n)[
-        ['title', 'vote_count', 'vote_average', 'weighted_rating', 'release_date']
-    ]
+    top_movies = df.iloc[positions][['title', 'vote_count', 'vote_average', 'release_date']].copy()
+    top_movies.insert(3, 'weighted_rating', ratings[positions])
+    return top_movies
 
 
-def train_model(count_matrix):
+def format_genres(genres):
     """
-    Trains a NearestNeighbors model using the given count matrix.
+    Formats genre lists for display ('comedy, drama'; 'Unknown' when empty or missing).
+
+    Args:
+        genres (pd.Series): Column of cleaned genre lists.
 
     Returns:
-        NearestNeighbors: Trained nearest neighbor model.
+        np.ndarray: Display strings (object dtype).
     """
-    model = NearestNeighbors(metric='cosine', algorithm='brute', n_neighbors=11, n_jobs=-1)
-    model.fit(count_matrix)
-    return model
+    return np.array([', '.join(value) if isinstance(value, list) and value else 'Unknown' for value in genres],
+                    dtype=object)
 
 
-def get_or_train_model(count_matrix, model_path):
+def build_display_frame(metadata):
     """
-    Loads a trained NearestNeighbors model if it exists; otherwise trains and saves a new one.
+    Builds the display-ready projection of the metadata, once per loaded catalog.
+
+    Rows are in metadata order, so recommendation and search results (row positions) are
+    gathered with a plain take instead of scanning and reformatting the full frame per request.
+
+    Args:
+        metadata (pd.DataFrame): Merged and cleaned movie metadata.
 
     Returns:
-        NearestNeighbors: Trained model.
+        pd.DataFrame: Columns 'id', 'title', 'release_date' ('Unknown' when missing) and 'genres'
+                      (formatted string), with a RangeIndex of row positions.
     """
-    model = load_model(model_path)
-    if model is None:
-        logger.info("No pre-trained model found. Training now...")
-        model = train_model(count_matrix)
-        save_model(model, model_path)
-    return model
+    return pd.DataFrame({
+        'id': metadata['id'].to_numpy(),
+        'title': metadata['title'].to_numpy(),
+        'release_date': metadata['release_date'].fillna('Unknown').to_numpy(),
+        'genres': format_genres(metadata['genres']),
+    })
 
 
-def get_recommendations(title, nn_model, metadata, indices, count_matrix, top_n=15):
+def get_neighbors(rows, nn_model, count_matrix, top_n=15, neighbor_indices=None, neighbor_distances=None,
+                  block_size=NEIGHBOR_BLOCK_SIZE):
     """
-    Returns a list of top N movie recommendations based on a given title.
-    This function now also returns additional metadata for each recommended movie.
+    Returns the top_n most similar movies of many query movies at once.
+
+    With a precomputed neighbor table covering top_n this is a single fancy-indexing gather;
+    otherwise the stacked query rows are sent to the model in blocks of block_size rows.
 
     Args:
-        title (str): Movie title to base recommendations on.
-        nn_model (NearestNeighbors): Trained NearestNeighbors model.
-        metadata (pd.DataFrame): DataFrame with movie metadata.
-        indices (pd.Series): Series mapping movie titles to their DataFrame indices.
-        count_matrix (csr_matrix): CountVectorizer matrix used during training.
-        top_n (int): Number of recommendations to return.
+        rows (np.ndarray): Positions of the query movies.
+        nn_model (NearestNeighbors): Trained nearest-neighbor model (any backend exposing kneighbors).
+        count_matrix (csr_matrix or np.ndarray): Feature matrix (or embeddings) the model searches.
+        top_n (int): Number of neighbors per query movie.
+        neighbor_indices (np.ndarray, optional): Precomputed neighbor table from build_neighbor_table.
+        neighbor_distances (np.ndarray, optional): Matching precomputed cosine distances.
+        block_size (int): Query rows per kneighbors call.
 
     Returns:
-        pd.DataFrame: DataFrame with titles, release date, genres, and director of the recommended movies.
+        tuple: (distances, positions) arrays of shape (len(rows), top_n), most similar first.
     """
-    if title not in indices:
-        logger.warning(f"Movie '{title}' not found in dataset.")
-        return pd.DataFrame()  # Returning empty DataFrame if no match found
+    rows = np.asarray(rows, dtype=np.int64)
+    if neighbor_indices is not None and neighbor_distances is not None and top_n <= neighbor_indices.shape[1]:
+        # Table already excludes the movies themselves
+        return (np.asarray(neighbor_distances[rows, :top_n], dtype=np.float32),
+                np.asarray(neighbor_indices[rows, :top_n], dtype=np.int64))
+
+    distances = [np.empty((0, top_n), dtype=np.float32)]
+    positions = [np.empty((0, top_n), dtype=np.int64)]
+    for start in range(0, len(rows), block_size):
+        block_distances, block_positions = nn_model.kneighbors(count_matrix[rows[start:start + block_size]],
+                                                               n_neighbors=top_n + 1)
+        distances.append(block_distances[:, 1:])  # Exclude the queried movies themselves
+        positions.append(block_positions[:, 1:])
+    return np.vstack(distances).astype(np.float32), np.vstack(positions).astype(np.int64)
+
+
+def build_id_positions(metadata):
+    """
+    Maps every movie id to its row position (the first row when an id occurs more than once).
 
-    idx = indices[title]
-    distances, neighbor_indices = nn_model.kneighbors(count_matrix[idx], n_neighbors=top_n + 1)
-    recommended_indices = neighbor_indices.flatten()[1:]  # Exclude the queried movie itself
+    Returns:
+        pd.Series: Row positions indexed by movie id.
+    """
+    first = ~metadata['id'].duplicated(keep='first').to_numpy()
+    return pd.Series(np.flatnonzero(first), index=metadata['id'].to_numpy()[first])
 
-    recommended_titles = metadata['title'].iloc[recommended_indices].unique()
 
-    # Get additional details like release_date, genres, and director
-    recommendations_with_details = metadata[metadata['title'].isin(recommended_titles)].copy()
+def rank_candidates(rows, count_matrix, candidates):
+    """
+    Ranks a fixed set of candidate movies by exact cosine similarity to each query movie.
 
+    Args:
+        rows (np.ndarray): Positions of the query movies.
+        count_matrix (csr_matrix or np.ndarray): Feature matrix (or embeddings) the model searches.
+        candidates (np.ndarray): Positions of the candidate movies.
 
-    recommendations_with_details['release_date'] = recommendations_with_details['release_date'].fillna('Unknown')
-    recommendations_with_details['genres'] = recommendations_with_details['genres'].astype(str)
-    recommendations_with_details['genres'] = recommendations_with_details['genres'].str.replace(r"[\[\]']", '',
-                                                                                                regex=True)
-    recommendations_with_details['genres'] = recommendations_with_details['genres'].replace('', 'Unknown')
+    Returns:
+        tuple: (distances, positions) arrays of shape (len(rows), len(candidates)), most similar first.
+               The query movies themselves are not excluded.
+    """
+    similarities = to_dense(normalize_rows(count_matrix[rows]) @ normalize_rows(count_matrix[candidates]).T)
+    order = np.argsort(-similarities, axis=1, kind='stable')
+    distances = 1.0 - np.take_along_axis(similarities, order, axis=1)
+    return distances.astype(np.float32), candidates[order].astype(np.int64)
 
-    return recommendations_with_details[['title', 'release_date', 'genres']].head(top_n)
 
+def _select_unique(query_ids, ids, top_n, passes=None):
+    """
+    Picks, per row, the first top_n neighbors whose movie id is new and differs from the query's.
+    With a `passes` mask, neighbors outside it are skipped too.
 
-def fuzzy_search(query: str, metadata: pd.DataFrame, top_n: int = 10) -> pd.DataFrame:
+    Returns:
+        tuple: (columns of shape (n_rows, top_n), number of valid columns per row).
     """
-    Performs fuzzy search to find movies in the metadata that closely match the input query.
+    if passes is not None:
+        # Filtered-out neighbors take the query's id, so they are dropped like its own duplicates
+        ids = np.where(passes, ids, query_ids[:, None])
+    order = np.argsort(ids, axis=1, kind='stable')
+    sorted_ids = np.take_along_axis(ids, order, axis=1)
+    first_sorted = np.ones(ids.shape, dtype=bool)
+    first_sorted[:, 1:] = sorted_ids[:, 1:] != sorted_ids[:, :-1]
+    first = np.empty_like(first_sorted)
+    np.put_along_axis(first, order, first_sorted, axis=1)
+
+    keep = first & (ids != query_ids[:, None])
+    columns = np.argsort(~keep, axis=1, kind='stable')[:, :top_n]  # Kept columns first, rank order preserved
+    return columns, np.minimum(keep.sum(axis=1), top_n)
+
+
+def get_unique_neighbors(rows, movie_ids, nn_model, count_matrix, top_n=15, neighbor_indices=None,
+                         neighbor_distances=None, overfetch=RECOMMEND_OVERFETCH, allowed=None,
+                         prefilter_max=FACET_PREFILTER_MAX, walk_max=FACET_WALK_MAX):
+    """
+    Returns exactly top_n distinct movies (by id) most similar to each query movie.
+
+    The catalog can hold several rows for one movie id (and the query movie's own duplicates are
+    its nearest neighbors), so top_n + overfetch neighbors are fetched first. Only the queries still
+    short of top_n distinct movies are fetched again, with twice as many neighbors each round.
+
+    With a filter, neighbors outside `allowed` are skipped the same way. When the filter keeps at
+    most prefilter_max movies, those are ranked directly instead of walking the neighbor lists. A
+    larger filter is walked up to walk_max neighbors; queries still short are then ranked directly
+    against the filter, so a filter far from the query never fetches the whole catalog.
 
     Args:
-        query (str): User input or partial movie title to search for.
-        metadata (pd.DataFrame): Movie metadata containing at least 'title', 'genres', and 'release_date'.
-        top_n (int, optional): Maximum number of results to return. Defaults to 10.
+        rows (np.ndarray): Positions of the query movies.
+        movie_ids (np.ndarray): Movie id of every row.
+        nn_model (NearestNeighbors): Trained nearest-neighbor model (any backend exposing kneighbors).
+        count_matrix (csr_matrix or np.ndarray): Feature matrix (or embeddings) the model searches.
+        top_n (int): Number of distinct movies per query movie.
+        neighbor_indices (np.ndarray, optional): Precomputed neighbor table from build_neighbor_table.
+        neighbor_distances (np.ndarray, optional): Matching precomputed cosine distances.
+        overfetch (int): Extra neighbors fetched in the first round.
+        allowed (np.ndarray, optional): Boolean row mask of the movies that may be recommended.
+        prefilter_max (int): Largest filtered catalog that is ranked directly.
+        walk_max (int): Most neighbors fetched per query when walking the neighbor lists under a filter.
 
     Returns:
-        pd.DataFrame: DataFrame containing the top matching movie titles.
+        tuple: (distances, positions) arrays of shape (len(rows), top_n), most similar first. Only a
+               catalog (or filter) with fewer than top_n other movies leaves trailing positions at -1.
     """
-    query = query.strip()
+    rows = np.asarray(rows, dtype=np.int64)
+    distances = np.ones((len(rows), top_n), dtype=np.float32)
+    positions = np.full((len(rows), top_n), -1, dtype=np.int64)
+
+    def rank(pending, k):
+        return rank_candidates(rows[pending], count_matrix, candidates)
 
-    if len(query) <= 3:
-        candidates = metadata['title']
+    def walk(pending, k):
+        return get_neighbors(rows[pending], nn_model, count_matrix, k, neighbor_indices, neighbor_distances)
+
+    candidates = None if allowed is None else np.flatnonzero(allowed)
+    if candidates is not None and len(candidates) <= prefilter_max:
+        # Few movies pass the filter: score all of them in a single round
+        fetch, max_k = rank, len(candidates)
+        k = max_k
     else:
-        candidates = metadata[metadata['title'].str.len() > 3]['title']
+        fetch, max_k = walk, count_matrix.shape[0] - 1
+        k = min(top_n + overfetch, max_k)
+
+    pending = np.arange(len(rows))
+    while len(pending) and k > 0:
+        fetched_distances, fetched_positions = fetch(pending, k)
+        passes = None if allowed is None else allowed[fetched_positions]
+        columns, counts = _select_unique(movie_ids[rows[pending]], movie_ids[fetched_positions], top_n, passes)
+        done = (counts == top_n) | (k == max_k)
+
+        # Fewer than top_n neighbors were fetched only when the catalog (or filter) is smaller than top_n
+        width = columns.shape[1]
+        valid = np.arange(width) < counts[done, None]
+        selected_distances = np.take_along_axis(fetched_distances[done], columns[done], axis=1)
+        selected_positions = np.take_along_axis(fetched_positions[done], columns[done], axis=1)
+        distances[pending[done], :width] = np.where(valid, selected_distances, 1.0)
+        positions[pending[done], :width] = np.where(valid, selected_positions, -1)
+
+        pending = pending[~done]
+        k = min(2 * k, max_k)
+        if candidates is not None and fetch is walk and k > walk_max:
+            # The nearest neighbors rarely pass the filter: rank the remaining queries against it directly
+            fetch, max_k = rank, len(candidates)
+            k = max_k
+    return distances, positions
+
+
+def get_recommendations(movie_id, nn_model, metadata, id_positions, count_matrix, top_n=15, neighbor_indices=None,
+                        neighbor_distances=None, display=None, allowed=None):
+    """
+    Returns the top N movies most similar to a given movie, most similar first.
+    When a precomputed neighbor table covers the neighbors needed, they are read from it
+    instead of querying the model.
+
+    Args:
+        movie_id (int): Id of the movie to base recommendations on.
+        nn_model (NearestNeighbors): Trained nearest-neighbor model (any backend exposing kneighbors).
+        metadata (pd.DataFrame): DataFrame with movie metadata.
+        id_positions (pd.Series): Row position of every movie id, from build_id_positions.
+        count_matrix (csr_matrix or np.ndarray): Feature matrix (or embeddings) the model searches.
+        top_n (int): Number of recommendations to return.
+        neighbor_indices (np.ndarray, optional): Precomputed neighbor table from build_neighbor_table.
+        neighbor_distances (np.ndarray, optional): Matching precomputed cosine distances.
+        display (pd.DataFrame, optional): Projection from build_display_frame (built from metadata if omitted).
+        allowed (np.ndarray, optional): Boolean row mask of the movies that may be recommended (filters).
 
-    raw_results = process.extract(query, candidates, limit=top_n)
-    results = [(title, score) for title, score, _ in raw_results]
-    matches = pd.DataFrame(results, columns=['title', 'score'])
-    matches = matches[matches['score'] > 70]
+    Returns:
+        pd.DataFrame: top_n distinct movies with id, title, release date, genres and cosine similarity 'score'.
+    """
+    if movie_id not in id_positions.index:
+        logger.warning(f"Movie id '{movie_id}' not found in dataset.")
+        return pd.DataFrame()  # Returning empty DataFrame if no match found
 
-    # Now, we also fetch 'genres' and 'release_date' based on the matched titles
-    matches_with_details = metadata[metadata['title'].isin(matches['title'])].copy()
+    if display is None:
+        display = build_display_frame(metadata)
+    distances, positions = get_unique_neighbors([id_positions[movie_id]], display['id'].to_numpy(), nn_model,
+                                                count_matrix, top_n, neighbor_indices, neighbor_distances,
+                                                allowed=allowed)
 
-    matches_with_details['genres'] = matches_with_details['genres'].astype(str)
-    matches_with_details['genres'] = matches_with_details['genres'].str.replace(r"[\[\]']", '',
-                                                                                                regex=True)
-    matches_with_details['genres'] = matches_with_details['genres'].replace('', 'Unknown')
+    found = positions[0] >= 0
+    recommendations = display.take(positions[0][found])
+    recommendations['score'] = 1.0 - distances[0][found]
+    return recommendations
 
-    # Merge the score with the matched results
-    matches_with_details = pd.merge(matches, matches_with_details, on='title')
 
-    return matches_with_details[['title', 'score', 'genres', 'release_date']].head(top_n)
+def fuzzy_search(query: str, metadata: pd.DataFrame, top_n: int = 10, title_index=None,
+                 display=None) -> pd.DataFrame:
+    """
+    Performs fuzzy search to find movies in the metadata that closely match the input query.
 
+    Args:
+        query (str): User input or partial movie title to search for.
+        metadata (pd.DataFrame): Movie metadata containing at least 'title', 'genres', and 'release_date'.
+        top_n (int, optional): Maximum number of results to return. Defaults to 10.
+        title_index (TitleSearchIndex, optional): Prebuilt index over metadata['title']. Without it
+                                                  every title is scored with fuzzywuzzy.
+        display (pd.DataFrame, optional): Projection from build_display_frame (built from metadata if omitted).
+
+    Returns:
+        pd.DataFrame: Matching movies (id, title, score, genres, release date), best match first.
+    """
+    query = query.strip()
+
+    if title_index is not None:
+        positions, scores = title_index.match(query, limit=top_n)
+    else:
+        if len(query) <= 3:
+            candidates = metadata['title']
+        else:
+            candidates = metadata[metadata['title'].str.len() > 3]['title']
+
+        raw_results = process.extract(query, candidates, limit=top_n)
+        positions = metadata.index.get_indexer([key for _, _, key in raw_results])
+        scores = np.array([score for _, score, _ in raw_results], dtype=np.int32)
+
+    keep = scores > 70
+    if display is None:
+        display = build_display_frame(metadata)
+    matches = display.take(positions[keep])
+    matches.insert(2, 'score', scores[keep])
+    return matches[['id', 'title', 'score', 'genres', 'release_date']]
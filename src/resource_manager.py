@@ -0,0 +1,84 @@
+import threading
+import time
+from contextlib import contextmanager
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+
+class ResourceManager:
+    """
+    Holds the loaded resource set of a process and replaces it atomically.
+
+    get() returns the current set, loading it on first use. Loading is single-flight: one thread
+    runs the loader while concurrent callers wait for its result instead of loading again.
+    reload() builds a complete new set while the current one keeps serving, then publishes it with
+    a single reference assignment; requests that already hold the previous set finish with it.
+    Readers never take the lock once a set is published.
+
+    Args:
+        loader (callable): Builds and returns a complete resource dict.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.generation = 0
+        self.loaded_at = None
+        self._current = None
+        self._lock = threading.RLock()
+
+    def get(self):
+        """
+        Returns:
+            dict: The current resources, loaded on first use.
+        """
+        current = self._current
+        if current is not None:
+            return current
+        with self._lock:
+            if self._current is None:
+                self._load()
+            return self._current
+
+    def is_loaded(self):
+        return self._current is not None
+
+    def reload(self):
+        """
+        Loads a new resource set and swaps it in. Concurrent reloads and updates run one at a time.
+
+        Returns:
+            dict: The new resources.
+        """
+        with self._lock:
+            self._load()
+            return self._current
+
+    @contextmanager
+    def exclusive(self):
+        """
+        Holds the load lock for a read-modify-swap sequence (e.g. a catalog update), so it cannot
+        race loads, reloads or other updates. Requests keep being served from the current set.
+
+        Yields:
+            dict: The current resources (loaded if needed); publish the derived set with swap().
+        """
+        with self._lock:
+            yield self.get()
+
+    def swap(self, resources):
+        """
+        Publishes a new resource set. Must be called inside exclusive().
+
+        Returns:
+            dict: The published resources.
+        """
+        self._current = resources
+        self.generation += 1
+        self.loaded_at = time.time()
+        return resources
+
+    def _load(self):
+        start = time.perf_counter()
+        self.swap(self.loader())
+        logger.info(f"Resources loaded (generation {self.generation}) in {time.perf_counter() - start:.2f}s.")
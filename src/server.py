@@ -0,0 +1,321 @@
+import argparse
+import json
+import os
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qsl, urlsplit
+import engine
+from logging_config import setup_logging
+from config import (SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_QUICK_EXIT, SERVER_RESTART_BACKOFF,
+                    SERVER_MAX_FAILED_STARTS, RECOMMEND_BATCH_MAX, RESOURCE_RELOAD_INTERVAL, AUTOCOMPLETE_LIMIT)
+
+logger = setup_logging()
+
+FILTER_ARGS = {'genre': 'genres', 'director': 'director', 'year_from': 'year_from', 'year_to': 'year_to'}
+
+
+def _int_arg(args, name, default, low=1, high=100):
+    """
+    Reads a bounded integer argument.
+
+    Raises:
+        ValueError: When the value is not an integer within [low, high].
+    """
+    value = int(args.get(name, default))
+    if not low <= value <= high:
+        raise ValueError(f"'{name}' must be between {low} and {high}.")
+    return value
+
+
+def _filters(args):
+    """
+    Maps the 'genre', 'director', 'year_from' and 'year_to' arguments to engine filter arguments.
+    """
+    filters = {engine_name: args[name] for name, engine_name in FILTER_ARGS.items() if args.get(name) not in (None, '')}
+    for name in ('year_from', 'year_to'):
+        if name in filters:
+            filters[name] = int(filters[name])
+    return filters
+
+
+def _records(frame, columns=None):
+    if frame.empty:
+        return []
+    return (frame[columns] if columns else frame).to_dict(orient='records')
+
+
+def matches(args):
+    """
+    Fuzzy title search. Arguments: 'q'.
+    """
+    query = str(args.get('q', '')).strip()
+    if not query:
+        raise ValueError("Missing 'q'.")
+    results = engine.get_matches(query).drop_duplicates(subset='title', keep='first')
+    return {'query': query, 'matches': _records(results)}
+
+
+def recommend(args):
+    """
+    Recommendations for one movie. Arguments: 'id' or 'title' (exact or fuzzy), optional 'top_n' and filters.
+    """
+    top_n = _int_arg(args, 'top_n', 15)
+    filters = _filters(args)
+    if args.get('id') not in (None, ''):
+        movie_id, title = int(args['id']), None
+    elif args.get('title'):
+        movie = engine.resolve_title(str(args['title']))
+        if movie is None:
+            return {'id': None, 'title': args['title'], 'recommendations': []}
+        movie_id, title = movie
+    else:
+        raise ValueError("Missing 'id' or 'title'.")
+
+    recommendations = engine.get_recommendations_by_id(movie_id, top_n=top_n, filters=filters)
+    return {'id': movie_id, 'title': title,
+            'recommendations': _records(recommendations, ['id', 'title', 'release_date', 'genres', 'score'])}
+
+
+def top(args):
+    """
+    Top movies by weighted rating. Arguments: optional 'top_n' (default 100) and filters.
+    """
+    top_movies = engine.get_top_rated_movies(top_n=_int_arg(args, 'top_n', 100, high=1000), filters=_filters(args))
+    return {'top_movies': _records(top_movies)}
+
+
+def complete(args):
+    """
+    Title typeahead. Arguments: 'prefix', optional 'limit'.
+    """
+    limit = _int_arg(args, 'limit', AUTOCOMPLETE_LIMIT)
+    return {'completions': engine.get_completions(str(args.get('prefix', '')), limit=limit)}
+
+
+def health(args):
+    """
+    Liveness and the catalog version served by this worker.
+    """
+    return {'status': 'ok', 'pid': os.getpid(), 'version': engine.catalog_version()}
+
+
+OPERATIONS = {'matches': matches, 'recommend': recommend, 'top': top, 'complete': complete, 'health': health}
+
+
+def batch(calls):
+    """
+    Runs many operations in one round trip. Unfiltered recommendations sharing a top_n are answered
+    by a single vectorized neighbor query (engine.get_recommendations_batch); other calls run one
+    by one. A failing call yields an 'error' entry without failing the others.
+
+    Args:
+        calls (list[dict]): Operation arguments, each with an 'op' name from OPERATIONS.
+
+    Returns:
+        list[dict]: One response per call, in order.
+    """
+    responses = [None] * len(calls)
+    grouped = {}
+    for i, call in enumerate(calls):
+        try:
+            if not isinstance(call, dict) or call.get('op') not in OPERATIONS:
+                raise ValueError(f"'op' must be one of {', '.join(OPERATIONS)}.")
+            if call['op'] == 'recommend' and not _filters(call):
+                movie = _resolve(call)
+                if movie is None:
+                    responses[i] = {'id': None, 'title': call.get('title'), 'recommendations': []}
+                else:
+                    grouped.setdefault(_int_arg(call, 'top_n', 15), []).append((i, movie))
+            else:
+                responses[i] = OPERATIONS[call['op']](call)
+        except (ValueError, TypeError) as e:
+            responses[i] = {'error': str(e)}
+
+    for top_n, movies in grouped.items():
+        recommendations = engine.get_recommendations_batch(ids=sorted({movie_id for _, (movie_id, _) in movies}),
+                                                           top_n=top_n)
+        by_id = {}
+        for record in recommendations.drop(columns='rank').to_dict(orient='records'):
+            by_id.setdefault(record.pop('query'), []).append(record)
+        for i, (movie_id, title) in movies:
+            responses[i] = {'id': movie_id, 'title': title, 'recommendations': by_id.get(movie_id, [])}
+    return responses
+
+
+def _resolve(args):
+    """
+    Returns (movie id, title or None) for a recommend call, or None for an unknown title.
+    """
+    if args.get('id') not in (None, ''):
+        return int(args['id']), None
+    if not args.get('title'):
+        raise ValueError("Missing 'id' or 'title'.")
+    return engine.resolve_title(str(args['title']))
+
+
+class RecommendationHandler(BaseHTTPRequestHandler):
+    """
+    JSON over HTTP/1.1 with keep-alive: GET /<operation>?<arguments> runs one operation, and
+    POST /batch with {"requests": [{"op": ..., ...}, ...]} runs many.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # Headers and body are separate writes; don't wait for delayed ACKs
+    server_version = 'RecommendationServer/1.0'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        operation = OPERATIONS.get(url.path.strip('/'))
+        if operation is None:
+            return self._send(404, {'error': f"Unknown path {url.path}."})
+        self._run(lambda: operation(dict(parse_qsl(url.query))))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        if urlsplit(self.path).path.strip('/') != 'batch':
+            return self._send(404, {'error': f"Unknown path {self.path}."})
+        try:
+            calls = json.loads(body or b'{}').get('requests', [])
+            if not isinstance(calls, list) or len(calls) > RECOMMEND_BATCH_MAX:
+                raise ValueError
+        except (ValueError, AttributeError):
+            return self._send(400, {'error': f"Expected a JSON object {{'requests': [...]}} with at most "
+                                             f"{RECOMMEND_BATCH_MAX} calls."})
+        self._run(lambda: {'responses': batch(calls)})
+
+    def _run(self, operation):
+        try:
+            payload = operation()
+        except (ValueError, TypeError) as e:
+            return self._send(400, {'error': str(e)})
+        except Exception as e:
+            logger.error(f"Request {self.path} failed: {e}")
+            return self._send(500, {'error': "Internal error."})
+        self._send(200, payload)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class RecommendationServer(ThreadingMixIn, HTTPServer):
+    """
+    One thread per connection, so keep-alive clients do not block each other within a worker.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+def _serve_worker(server):
+    """
+    Worker process body: optional background reloads, then serve until interrupted.
+    """
+    if RESOURCE_RELOAD_INTERVAL:
+        threading.Thread(target=engine.warm_up, args=(RESOURCE_RELOAD_INTERVAL,), daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def serve(host=SERVER_HOST, port=SERVER_PORT, workers=SERVER_WORKERS):
+    """
+    Serves the engine as a JSON service with pre-forked worker processes.
+
+    The parent rebuilds stale artifacts, loads the resources and binds the socket once, then forks
+    the workers, which inherit the loaded resources and accept on the shared socket. Memory-mapped
+    artifacts (ARTIFACT_STORAGE = 'mmap') stay a single page-cache copy across workers; the rest is
+    shared copy-on-write. Dead workers are replaced; SIGINT or SIGTERM stops them all. Workers dying
+    right after starting are restarted with an exponential backoff, and the server stops after
+    SERVER_MAX_FAILED_STARTS of them in a row.
+
+    Args:
+        host (str): Interface to listen on.
+        port (int): Port to listen on.
+        workers (int, optional): Worker processes; None starts one per CPU. Without os.fork
+                                 (e.g. Windows), the parent serves alone.
+
+    Returns:
+        None
+    """
+    start = time.perf_counter()
+    resources = engine.load_resources()
+    logger.info(f"Loaded {len(resources['metadata'])} movies in {time.perf_counter() - start:.2f}s.")
+
+    server = RecommendationServer((host, port), RecommendationHandler)
+    workers = workers or os.cpu_count() or 1
+    logger.info(f"Serving on http://{host}:{server.server_address[1]} with {workers} worker(s).")
+    if workers == 1 or not hasattr(os, 'fork'):
+        _serve_worker(server)
+        return
+
+    children = {}  # pid -> start time
+    stopping = []
+    failed_starts = 0
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            _serve_worker(server)
+            os._exit(0)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        stopping.append(signum)
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for _ in range(workers):
+        spawn()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if stopping or started is None:
+            continue
+
+        failed_starts = failed_starts + 1 if time.monotonic() - started < SERVER_QUICK_EXIT else 0
+        if failed_starts >= SERVER_MAX_FAILED_STARTS:
+            logger.error(f"Worker {pid} exited with status {status}; {failed_starts} workers in a row died "
+                         f"right after starting, stopping the server.")
+            stop(None, None)
+            continue
+        delay = SERVER_RESTART_BACKOFF * 2 ** (failed_starts - 1) if failed_starts else 0.0
+        logger.warning(f"Worker {pid} exited with status {status}; starting a new one in {delay:.1f}s.")
+        time.sleep(delay)
+        if not stopping:
+            spawn()
+    server.server_close()
+    logger.info("Server stopped.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the recommendation engine as a JSON service.")
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS)
+    options = parser.parse_args()
+    serve(options.host, options.port, options.workers)
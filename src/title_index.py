@@ -0,0 +1,240 @@
+import re
+from bisect import bisect_left
+import numpy as np
+from rapidfuzz import fuzz
+from rapidfuzz.process import cdist
+from config import TITLE_NGRAM, TITLE_SHORTLIST_SIZE, TITLE_STRONG_SCORE
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+_NON_WORD = re.compile(r'(?ui)\W')
+
+
+def normalize_title(text):
+    """
+    Normalizes a title the way fuzzywuzzy's full_process does before WRatio scoring:
+    non-ASCII characters dropped, non-word characters turned into spaces, lowercased, trimmed.
+
+    Args:
+        text (str): Raw title or query.
+
+    Returns:
+        str: Normalized text ('' for non-string values).
+    """
+    if not isinstance(text, str):
+        return ''
+    text = text.encode('ascii', 'ignore').decode('ascii')
+    return _NON_WORD.sub(' ', text).lower().strip()
+
+
+def query_key(query):
+    """
+    Reduces a query to what TitleSearchIndex.match depends on, so equivalent queries
+    ('Toy Story', ' toy  story!') can share cached results.
+
+    Returns:
+        tuple: (normalized text, whether short titles are searched too).
+    """
+    query = query.strip()
+    return normalize_title(query), len(query) <= 3
+
+
+def title_ngrams(text, n=TITLE_NGRAM):
+    """
+    Returns the character n-grams of a normalized title, padded with one space on each side
+    so that word starts and ends form their own grams.
+
+    Returns:
+        set[str]: Distinct n-grams.
+    """
+    padded = f" {text} "
+    return {padded[i:i + n] for i in range(max(len(padded) - n + 1, 0))}
+
+
+def _top_k(values, k):
+    """
+    Returns the indices of the k largest values. Ties at the cut-off go to the lowest indices,
+    mirroring how equal fuzzy scores keep catalog order.
+
+    Returns:
+        np.ndarray: Indices (unordered).
+    """
+    threshold = np.partition(values, len(values) - k)[len(values) - k]
+    above = np.flatnonzero(values > threshold)
+    ties = np.flatnonzero(values == threshold)[:k - len(above)]
+    return np.concatenate([above, ties])
+
+
+class TitleSearchIndex:
+    """
+    Fuzzy title search over a fixed catalog, built once at load time.
+
+    Titles are normalized up front and indexed in a character n-gram inverted index. A query
+    first scores a shortlist of the titles sharing the most n-grams with it (RapidFuzz WRatio,
+    rounded like fuzzywuzzy), instead of scoring every title in Python. Titles outside the
+    shortlist only match weakly (e.g. 'toy' -> 'Dark City', 72), so when the shortlist holds fewer
+    than `limit` strong matches, every title is scored in one RapidFuzz pass instead.
+
+    Args:
+        titles (iterable[str]): Titles in metadata row order.
+        shortlist_size (int): Candidates kept per ranking (shared n-grams, and shared n-grams
+                              relative to the title's own n-gram count).
+        strong_score (int): Score a shortlisted title must reach to count as a strong match.
+    """
+
+    def __init__(self, titles, shortlist_size=TITLE_SHORTLIST_SIZE, strong_score=TITLE_STRONG_SCORE):
+        titles = list(titles)
+        self.titles = np.array(titles, dtype=object)
+        self.normalized = [normalize_title(title) for title in titles]
+        # Longer queries only match titles longer than 3 characters (as the unindexed search did)
+        self.searchable = np.array([isinstance(title, str) and len(title) > 3 for title in titles], dtype=bool)
+        self.shortlist_size = shortlist_size
+        self.strong_score = strong_score
+
+        postings = {}
+        self.gram_counts = np.zeros(len(titles), dtype=np.int32)
+        for position, text in enumerate(self.normalized):
+            if not text:
+                continue
+            grams = title_ngrams(text)
+            self.gram_counts[position] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+        self.postings = {gram: np.array(positions, dtype=np.int32) for gram, positions in postings.items()}
+        # Titles shorter than an n-gram share none with the queries they are part of ('a', 'up')
+        self.short = np.flatnonzero([0 < len(text) < TITLE_NGRAM for text in self.normalized])
+        logger.info(f"Title index built: {len(titles)} titles, {len(self.postings)} distinct n-grams.")
+
+    def candidates(self, query_text, allowed):
+        """
+        Selects the shortlist of title positions to score for a normalized query. Titles shorter
+        than an n-gram are always included.
+
+        Returns:
+            np.ndarray: Candidate positions in ascending order.
+        """
+        short = self.short if allowed is None else self.short[allowed[self.short]]
+        return np.union1d(self._shortlist(query_text, allowed), short).astype(np.int64)
+
+    def _shortlist(self, query_text, allowed):
+        """
+        Returns:
+            np.ndarray: Positions of the titles sharing the most n-grams with the query.
+        """
+        if len(query_text) < TITLE_NGRAM:
+            # Too short to form its own n-grams: use every n-gram that contains it
+            grams = [gram for gram in self.postings if query_text in gram]
+        else:
+            grams = [gram for gram in title_ngrams(query_text) if gram in self.postings]
+        if not grams:
+            return np.empty(0, dtype=np.int64)
+
+        shared = np.bincount(np.concatenate([self.postings[gram] for gram in grams]), minlength=len(self.titles))
+        if allowed is not None:
+            shared[~allowed] = 0
+        positions = np.flatnonzero(shared)
+        if len(positions) <= 2 * self.shortlist_size:
+            return positions
+
+        # Titles containing most of the query, and titles mostly contained in the query
+        counts = shared[positions]
+        by_count = _top_k(counts, self.shortlist_size)
+        by_coverage = _top_k(counts / self.gram_counts[positions], self.shortlist_size)
+        return positions[np.union1d(by_count, by_coverage)]
+
+    def match(self, query, limit=10):
+        """
+        Finds the titles that best match a query.
+
+        Args:
+            query (str): User input or partial movie title.
+            limit (int): Maximum number of results.
+
+        Returns:
+            tuple: (positions, scores) arrays, best first; equal scores keep catalog order.
+        """
+        query = query.strip()
+        query_text = normalize_title(query)
+        if not query_text:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+        allowed = None if len(query) <= 3 else self.searchable
+        positions = self.candidates(query_text, allowed)
+        scores = self._score(query_text, positions)
+        if np.count_nonzero(scores >= self.strong_score) < limit:
+            # Too few strong matches: weak matches outside the shortlist may rank, so score every title
+            positions = np.arange(len(self.titles)) if allowed is None else np.flatnonzero(allowed)
+            scores = self._score(query_text, positions)
+
+        order = np.lexsort((positions, -scores))[:limit]
+        return positions[order], scores[order]
+
+    def _score(self, query_text, positions):
+        """
+        Returns:
+            np.ndarray: fuzzywuzzy WRatio scores (rounded, int32) of the titles at the given positions.
+        """
+        if not len(positions):
+            return np.empty(0, dtype=np.int32)
+        choices = [self.normalized[position] for position in positions]
+        return np.rint(cdist([query_text], choices, scorer=fuzz.WRatio, dtype=np.float32)[0]).astype(np.int32)
+
+    def search(self, query, limit=10):
+        """
+        Finds the titles that best match a query.
+
+        Returns:
+            list[tuple]: (title, score) pairs, best first; equal scores keep catalog order.
+        """
+        positions, scores = self.match(query, limit)
+        return [(self.titles[position], int(score)) for position, score in zip(positions, scores)]
+
+
+class PrefixIndex:
+    """
+    Typeahead completions over a fixed catalog.
+
+    Every normalized title is stored once per word start ("the dark knight", "dark knight",
+    "knight"), in one sorted list. A prefix then maps to a contiguous slice found with two
+    bisections, and the most popular titles in that slice are picked with argpartition.
+
+    Args:
+        titles (iterable[str]): Titles in metadata row order.
+        popularity (iterable[float]): Ranking value per title (e.g. vote_count); missing values rank last.
+    """
+
+    def __init__(self, titles, popularity):
+        self.titles = np.array(list(titles), dtype=object)
+        self.popularity = np.nan_to_num(np.asarray(popularity, dtype=np.float64), nan=-1.0)
+
+        entries = []
+        for position, title in enumerate(self.titles):
+            words = normalize_title(title).split()
+            for start in range(len(words)):
+                entries.append((' '.join(words[start:]), position))
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.positions = np.array([position for _, position in entries], dtype=np.int32)
+        logger.info(f"Prefix index built: {len(self.titles)} titles, {len(self.keys)} keys.")
+
+    def complete(self, prefix, limit=10):
+        """
+        Returns the most popular titles that have a word sequence starting with the prefix.
+
+        Args:
+            prefix (str): Text typed so far.
+            limit (int): Maximum number of completions.
+
+        Returns:
+            np.ndarray: Title positions, most popular first (ties keep catalog order).
+        """
+        prefix = ' '.join(normalize_title(prefix).split())
+        if not prefix or limit <= 0:
+            return np.empty(0, dtype=np.int64)
+
+        start = bisect_left(self.keys, prefix)
+        stop = bisect_left(self.keys, prefix + '\uffff', lo=start)
+        positions = np.unique(self.positions[start:stop])
+        if len(positions) > limit:
+            positions = positions[_top_k(self.popularity[positions], limit)]
+        return positions[np.lexsort((positions, -self.popularity[positions]))]
@@ -1,7 +1,18 @@
 import joblib
+import json
+import numpy as np
 import os
+import shutil
+import time
+from contextlib import contextmanager
+from scipy.sparse import csr_matrix, issparse
 from logging_config import setup_logging
 
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory file locks
+    fcntl = None
+
 logger = setup_logging()
 
 def save_model(model, filename):
@@ -18,9 +29,11 @@ def save_model(model, filename):
         logger.error(f"Failed to save model to '{filename}': {e}")
 
 
-def load_model(filename):
+def load_model(filename, mmap_mode=None):
     """
     Loads a trained model from a file using joblib.
+    With mmap_mode='r', the NumPy arrays inside the model are memory-mapped read-only
+    instead of being copied into the process.
 
     Returns:
         BaseEstimator or None: Loaded model if file exists and is valid; otherwise None.
@@ -29,9 +42,227 @@ def load_model(filename):
         logger.warning(f"Model file '{filename}' not found.")
         return None
     try:
-        model = joblib.load(filename)
+        model = joblib.load(filename, mmap_mode=mmap_mode)
         logger.info(f"Model loaded from: {filename}")
         return model
     except Exception as e:
         logger.error(f"Failed to load model from '{filename}': {e}")
         return None
+
+
+def save_array(array, filename):
+    """
+    Saves a NumPy array to a .npy file.
+    The file is written under a temporary name and moved into place, so processes
+    that memory-map the previous version keep a consistent view.
+
+    Returns:
+        None
+    """
+    try:
+        tmp_filename = f"{filename}.tmp.npy"
+        np.save(tmp_filename, array)
+        os.replace(tmp_filename, filename)
+        logger.info(f"Array saved to: {filename}")
+    except Exception as e:
+        logger.error(f"Failed to save array to '{filename}': {e}")
+
+
+def load_array(filename, mmap_mode=None):
+    """
+    Loads a NumPy array from a .npy file.
+    With mmap_mode='r', the array is memory-mapped read-only, so every process
+    loading it shares the same page-cache copy.
+
+    Returns:
+        np.ndarray or None: Loaded array if file exists and is valid; otherwise None.
+    """
+    if not os.path.exists(filename):
+        logger.warning(f"Array file '{filename}' not found.")
+        return None
+    try:
+        array = np.load(filename, mmap_mode=mmap_mode)
+        logger.info(f"Array loaded from: {filename}")
+        return array
+    except Exception as e:
+        logger.error(f"Failed to load array from '{filename}': {e}")
+        return None
+
+
+# Pointer file naming the current version subdirectory of a versioned artifact directory
+VERSION_POINTER = 'CURRENT'
+
+
+def new_version_dir(directory):
+    """
+    Creates an empty, uniquely named version subdirectory. Names sort in creation order.
+
+    Returns:
+        tuple: (version name, path of the new subdirectory).
+    """
+    os.makedirs(directory, exist_ok=True)
+    while True:
+        name = f"v{time.time_ns():020d}"
+        path = os.path.join(directory, name)
+        try:
+            os.makedirs(path)
+            return name, path
+        except FileExistsError:
+            continue
+
+
+def publish_version(directory, name, info=None, keep=2):
+    """
+    Atomically points a versioned directory at a completely written version subdirectory, then
+    removes all but the `keep` newest versions. Readers resolve the pointer once, so they always see
+    one complete set; the previous version is kept for readers that resolved it just before the swap.
+
+    Args:
+        directory (str): Versioned artifact directory.
+        name (str): Version subdirectory from new_version_dir.
+        info (dict, optional): Extra fields stored with the pointer (see read_version).
+        keep (int): Number of newest versions kept on disk.
+
+    Returns:
+        None
+    """
+    pointer = os.path.join(directory, VERSION_POINTER)
+    with open(f"{pointer}.tmp", 'w', encoding='utf-8') as f:
+        json.dump({**(info or {}), 'version': name}, f)
+    os.replace(f"{pointer}.tmp", pointer)
+
+    versions = sorted(entry for entry in os.listdir(directory)
+                      if entry.startswith('v') and os.path.isdir(os.path.join(directory, entry)))
+    for old in versions[:-keep]:
+        if old != name:
+            shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+
+
+def read_version(directory):
+    """
+    Returns:
+        dict or None: The current pointer of a versioned directory ('version' plus the info published
+                      with it), or None when nothing was published yet.
+    """
+    try:
+        with open(os.path.join(directory, VERSION_POINTER), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """
+    Holds an advisory lock on a lock file (created if missing) until the block exits, blocking
+    while another process holds it. Builders take it exclusively; loaders take it shared, so they
+    never read a set another process is rewriting. Without fcntl (Windows) nothing is locked.
+
+    Locks are per open file, so a process must not take the same lock again while holding it.
+
+    Args:
+        path (str): Lock file path.
+        shared (bool): Take a shared (read) lock instead of an exclusive one.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def save_csr_matrix(matrix, directory):
+    """
+    Saves a CSR matrix as raw data/indices/indptr/shape .npy files.
+
+    The arrays are written to a new version subdirectory that is then published atomically (see
+    publish_version), so a process loading concurrently never pairs arrays of different matrices.
+
+    Returns:
+        None
+    """
+    matrix = csr_matrix(matrix)
+    name, path = new_version_dir(directory)
+    for array_name, array in (('data', matrix.data), ('indices', matrix.indices), ('indptr', matrix.indptr),
+                              ('shape', np.array(matrix.shape, dtype=np.int64))):
+        np.save(os.path.join(path, f"{array_name}.npy"), array)
+    publish_version(directory, name)
+    logger.info(f"CSR matrix saved to: {path}")
+
+
+def load_csr_matrix(directory, mmap_mode='r'):
+    """
+    Loads the current CSR matrix saved by save_csr_matrix.
+    By default its arrays are memory-mapped read-only, so worker processes share one
+    page-cache copy and loading time does not depend on the matrix size.
+
+    Returns:
+        csr_matrix or None: Loaded matrix if all files exist and are valid; otherwise None.
+    """
+    version = read_version(directory)
+    if version is None:
+        logger.warning(f"No CSR matrix published in '{directory}'.")
+        return None
+    path = os.path.join(directory, version['version'])
+    arrays = {}
+    for name in ('data', 'indices', 'indptr', 'shape'):
+        array = load_array(os.path.join(path, f"{name}.npy"), mmap_mode=None if name == 'shape' else mmap_mode)
+        if array is None:
+            return None
+        arrays[name] = array
+    try:
+        return csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                          shape=tuple(int(n) for n in arrays['shape']), copy=False)
+    except Exception as e:
+        logger.error(f"Failed to assemble CSR matrix from '{path}': {e}")
+        return None
+
+
+def to_dense(matrix):
+    """
+    Returns a sparse or dense matrix product as a dense NumPy array.
+
+    Returns:
+        np.ndarray: Dense array (the input itself when it is already dense).
+    """
+    return matrix.toarray() if issparse(matrix) else np.asarray(matrix)
+
+
+def save_vocabulary(vocabulary, filename):
+    """
+    Saves a token -> column vocabulary as JSON.
+
+    Returns:
+        None
+    """
+    try:
+        tmp_filename = f"{filename}.tmp"
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            json.dump({token: int(column) for token, column in vocabulary.items()}, f)
+        os.replace(tmp_filename, filename)
+        logger.info(f"Vocabulary saved to: {filename}")
+    except Exception as e:
+        logger.error(f"Failed to save vocabulary to '{filename}': {e}")
+
+
+def load_vocabulary(filename):
+    """
+    Loads a token -> column vocabulary saved by save_vocabulary.
+
+    Returns:
+        dict or None: Vocabulary if the file exists and is valid; otherwise None.
+    """
+    if not os.path.exists(filename):
+        logger.warning(f"Vocabulary file '{filename}' not found.")
+        return None
+    try:
+        with open(filename, encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"Failed to load vocabulary from '{filename}': {e}")
+        return None
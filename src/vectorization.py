@@ -0,0 +1,325 @@
+import numpy as np
+from scipy.sparse import csr_matrix, diags, vstack
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.preprocessing import normalize
+from config import VECTORIZER_SCHEME, FIELD_WEIGHTS, BM25_PARAMS, HASH_BUCKETS
+from logging_config import setup_logging
+
+logger = setup_logging()
+
+WEIGHTING_SCHEMES = ('count', 'tfidf', 'bm25')
+
+
+def field_tokens(values, field):
+    """
+    Turns one cleaned feature column (lists of names, or director strings) into field-prefixed tokens.
+
+    Every cleaned name is one token, used as is: there is no re-tokenization or stop-word removal,
+    so a director named 'the' is kept, and 'keywords:toy' and 'cast:toy' stay distinct.
+
+    Args:
+        values (iterable): Cleaned values of the column, one per movie.
+        field (str): Column name used as the token prefix.
+
+    Returns:
+        list[list[str]]: Tokens per movie (empty for missing values).
+    """
+    prefix = f'{field}:'
+    return [[prefix + name for name in value if name] if isinstance(value, list)
+            else [prefix + value] if isinstance(value, str) and value else []
+            for value in values]
+
+
+class IncrementalVocabulary:
+    """
+    Vectorizes movies chunk by chunk while growing the vocabulary.
+
+    Tokens (see field_tokens) get a column id the first time they are seen. finalize() reorders the
+    columns alphabetically, so the stacked shards do not depend on the chunking. Starting from a
+    saved vocabulary, transform() vectorizes new movies against it and appends columns for unseen tokens.
+    """
+
+    def __init__(self, vocabulary=None):
+        self.vocabulary = dict(vocabulary) if vocabulary else {}
+        self.shards = []
+
+    @property
+    def n_columns(self):
+        return len(self.vocabulary)
+
+    def add_chunk(self, movies, field_weights=FIELD_WEIGHTS):
+        """
+        Counts the weighted field tokens of one chunk of movies and stores them as a CSR shard.
+
+        Args:
+            movies (pd.DataFrame): Chunk with cleaned 'keywords', 'cast', 'director' and 'genres' columns.
+            field_weights (dict): Field -> weight of its token counts.
+
+        Returns:
+            None
+        """
+        self.shards.append(self.transform_fields(movies, field_weights))
+
+    def transform(self, token_lists):
+        """
+        Counts pre-tokenized movies, adding unseen tokens to the vocabulary.
+
+        Args:
+            token_lists (list[list[str]]): Tokens per movie.
+
+        Returns:
+            csr_matrix: Counts of shape (n_movies, vocabulary size after this call).
+        """
+        vocabulary = self.vocabulary
+        columns = [vocabulary.setdefault(token, len(vocabulary)) for tokens in token_lists for token in tokens]
+        rows = np.repeat(np.arange(len(token_lists)), [len(tokens) for tokens in token_lists])
+
+        counts = csr_matrix((np.ones(len(columns), dtype=np.float32), (rows, columns)),
+                            shape=(len(token_lists), len(vocabulary)))
+        counts.sum_duplicates()
+        return counts
+
+    def transform_fields(self, movies, field_weights=FIELD_WEIGHTS):
+        """
+        Counts every feature field separately and sums the counts scaled by the field weights.
+
+        Args:
+            movies (pd.DataFrame): Movies with cleaned 'keywords', 'cast', 'director' and 'genres' columns.
+            field_weights (dict): Field -> weight of its token counts (0 leaves the field out).
+
+        Returns:
+            csr_matrix: Weighted float32 counts of shape (n_movies, vocabulary size after this call).
+        """
+        parts = [(weight, self.transform(field_tokens(movies[field], field)))
+                 for field, weight in field_weights.items() if weight]
+        n_columns = len(self.vocabulary)
+        counts = csr_matrix((len(movies), n_columns), dtype=np.float32)
+        for weight, part in parts:
+            counts = counts + weight * csr_matrix((part.data, part.indices, part.indptr), shape=counts.shape)
+        return csr_matrix(counts, dtype=np.float32)
+
+    def finalize(self):
+        """
+        Stacks the shards into one matrix with alphabetically ordered columns.
+
+        Returns:
+            tuple: (count_matrix, vocabulary) where vocabulary maps token -> column.
+        """
+        n_columns = len(self.vocabulary)
+        shards = [csr_matrix((shard.data, shard.indices, shard.indptr), shape=(shard.shape[0], n_columns))
+                  for shard in self.shards]
+        matrix = vstack(shards, format='csr') if shards else csr_matrix((0, n_columns), dtype=np.float32)
+
+        tokens = sorted(self.vocabulary)
+        new_columns = np.empty(n_columns, dtype=np.int32)
+        new_columns[[self.vocabulary[token] for token in tokens]] = np.arange(n_columns, dtype=np.int32)
+        matrix.indices = new_columns[matrix.indices]
+        matrix.has_sorted_indices = False
+        matrix.sort_indices()
+        return matrix, {token: column for column, token in enumerate(tokens)}
+
+
+class HashedVocabulary:
+    """
+    Vectorizes movies into a fixed number of hashed columns, without a vocabulary.
+
+    Every field-prefixed token (see field_tokens) is mapped to a column by MurmurHash3, so the
+    matrix width never grows. Nothing is learned: new movies, including unseen tokens, are vectorized with no
+    state beyond the bucket count. Colliding tokens share a column.
+
+    Args:
+        n_buckets (int): Number of columns.
+    """
+
+    def __init__(self, n_buckets=HASH_BUCKETS):
+        self.n_buckets = n_buckets
+        self.hasher = FeatureHasher(n_features=n_buckets, input_type='string', alternate_sign=False,
+                                    dtype=np.float32)
+        self.vocabulary = {}
+        self.shards = []
+
+    @property
+    def n_columns(self):
+        return self.n_buckets
+
+    def add_chunk(self, movies, field_weights=FIELD_WEIGHTS):
+        """
+        Hashes the weighted field tokens of one chunk of movies and stores them as a CSR shard.
+
+        Returns:
+            None
+        """
+        self.shards.append(self.transform_fields(movies, field_weights))
+
+    def transform_fields(self, movies, field_weights=FIELD_WEIGHTS):
+        """
+        Hashes the tokens of every feature field and sums the counts scaled by the field weights.
+
+        Args:
+            movies (pd.DataFrame): Movies with cleaned 'keywords', 'cast', 'director' and 'genres' columns.
+            field_weights (dict): Field -> weight of its token counts (0 leaves the field out).
+
+        Returns:
+            csr_matrix: Weighted float32 counts of shape (n_movies, n_buckets).
+        """
+        counts = csr_matrix((len(movies), self.n_buckets), dtype=np.float32)
+        for field, weight in field_weights.items():
+            if weight and len(movies):
+                counts = counts + weight * self.hasher.transform(field_tokens(movies[field], field))
+        return csr_matrix(counts, dtype=np.float32)
+
+    def finalize(self):
+        """
+        Stacks the shards into one matrix.
+
+        Returns:
+            tuple: (count_matrix, empty vocabulary dict).
+        """
+        matrix = (vstack(self.shards, format='csr') if self.shards
+                  else csr_matrix((0, self.n_buckets), dtype=np.float32))
+        return matrix, {}
+
+
+def create_vocabulary(vocabulary=None, hash_buckets=HASH_BUCKETS):
+    """
+    Creates the vectorizer matching the configuration.
+
+    Args:
+        vocabulary (dict, optional): Saved token -> column vocabulary to extend (ignored when hashing).
+        hash_buckets (int, optional): Number of hashed columns; None keeps a vocabulary.
+
+    Returns:
+        IncrementalVocabulary or HashedVocabulary: Vectorizer with add_chunk/transform_fields/finalize.
+    """
+    if hash_buckets:
+        return HashedVocabulary(hash_buckets)
+    return IncrementalVocabulary(vocabulary)
+
+
+class FeatureWeighting:
+    """
+    Term weighting of the (field-weighted) token counts, fitted once on the whole catalog.
+
+    Schemes:
+        - 'count': raw counts;
+        - 'tfidf': counts x smoothed idf, ln((1 + n) / (1 + df)) + 1 (as sklearn's TfidfTransformer);
+        - 'bm25': saturated counts tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length)) x
+                  ln(1 + (n - df + 0.5) / (df + 0.5)).
+
+    Rows are then L2-normalized to float32, so cosine similarity becomes a plain dot product.
+    Columns added after fitting (tokens unseen at build time) get the idf of a token seen once, via
+    extend.
+
+    Args:
+        scheme (str): One of WEIGHTING_SCHEMES.
+        field_weights (dict): Field weights the counts were built with (kept for later updates).
+        k1 (float): BM25 term frequency saturation.
+        b (float): BM25 document length normalization.
+    """
+
+    def __init__(self, scheme=VECTORIZER_SCHEME, field_weights=None, k1=BM25_PARAMS['k1'], b=BM25_PARAMS['b']):
+        if scheme not in WEIGHTING_SCHEMES:
+            raise ValueError(f"Unknown weighting scheme '{scheme}'. Expected one of: {', '.join(WEIGHTING_SCHEMES)}.")
+        self.scheme = scheme
+        self.field_weights = dict(field_weights if field_weights is not None else FIELD_WEIGHTS)
+        self.k1 = k1
+        self.b = b
+
+    def _idf(self, document_frequency):
+        """
+        Returns:
+            np.ndarray: float32 idf per column for the fitted number of movies.
+        """
+        n = self.n_movies_
+        if self.scheme == 'tfidf':
+            return (np.log((1.0 + n) / (1.0 + document_frequency)) + 1.0).astype(np.float32)
+        if self.scheme == 'bm25':
+            return np.log1p((n - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        return np.ones(len(document_frequency), dtype=np.float32)
+
+    def fit(self, counts):
+        """
+        Learns the idf of every column and the average movie length.
+
+        Args:
+            counts (csr_matrix): Weighted counts of the whole catalog.
+
+        Returns:
+            FeatureWeighting: The fitted weighting.
+        """
+        counts = csr_matrix(counts)
+        self.n_movies_ = counts.shape[0]
+        self.idf_ = self._idf(np.bincount(counts.indices, minlength=counts.shape[1]).astype(np.float64))
+        self.avg_length_ = float(counts.sum() / max(counts.shape[0], 1)) or 1.0
+        return self
+
+    def extend(self, n_columns):
+        """
+        Gives the columns appended since fitting (tokens unseen at build time) the idf of a token seen once.
+
+        Args:
+            n_columns (int): Number of columns of the extended vocabulary.
+
+        Returns:
+            FeatureWeighting: The extended weighting.
+        """
+        if n_columns > len(self.idf_):
+            self.idf_ = np.concatenate([self.idf_, self._idf(np.ones(n_columns - len(self.idf_)))])
+        return self
+
+    def transform(self, counts):
+        """
+        Weights and L2-normalizes counts.
+
+        Args:
+            counts (csr_matrix): Weighted counts over the fitted (or extended) columns.
+
+        Returns:
+            csr_matrix: float32 matrix with unit-length rows (empty movies stay all zeros).
+
+        Raises:
+            ValueError: If counts have more columns than the weighting covers (see extend).
+        """
+        if counts.shape[1] > len(self.idf_):
+            raise ValueError(f"Counts have {counts.shape[1]} columns but the weighting covers {len(self.idf_)}; "
+                             f"extend it first.")
+        counts = csr_matrix(counts, dtype=np.float32, copy=True)
+
+        if self.scheme == 'bm25':
+            lengths = np.asarray(counts.sum(axis=1), dtype=np.float32).ravel()
+            norms = self.k1 * (1.0 - self.b + self.b * lengths / self.avg_length_)
+            tf = counts.data
+            counts.data = tf * (self.k1 + 1.0) / (tf + np.repeat(norms, np.diff(counts.indptr)))
+        if self.scheme != 'count':
+            counts = counts @ diags(self.idf_[:counts.shape[1]])
+        return normalize(counts, norm='l2', axis=1).astype(np.float32).tocsr()
+
+    def fit_transform(self, counts):
+        """
+        Fits the weighting on counts and transforms them.
+
+        Returns:
+            csr_matrix: float32 matrix with unit-length rows.
+        """
+        return self.fit(counts).transform(counts)
+
+
+def build_feature_matrix(movies, scheme=VECTORIZER_SCHEME, field_weights=FIELD_WEIGHTS):
+    """
+    Vectorizes the cleaned features of the whole catalog into the weighted, normalized feature matrix.
+
+    Args:
+        movies (pd.DataFrame): Movies with cleaned 'keywords', 'cast', 'director' and 'genres' columns.
+        scheme (str): Term weighting, one of WEIGHTING_SCHEMES.
+        field_weights (dict): Field -> weight of its token counts.
+
+    Returns:
+        tuple: (feature matrix csr_matrix, vocabulary dict, fitted FeatureWeighting).
+    """
+    vocabulary = create_vocabulary()
+    vocabulary.add_chunk(movies, field_weights)
+    counts, vocab = vocabulary.finalize()
+    weighting = FeatureWeighting(scheme, field_weights)
+    matrix = weighting.fit_transform(counts)
+    logger.info(f"Feature matrix built: {matrix.shape} ({scheme}), {matrix.nnz} non-zeros.")
+    return matrix, vocab, weighting